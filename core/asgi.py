@@ -0,0 +1,42 @@
+import asyncio
+
+
+class DisconnectMiddleware:
+    """
+    ASGI middleware noticing when an HTTP client goes away.
+
+    Django 4.2 stops reading from the connection once the request body is
+    in, so an endless streaming response (like the map's live events) never
+    learns that its client left. This keeps listening and sets the
+    asyncio.Event found in request.scope['disconnected'].
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        disconnected = asyncio.Event()
+        watcher = None
+
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        async def receive_body():
+            nonlocal watcher
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+            elif not message.get('more_body') and watcher is None:
+                # The body is complete and Django won't call receive() again
+                watcher = asyncio.create_task(watch())
+            return message
+
+        try:
+            await self.app({**scope, 'disconnected': disconnected}, receive_body, send)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
@@ -0,0 +1,19 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+
+
+def async_login_required(view):
+    """
+    login_required for async views.
+
+    Django 4.2's login_required only wraps sync views. request.user is
+    loaded lazily with a database query, so it is resolved in a thread.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if await sync_to_async(lambda: request.user.is_authenticated)():
+            return await view(request, *args, **kwargs)
+        return redirect_to_login(request.get_full_path())
+    return wrapper
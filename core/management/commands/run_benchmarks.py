@@ -0,0 +1,209 @@
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from maps.models import PollutedArea, PollutionReport
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Requests per endpoint made under tracemalloc, which slows them down too much to time
+MEMORY_SAMPLES = 5
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the main pages and APIs with the test client and save the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to browse as (default: the user owning the most areas)')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per endpoint first')
+        parser.add_argument('--seed', type=int, default=42, help='Seed picking the areas and viewports requested')
+        parser.add_argument('--uncached', action='store_true',
+                            help='Make every areas API URL unique so its response cache is never hit')
+        parser.add_argument('--output', help='JSON results file (default: benchmarks/<timestamp>.json)')
+        parser.add_argument('--compare', help='Earlier results file to compare against')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['warmup'] < 0:
+            raise CommandError('--requests must be at least 1 and --warmup not negative')
+        user = self._user(options['user'])
+        rng = np.random.default_rng(options['seed'])
+        self.uncached = options['uncached']
+        client = Client()
+        client.force_login(user)
+
+        results = {}
+        self.stdout.write(
+            f"{'endpoint':<24} {'p50 ms':>8} {'p90 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'queries':>8} {'peak KiB':>9} {'KiB':>8}"
+        )
+        # The test client sends Host: testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, urls in self._endpoints(user, rng, options['requests'] + options['warmup']).items():
+                results[name] = self._measure(client, urls, options['warmup'])
+                self._print_row(name, results[name])
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'users': get_user_model().objects.count(),
+                'areas': PollutedArea.objects.count(),
+                'active_areas': PollutedArea.objects.filter(is_active=True).count(),
+                'reports': PollutionReport.objects.count(),
+            },
+            'options': {key: options[key] for key in ('requests', 'warmup', 'seed', 'uncached')},
+            'user': user.get_username(),
+            'endpoints': results,
+        }
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"{timezone.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as target:
+            json.dump(report, target, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+        if options['compare']:
+            self._compare(options['compare'], report)
+
+    def _user(self, username):
+        User = get_user_model()
+        if username:
+            try:
+                return User.objects.get(**{User.USERNAME_FIELD: username})
+            except User.DoesNotExist:
+                raise CommandError(f'Unknown user: {username}')
+        # The heaviest contributor has the largest dashboard lists
+        user = User.objects.annotate(areas=Count('polluted_areas')).order_by('-areas', 'pk').first()
+        if user is None:
+            raise CommandError('No users; run seed_benchmark_data first')
+        return user
+
+    def _endpoints(self, user, rng, count):
+        """{name: list of `count` URLs}, with areas and viewports drawn from the data"""
+        areas = list(PollutedArea.objects.filter(is_active=True).values_list('pk', 'latitude', 'longitude')[:5000])
+        if not areas:
+            raise CommandError('No active areas; run seed_benchmark_data first')
+        picks = [areas[i] for i in rng.integers(len(areas), size=count)]
+
+        def viewport(lat, lng, half_width):
+            return f'{lng - half_width:.5f},{lat - half_width / 2:.5f},{lng + half_width:.5f},{lat + half_width / 2:.5f}'
+
+        areas_json = reverse('maps:areas_json')
+        return {
+            'areas_json (z6)': [
+                self._bust(f'{areas_json}?bbox={viewport(lat, lng, 12)}&zoom=6', n) for n, (_, lat, lng) in enumerate(picks)
+            ],
+            'areas_json (z14)': [
+                self._bust(f'{areas_json}?bbox={viewport(lat, lng, 0.04)}&zoom=14', n)
+                for n, (_, lat, lng) in enumerate(picks)
+            ],
+            'map': [reverse('maps:map')] * count,
+            'area_detail': [reverse('maps:area_detail', args=[pk]) for pk, _, _ in picks],
+            'dashboard_home': [reverse('dashboard:home')] * count,
+            'my_areas': [reverse('dashboard:my_areas')] * count,
+            'my_reports': [reverse('dashboard:my_reports')] * count,
+        }
+
+    def _bust(self, url, number):
+        return f'{url}&_bench={time.time_ns()}-{number}' if self.uncached else url
+
+    def _get(self, client, url):
+        response = client.get(url)
+        size = len(b''.join(response.streaming_content) if response.streaming else response.content)
+        if response.status_code >= 400:
+            raise CommandError(f'{url} returned {response.status_code}')
+        return size
+
+    def _measure(self, client, urls, warmup):
+        for url in urls[:warmup]:
+            self._get(client, url)
+
+        latencies, queries, sizes = [], [], []
+        for url in urls[warmup:]:
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                sizes.append(self._get(client, url))
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured.captured_queries))
+
+        peaks = []
+        tracemalloc.start()
+        try:
+            for url in urls[warmup:warmup + MEMORY_SAMPLES]:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                self._get(client, url)
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'requests': len(latencies),
+            'latency_ms': {
+                **{f'p{p}': round(float(np.percentile(latencies, p)), 2) for p in PERCENTILES},
+                'mean': round(float(np.mean(latencies)), 2),
+                'max': round(max(latencies), 2),
+            },
+            'queries': {'mean': round(float(np.mean(queries)), 1), 'max': max(queries)},
+            'peak_memory_kib': round(max(peaks) / 1024, 1),
+            'response_kib': round(float(np.mean(sizes)) / 1024, 1),
+        }
+
+    def _print_row(self, name, result):
+        latency = result['latency_ms']
+        self.stdout.write(
+            f"{name:<24} {latency['p50']:>8.1f} {latency['p90']:>8.1f} {latency['p95']:>8.1f} {latency['p99']:>8.1f} "
+            f"{result['queries']['mean']:>8.1f} {result['peak_memory_kib']:>9.1f} {result['response_kib']:>8.1f}"
+        )
+
+    def _compare(self, path, report):
+        try:
+            with open(path) as source:
+                baseline = json.load(source)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+        self.stdout.write(f"\nCompared with {path} ({baseline.get('revision') or 'unknown revision'}):")
+        self.stdout.write(f"{'endpoint':<24} {'p50':>16} {'p95':>16} {'queries':>14} {'peak KiB':>18}")
+        for name, result in report['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(name)
+            if before is None:
+                self.stdout.write(f'{name:<24} (new)')
+                continue
+            self.stdout.write(
+                f'{name:<24} '
+                f"{self._delta(before['latency_ms']['p50'], result['latency_ms']['p50']):>16} "
+                f"{self._delta(before['latency_ms']['p95'], result['latency_ms']['p95']):>16} "
+                f"{self._delta(before['queries']['mean'], result['queries']['mean']):>14} "
+                f"{self._delta(before['peak_memory_kib'], result['peak_memory_kib']):>18}"
+            )
+
+    def _delta(self, before, after):
+        change = f'{(after - before) / before * 100:+.0f}%' if before else 'n/a'
+        return f'{after:g} ({change})'
@@ -0,0 +1,261 @@
+import math
+import multiprocessing
+from datetime import timedelta
+
+import django
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from maps import search, sync
+from maps.models import ChangeSequence, PollutedArea, PollutionReport
+from maps.signals import areas_bulk_changed
+
+# (latitude, longitude, name) of the cities areas cluster around
+CITIES = [
+    (35.6892, 51.3890, 'Tehran'),
+    (32.6546, 51.6680, 'Isfahan'),
+    (36.2605, 59.6168, 'Mashhad'),
+    (29.5918, 52.5837, 'Shiraz'),
+    (38.0800, 46.2919, 'Tabriz'),
+    (31.3183, 48.6706, 'Ahvaz'),
+    (40.7128, -74.0060, 'New York'),
+    (34.0522, -118.2437, 'Los Angeles'),
+    (19.4326, -99.1332, 'Mexico City'),
+    (-23.5505, -46.6333, 'Sao Paulo'),
+    (51.5074, -0.1278, 'London'),
+    (48.8566, 2.3522, 'Paris'),
+    (30.0444, 31.2357, 'Cairo'),
+    (6.5244, 3.3792, 'Lagos'),
+    (28.6139, 77.2090, 'Delhi'),
+    (39.9042, 116.4074, 'Beijing'),
+    (-6.2088, 106.8456, 'Jakarta'),
+    (-33.8688, 151.2093, 'Sydney'),
+]
+
+POLLUTION_TYPES = ['air', 'water', 'soil', 'noise', 'light', 'other']
+POLLUTION_TYPE_WEIGHTS = [0.35, 0.25, 0.15, 0.12, 0.05, 0.08]
+SEVERITY_WEIGHTS = [0.3, 0.3, 0.2, 0.13, 0.07]
+
+SOURCES = {
+    'air': ['Factory emissions', 'Traffic smog', 'Waste burning', 'Dust storm', 'Power plant plume'],
+    'water': ['Sewage outflow', 'Oil slick', 'Industrial discharge', 'Algae bloom', 'Chemical runoff'],
+    'soil': ['Illegal dumping', 'Pesticide contamination', 'Landfill leak', 'Mining tailings', 'Fuel spill'],
+    'noise': ['Construction noise', 'Highway noise', 'Nightclub noise', 'Airport noise', 'Generator noise'],
+    'light': ['Billboard glare', 'Stadium lights', 'Greenhouse glow', 'Street light glare', 'Refinery flare'],
+    'other': ['Abandoned vehicles', 'Asbestos debris', 'Medical waste', 'Odor nuisance', 'Radiation hazard'],
+}
+PLACES = ['North', 'South', 'East', 'West', 'Central', 'Old Town', 'Riverside', 'Industrial Zone', 'Harbor', 'Airport']
+REPORT_TITLES = ['Still ongoing', 'Getting worse', 'Smell reported', 'Seen again today', 'Cleanup started',
+                 'Residents complaining', 'Photos from the site', 'Water looks discolored', 'Heavy smoke at night']
+REPORT_STATUSES = ['pending', 'verified', 'rejected', 'resolved']
+REPORT_STATUS_WEIGHTS = [0.5, 0.3, 0.05, 0.15]
+
+POLYGON_SHARE = 0.6
+BACKGROUND_SHARE = 0.1
+HISTORY_DAYS = 730
+METERS_PER_DEGREE = 111_320.0
+
+
+def _cities(seed):
+    """Per-city spread (degrees) and popularity, fixed by the seed"""
+    rng = np.random.default_rng([seed, 0])
+    spread = rng.uniform(0.03, 0.35, len(CITIES))
+    popularity = 1.0 / np.arange(1, len(CITIES) + 1) ** 0.8
+    popularity = popularity[rng.permutation(len(CITIES))]
+    return spread, popularity / popularity.sum()
+
+
+def _polygon(rng, lat, lng):
+    """Star-shaped ring of 3 to ~400 vertices, 30 m to 3 km across"""
+    vertices = int(np.clip(rng.lognormal(2.8, 0.9), 3, 400))
+    radius = float(np.clip(rng.lognormal(math.log(300), 0.8), 30, 3000)) / METERS_PER_DEGREE
+    angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+    radii = radius * rng.uniform(0.6, 1.0, vertices)
+    lats = np.clip(lat + radii * np.sin(angles), -85, 85)
+    lngs = lng + radii * np.cos(angles) / max(math.cos(math.radians(lat)), 0.05)
+    return [[round(float(a), 6), round(float(b), 6)] for a, b in zip(lats, lngs) if -180 <= b <= 180]
+
+
+def _generate_batch(task):
+    """Worker: field values of one batch of areas, deterministic from (seed, batch number)"""
+    seed, number, size, owners, now = task
+    rng = np.random.default_rng([seed, 1, number])
+    spread, popularity = _cities(seed)
+    rows = []
+    for _ in range(size):
+        city = rng.choice(len(CITIES), p=popularity)
+        city_lat, city_lng, city_name = CITIES[city]
+        scale = spread[city] * (20 if rng.random() < BACKGROUND_SHARE else 1)
+        lat = float(np.clip(city_lat + rng.normal(0, scale), -85, 85))
+        lng = float(np.clip(city_lng + rng.normal(0, scale / max(math.cos(math.radians(city_lat)), 0.05)), -180, 180))
+        pollution_type = POLLUTION_TYPES[rng.choice(len(POLLUTION_TYPES), p=POLLUTION_TYPE_WEIGHTS)]
+        source = SOURCES[pollution_type][rng.integers(len(SOURCES[pollution_type]))]
+        place = PLACES[rng.integers(len(PLACES))]
+        area = PollutedArea(
+            name=f'{source} - {city_name} {place}',
+            description=f'{source} reported in {place.lower()} {city_name}. Observed by local residents.',
+            pollution_type=pollution_type,
+            severity=int(rng.choice(5, p=SEVERITY_WEIGHTS)) + 1,
+            latitude=lat,
+            longitude=lng,
+            area_size=float(rng.lognormal(8, 1.5)),
+            is_active=bool(rng.random() > 0.03),
+        )
+        if rng.random() < POLYGON_SHARE:
+            coordinates = _polygon(rng, lat, lng)
+            if len(coordinates) >= 3:
+                area.set_polygon_coordinates(coordinates)
+        area.update_measurements()
+        area.update_bounds()
+        values = {field.attname: getattr(area, field.attname) for field in PollutedArea._meta.concrete_fields}
+        values.pop('id')
+        values['created_by_id'] = int(owners[rng.integers(len(owners))])
+        values['created_at'] = now - timedelta(seconds=float(rng.uniform(0, HISTORY_DAYS * 86400)))
+        values['updated_at'] = values['created_at']
+        rows.append(values)
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic dataset of users, areas and reports for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--areas', type=int, default=10000, help='Number of areas to generate')
+        parser.add_argument('--users', type=int, help='Number of users (default: one per 20 areas)')
+        parser.add_argument('--reports-per-area', type=float, default=1.5, help='Mean number of reports per area')
+        parser.add_argument('--seed', type=int, default=42, help='Seed; the same seed generates the same data')
+        parser.add_argument('--prefix', default='bench', help='Username prefix of the generated users')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Areas generated per worker task and insert')
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='Number of generating processes (1 disables multiprocessing)')
+
+    def handle(self, *args, **options):
+        seed, prefix = options['seed'], options['prefix']
+        area_count = options['areas']
+        user_count = options['users'] or max(1, area_count // 20)
+        if area_count < 1 or user_count < 1 or options['batch_size'] < 1:
+            raise CommandError('--areas, --users and --batch-size must be at least 1')
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f'Users prefixed "{prefix}" already exist; use another --prefix or a fresh database')
+
+        # History runs back from the start of today, so runs on the same day are identical
+        options['now'] = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        since = ChangeSequence.current(ChangeSequence.AREAS)
+        user_ids = self._create_users(prefix, user_count)
+        owners = self._owner_sample(seed, user_ids)
+        area_ids = self._create_areas(seed, area_count, owners, options)
+        report_count = self._create_reports(seed, area_ids, user_ids, options)
+
+        # Bulk inserts send no per-row signals: rebuild clusters, caches, statistics and search
+        with transaction.atomic():
+            areas_bulk_changed.send(sender=PollutedArea, since=since)
+        search.populate(search.get_index(), reports=PollutionReport.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {user_count} users, {len(area_ids)} areas and {report_count} reports (seed {seed}).'
+        ))
+
+    def _create_users(self, prefix, count):
+        # One unusable password hash for all: benchmarks log in with force_login
+        password = make_password(None)
+        users = [
+            User(username=f'{prefix}{number:07d}', email=f'{prefix}{number:07d}@example.com', password=password)
+            for number in range(count)
+        ]
+        User.objects.bulk_create(users, batch_size=2000)
+        ids = list(User.objects.filter(username__startswith=prefix).order_by('username').values_list('pk', flat=True))
+        self.stdout.write(f'{len(ids)} users created')
+        return ids
+
+    def _owner_sample(self, seed, user_ids):
+        """
+        Skewed ownership: owners drawn by a Zipf-like weight, so a few
+        heavy contributors own most areas. Returned as a sample of 100000
+        owner ids the workers pick from uniformly.
+        """
+        rng = np.random.default_rng([seed, 2])
+        weights = 1.0 / np.arange(1, len(user_ids) + 1) ** 1.1
+        return np.asarray(user_ids)[rng.choice(len(user_ids), size=100000, p=weights / weights.sum())]
+
+    def _create_areas(self, seed, count, owners, options):
+        batch_size = options['batch_size']
+        tasks = [
+            (seed, number, min(batch_size, count - start), owners, options['now'])
+            for number, start in enumerate(range(0, count, batch_size))
+        ]
+        connections.close_all()
+        if options['processes'] > 1:
+            # Spawned workers import this module, models included, before generating anything
+            pool = multiprocessing.Pool(options['processes'], initializer=django.setup)
+            results = pool.imap(_generate_batch, tasks)
+        else:
+            pool = None
+            results = map(_generate_batch, tasks)
+
+        ids = []
+        try:
+            for rows in results:
+                areas = [PollutedArea(**values) for values in rows]
+                with transaction.atomic():
+                    sync.stamp(areas)
+                    PollutedArea.objects.bulk_create(areas)
+                    # bulk_create stamps the auto_now(_add) fields with the current time; restore the generated history
+                    for area, values in zip(areas, rows):
+                        area.created_at = area.updated_at = values['created_at']
+                    PollutedArea.objects.bulk_update(areas, ['created_at', 'updated_at'], batch_size=500)
+                ids.extend((area.pk, area.created_at, area.severity) for area in areas)
+                self.stdout.write(f'{len(ids)}/{count} areas created')
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return ids
+
+    def _create_reports(self, seed, areas, user_ids, options):
+        """A Poisson number of reports per area, more for severe areas, by skewed reporters"""
+        rng = np.random.default_rng([seed, 3])
+        weights = 1.0 / np.arange(1, len(user_ids) + 1) ** 0.9
+        weights = weights[rng.permutation(len(user_ids))]
+        reporters = np.asarray(user_ids)
+        total = 0
+        for start in range(0, len(areas), options['batch_size']):
+            batch = areas[start:start + options['batch_size']]
+            severities = np.array([severity for _, _, severity in batch])
+            counts = rng.poisson(options['reports_per_area'] * (0.5 + severities / 5))
+            size = int(counts.sum())
+            reporter_ids = reporters[rng.choice(len(reporters), size=size, p=weights / weights.sum())]
+            statuses = rng.choice(len(REPORT_STATUSES), size=size, p=REPORT_STATUS_WEIGHTS)
+            titles = rng.integers(len(REPORT_TITLES), size=size)
+            offsets = rng.random(size)
+            review_hours = rng.uniform(1, 72, size)
+
+            reports = []
+            for (area_id, created_at, _), count in zip(batch, counts):
+                for _ in range(count):
+                    i = len(reports)
+                    status = REPORT_STATUSES[statuses[i]]
+                    reported_at = created_at + (options['now'] - created_at) * float(offsets[i])
+                    verified = status in ('verified', 'resolved')
+                    reports.append(PollutionReport(
+                        polluted_area_id=area_id,
+                        reporter_id=int(reporter_ids[i]),
+                        title=REPORT_TITLES[titles[i]],
+                        description='Reported during a routine check of the area.',
+                        status=status,
+                        created_at=reported_at,
+                        updated_at=reported_at,
+                        verified_by_id=int(user_ids[0]) if verified else None,
+                        verified_at=min(options['now'], reported_at + timedelta(hours=float(review_hours[i]))) if verified else None,
+                    ))
+            created = [report.created_at for report in reports]
+            with transaction.atomic():
+                PollutionReport.objects.bulk_create(reports)
+                for report, created_at in zip(reports, created):
+                    report.created_at = report.updated_at = created_at
+                PollutionReport.objects.bulk_update(reports, ['created_at', 'updated_at'], batch_size=500)
+            total += len(reports)
+            self.stdout.write(f'{total} reports created')
+        return total
@@ -0,0 +1,294 @@
+"""
+Request middleware: the session's language and performance instrumentation.
+
+SessionLocaleMiddleware activates the language chosen with core:set_language
+once per request, before the view runs.
+
+PerformanceMiddleware (enabled with PERFORMANCE_INSTRUMENTATION) measures
+each request's total and view time, the number and total time of its SQL
+queries, repeated queries and template render time. The figures are sent
+in a Server-Timing header, which browser dev tools show next to the
+request, and logged on the `core.performance` logger as one key=value line
+per request (with the figures also in the record's `performance` extra).
+A streamed response's body runs its queries after the headers are sent,
+so its header is marked `streamed` and only covers the view, while the
+log line is written once the body is sent and covers all of it.
+Requests slower than PERFORMANCE_SLOW_REQUEST_MS or repeating a query
+PERFORMANCE_DUPLICATE_THRESHOLD times are logged as warnings, with the most
+repeated queries.
+
+With PERFORMANCE_PROFILE_DIR set, a PERFORMANCE_PROFILE_SAMPLE_RATE share
+of requests runs under cProfile and the profiles of the slow ones are
+written there as .prof files (open with pstats or snakeviz).
+
+Queries are recorded by a database execute wrapper installed on every
+connection, and templates by wrapping the Django template backend's
+render; both attribute their timings to the request through a context
+variable, so queries run by async views through sync_to_async count too.
+"""
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.locale import LocaleMiddleware
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template as BackendTemplate
+from django.utils import translation
+
+logger = logging.getLogger('core.performance')
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+# Repeated queries listed in a warning
+MAX_REPORTED_QUERIES = 3
+
+# Profilers hook the thread they are enabled on, which async requests share
+_profiling = threading.Lock()
+
+
+# Session key set by core.views.set_language
+LANGUAGE_SESSION_KEY = 'django_language'
+
+
+class SessionLocaleMiddleware(LocaleMiddleware):
+    """LocaleMiddleware preferring the language stored in the session, if any"""
+
+    def process_request(self, request):
+        language = request.session.get(LANGUAGE_SESSION_KEY)
+        if language in dict(settings.LANGUAGES):
+            translation.activate(language)
+            request.LANGUAGE_CODE = translation.get_language()
+        else:
+            super().process_request(request)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.queries = Counter()
+        self.statements = Counter()
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicate_count(self):
+        """Queries that repeated an earlier one exactly, parameters included"""
+        return sum(count - 1 for count in self.queries.values())
+
+    def record_query(self, sql, params, duration):
+        self.sql_time += duration
+        self.queries[sql, repr(params)] += 1
+        self.statements[sql] += 1
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper timing a query for the current request, if any"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, params, time.perf_counter() - started)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+_backend_render = BackendTemplate.render
+
+
+def _timed_render(self, context=None, request=None):
+    metrics = _current.get()
+    if metrics is None:
+        return _backend_render(self, context, request)
+    # Only the outermost render is timed; included templates are part of it
+    metrics.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _backend_render(self, context, request)
+    finally:
+        metrics.template_depth -= 1
+        if not metrics.template_depth:
+            metrics.template_time += time.perf_counter() - started
+
+
+def _slug(path):
+    return re.sub(r'[^A-Za-z0-9]+', '-', path).strip('-')[:80] or 'root'
+
+
+class PerformanceMiddleware:
+    """
+    Request instrumentation; place it first in MIDDLEWARE so the total
+    covers the whole stack. View time runs from the view's resolution to
+    the response, so it includes the response phase of the middleware
+    below this one.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFORMANCE_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.slow_ms = getattr(settings, 'PERFORMANCE_SLOW_REQUEST_MS', 500)
+        self.duplicate_threshold = getattr(settings, 'PERFORMANCE_DUPLICATE_THRESHOLD', 5)
+        self.profile_dir = getattr(settings, 'PERFORMANCE_PROFILE_DIR', None)
+        self.sample_rate = getattr(settings, 'PERFORMANCE_PROFILE_SAMPLE_RATE', 0.0)
+
+        connection_created.connect(install_query_recorder, dispatch_uid='core.performance.query_recorder')
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection=connection)
+        BackendTemplate.render = _timed_render
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics, token, profiler = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                _profiling.release()
+        return self._finish(request, response, metrics, profiler)
+
+    async def __acall__(self, request):
+        metrics, token, profiler = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                _profiling.release()
+        return self._finish(request, response, metrics, profiler)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view_started = time.perf_counter()
+
+    def _start(self, request):
+        # Connections opened by this thread before the receiver was connected
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection=connection)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        profiler = None
+        if self.profile_dir and random.random() < self.sample_rate and _profiling.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return metrics, token, profiler
+
+    def _finish(self, request, response, metrics, profiler):
+        responded = time.perf_counter()
+        if not response.streaming:
+            response['Server-Timing'] = self._server_timing(metrics, responded)
+            self._report(request, response, metrics, profiler, responded)
+            return response
+        # The headers leave before the body, whose queries run while it is iterated:
+        # the header only covers the view, and the log line is written once the body is sent
+        response['Server-Timing'] = self._server_timing(metrics, responded) + ', body;desc="streamed"'
+        measure = self._ameasure if response.is_async else self._measure
+        response.streaming_content = measure(response.streaming_content, request, response, metrics, profiler, responded)
+        return response
+
+    def _measure(self, content, request, response, metrics, profiler, responded):
+        try:
+            iterator = iter(content)
+            while True:
+                token = _current.set(metrics)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                yield chunk
+        finally:
+            self._report(request, response, metrics, profiler, responded)
+
+    async def _ameasure(self, content, request, response, metrics, profiler, responded):
+        try:
+            iterator = aiter(content)
+            while True:
+                token = _current.set(metrics)
+                try:
+                    chunk = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                yield chunk
+        finally:
+            self._report(request, response, metrics, profiler, responded)
+
+    def _server_timing(self, metrics, responded):
+        total = (responded - metrics.started) * 1000
+        view = (responded - metrics.view_started) * 1000 if metrics.view_started else 0.0
+        return ', '.join([
+            f'total;dur={total:.1f}',
+            f'view;dur={view:.1f}',
+            f'sql;dur={metrics.sql_time * 1000:.1f};desc="{metrics.query_count} queries, {metrics.duplicate_count} duplicates"',
+            f'template;dur={metrics.template_time * 1000:.1f}',
+        ])
+
+    def _report(self, request, response, metrics, profiler, responded):
+        finished = time.perf_counter()
+        total = (finished - metrics.started) * 1000
+        view = (responded - metrics.view_started) * 1000 if metrics.view_started else 0.0
+        figures = {
+            'total_ms': round(total, 1),
+            'view_ms': round(view, 1),
+            'sql_ms': round(metrics.sql_time * 1000, 1),
+            'queries': metrics.query_count,
+            'duplicates': metrics.duplicate_count,
+            'template_ms': round(metrics.template_time * 1000, 1),
+        }
+        if response.streaming:
+            figures['stream_ms'] = round((finished - responded) * 1000, 1)
+
+        repeated = [
+            (sql, count) for sql, count in metrics.statements.most_common(MAX_REPORTED_QUERIES)
+            if count >= self.duplicate_threshold
+        ]
+        # Event streams stay open for as long as the client listens
+        slow = total >= self.slow_ms and not response.get('Content-Type', '').startswith('text/event-stream')
+        message = '%s %s %s ' % (request.method, request.path, response.status_code) + ' '.join(
+            f'{key}={value}' for key, value in figures.items()
+        )
+        for sql, count in repeated:
+            message += f'\n  {count}x {sql[:300]}'
+        logger.log(
+            logging.WARNING if slow or repeated else logging.INFO, message,
+            extra={'performance': {'method': request.method, 'path': request.path, 'status': response.status_code, **figures}},
+        )
+
+        if profiler is not None and slow:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = f'{time.strftime("%Y%m%d-%H%M%S")}-{request.method}-{_slug(request.path)}-{int(total)}ms.prof'
+            profiler.dump_stats(os.path.join(self.profile_dir, name))
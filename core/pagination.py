@@ -0,0 +1,160 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are selected with a WHERE clause on the ordering columns instead of
+an OFFSET, so with an index matching the filter and the ordering every page
+costs one index seek plus `per_page` rows, however deep it is. A cursor is
+an opaque token holding the ordering values of the row a page starts after
+and the direction to read in; pages have no numbers and there is no total
+count.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorPage:
+    """One page of rows, with the cursors of the pages next to it (None at either end)"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Keyset pagination of a queryset over a unique ordering.
+
+    The last ordering field must be unique (the primary key) so that rows
+    with equal leading values are neither skipped nor repeated. Works with
+    model instances as well as values() dicts.
+    """
+
+    def __init__(self, queryset, per_page, ordering=DEFAULT_ORDERING):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.fields = [field.lstrip('-') for field in ordering]
+        self.descending = [field.startswith('-') for field in ordering]
+
+    def _value(self, row, field):
+        return row[field] if isinstance(row, dict) else getattr(row, field)
+
+    def encode(self, row, direction):
+        values = [self._value(row, field) for field in self.fields]
+        data = [direction, *(value.isoformat() if hasattr(value, 'isoformat') else value for value in values)]
+        return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def decode(self, cursor):
+        """(direction, ordering values) of a cursor"""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            direction, *raw_values = data
+            if direction not in ('next', 'previous') or len(raw_values) != len(self.fields):
+                raise InvalidCursor('Invalid cursor')
+            model = self.queryset.model
+            values = [model._meta.get_field(field).to_python(value) for field, value in zip(self.fields, raw_values)]
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, ValidationError):
+            raise InvalidCursor('Invalid cursor')
+        return direction, values
+
+    def _after_q(self, values, descending):
+        """Rows strictly after `values` in the given ordering"""
+        q = None
+        for field, value, desc in reversed(list(zip(self.fields, values, descending))):
+            beyond = Q(**{f"{field}__{'lt' if desc else 'gt'}": value})
+            q = beyond if q is None else beyond | (Q(**{field: value}) & q)
+        # The redundant inclusive bound on the leading field lets the database seek the index
+        leading = Q(**{f"{self.fields[0]}__{'lte' if descending[0] else 'gte'}": values[0]})
+        return leading & q
+
+    def page(self, cursor=None):
+        direction, values = self.decode(cursor) if cursor else ('next', None)
+        # Pages before the cursor are read in reverse order and flipped back
+        descending = [desc != (direction == 'previous') for desc in self.descending]
+        queryset = self.queryset.order_by(*(f"{'-' if desc else ''}{field}" for field, desc in zip(self.fields, descending)))
+        if values is not None:
+            queryset = queryset.filter(self._after_q(values, descending))
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'previous':
+            rows.reverse()
+            has_next, has_previous = values is not None, more
+        else:
+            has_next, has_previous = more, values is not None
+        return CursorPage(
+            rows,
+            self.encode(rows[-1], 'next') if has_next and rows else None,
+            self.encode(rows[0], 'previous') if has_previous and rows else None,
+        )
+
+
+def paginate(request, queryset, per_page, ordering=DEFAULT_ORDERING):
+    """The page selected by ?cursor=, raising Http404 for a bad cursor"""
+    try:
+        return CursorPaginator(queryset, per_page, ordering).page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid cursor')
+
+
+def cursor_page_response(request, queryset, serialize, per_page=20, ordering=DEFAULT_ORDERING):
+    """
+    JSON page of `queryset`: {"results": [...], "next": cursor, "previous": cursor}.
+
+    `?cursor=` selects the page and `?limit=` (up to MAX_PAGE_SIZE) its size;
+    `serialize` turns a row into a JSON-serializable dict.
+    """
+    try:
+        limit = int(request.GET.get('limit') or per_page)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return JsonResponse({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}, status=400)
+    try:
+        page = CursorPaginator(queryset, limit, ordering).page(request.GET.get('cursor'))
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'results': [serialize(row) for row in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+class CursorPaginationMixin:
+    """Keyset pagination for a MultipleObjectMixin view (ListView) with paginate_by set"""
+    ordering_fields = DEFAULT_ORDERING
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate(self.request, queryset, page_size, self.ordering_fields)
+        return None, page, page.object_list, page.has_other_pages()
@@ -7,6 +7,7 @@ from django.utils.translation import gettext as _, activate, get_language
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 from .forms import LoginForm, UserRegistrationForm
+from .middleware import LANGUAGE_SESSION_KEY
 
 
 class HomeView(TemplateView):
@@ -70,7 +71,7 @@ def set_language(request):
         language = request.GET.get('language')
         if language in ['en', 'fa']:
             # Set the language in the session
-            request.session['django_language'] = language
+            request.session[LANGUAGE_SESSION_KEY] = language
             # Activate the language for the current request
             activate(language)
             # Force session save
@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily activity rollups, by default for every day with activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='First day to recompute (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day to recompute (YYYY-MM-DD)')
+        parser.add_argument('--chunk-days', type=int, default=90,
+                            help='Days aggregated and written per transaction')
+
+    def handle(self, *args, **options):
+        bounds = rollups.activity_bounds()
+        if bounds is None and not (options['start'] and options['end']):
+            self.stdout.write('No areas or reports to roll up.')
+            return
+        start = options['start'] or bounds[0]
+        end = options['end'] or bounds[1]
+        if start > end:
+            raise CommandError('--start must not be after --end')
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be at least 1')
+
+        def progress(window_start, window_end, rows):
+            self.stdout.write(f'{window_start} to {window_end}: {rows} rollup rows')
+
+        total = rollups.backfill(start, end, chunk_days=options['chunk_days'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {total} rollup rows for {start} to {end}.'))
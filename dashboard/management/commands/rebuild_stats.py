@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from dashboard import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard statistics counters from scratch'
+
+    def handle(self, *args, **options):
+        counters = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {counters} dashboard counters.'))
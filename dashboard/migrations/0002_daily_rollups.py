@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("dashboard", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AreaDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("pollution_type", models.CharField(max_length=20)),
+                ("severity", models.IntegerField()),
+                ("created", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ReportDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("status", models.CharField(max_length=20)),
+                ("filed", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="reportdailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("day", "status"), name="unique_report_daily_rollup"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="areadailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("day", "pollution_type", "severity"),
+                name="unique_area_daily_rollup",
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import models
+
+
+class StatCounter(models.Model):
+    """
+    A named dashboard counter, maintained incrementally by dashboard.signals.
+
+    Keys are built by dashboard.stats, e.g. `areas`, `areas:type:air`,
+    `areas:day:2025-01-31` or `user:42:reports`.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class AreaDailyRollup(models.Model):
+    """Number of polluted areas created per day, by pollution type and severity"""
+    day = models.DateField()
+    pollution_type = models.CharField(max_length=20)
+    severity = models.IntegerField()
+    created = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'pollution_type', 'severity'], name='unique_area_daily_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.pollution_type}:{self.severity} = {self.created}"
+
+
+class ReportDailyRollup(models.Model):
+    """Number of pollution reports filed per day, by their current status"""
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    filed = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='unique_report_daily_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.status} = {self.filed}"
@@ -0,0 +1,204 @@
+"""
+Daily time-series rollups of pollution activity.
+
+AreaDailyRollup counts areas by creation day, pollution type and severity.
+ReportDailyRollup counts reports by filing day and current status, so a
+status change moves a report between two rows of the same day. Both are
+kept current by dashboard.signals and can be rebuilt with backfill().
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from maps.models import PollutedArea, PollutionReport
+
+from .models import AreaDailyRollup, ReportDailyRollup
+from .stats import increment, local_day
+
+AREA_FIELDS = ('created_at', 'pollution_type', 'severity')
+REPORT_FIELDS = ('created_at', 'status')
+
+# Longest range the trends endpoint serves in one request
+MAX_RANGE_DAYS = 5 * 366
+
+
+def _area_key(values):
+    return (local_day(values['created_at']), values['pollution_type'], values['severity'])
+
+
+def _report_key(values):
+    return (local_day(values['created_at']), values['status'])
+
+
+def _apply(model, names, field, old_key, new_key):
+    if old_key == new_key:
+        return
+    with transaction.atomic():
+        if old_key is not None:
+            increment(model, dict(zip(names, old_key)), field, -1)
+        if new_key is not None:
+            increment(model, dict(zip(names, new_key)), field, 1)
+
+
+def _values(instance, fields, previous):
+    if previous:
+        return {field: instance.previous_value(field) for field in fields}
+    return {field: getattr(instance, field) for field in fields}
+
+
+def update_area(instance, created):
+    old = None if created else _area_key(_values(instance, AREA_FIELDS, True))
+    _apply(AreaDailyRollup, ('day', 'pollution_type', 'severity'), 'created',
+           old, _area_key(_values(instance, AREA_FIELDS, False)))
+
+
+def remove_area(instance):
+    _apply(AreaDailyRollup, ('day', 'pollution_type', 'severity'), 'created',
+           _area_key(_values(instance, AREA_FIELDS, True)), None)
+
+
+def update_report(instance, created):
+    old = None if created else _report_key(_values(instance, REPORT_FIELDS, True))
+    _apply(ReportDailyRollup, ('day', 'status'), 'filed',
+           old, _report_key(_values(instance, REPORT_FIELDS, False)))
+
+
+def remove_report(instance):
+    _apply(ReportDailyRollup, ('day', 'status'), 'filed',
+           _report_key(_values(instance, REPORT_FIELDS, True)), None)
+
+
+def move_reports(moved, status):
+    """Move reports to `status` in the rollups, for (filing day, old status, count) triples"""
+    with transaction.atomic():
+        for day, old_status, count in moved:
+            increment(ReportDailyRollup, {'day': day, 'status': old_status}, 'filed', -count)
+            increment(ReportDailyRollup, {'day': day, 'status': status}, 'filed', count)
+
+
+def _day_start(day):
+    """Start of a local day, comparable with created_at"""
+    value = datetime.combine(day, time.min)
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+
+def backfill(start, end, chunk_days=90, batch_size=1000, progress=None):
+    """
+    Recompute the rollups for days `start` to `end` inclusive.
+
+    The range is processed in windows of `chunk_days`; each window is
+    aggregated in the database, its old rollups deleted and the new ones
+    bulk inserted in one transaction.
+    """
+    total = 0
+    window_start = start
+    while window_start <= end:
+        window_end = min(end, window_start + timedelta(days=chunk_days - 1))
+        created_range = {
+            'created_at__gte': _day_start(window_start),
+            'created_at__lt': _day_start(window_end + timedelta(days=1)),
+        }
+        areas = PollutedArea.objects.order_by().filter(**created_range).annotate(
+            day=TruncDate('created_at')
+        ).values('day', 'pollution_type', 'severity').annotate(count=Count('id'))
+        reports = PollutionReport.objects.order_by().filter(**created_range).annotate(
+            day=TruncDate('created_at')
+        ).values('day', 'status').annotate(count=Count('id'))
+
+        with transaction.atomic():
+            AreaDailyRollup.objects.filter(day__gte=window_start, day__lte=window_end).delete()
+            ReportDailyRollup.objects.filter(day__gte=window_start, day__lte=window_end).delete()
+            area_rows = AreaDailyRollup.objects.bulk_create(
+                (AreaDailyRollup(day=row['day'], pollution_type=row['pollution_type'],
+                                 severity=row['severity'], created=row['count']) for row in areas),
+                batch_size=batch_size,
+            )
+            report_rows = ReportDailyRollup.objects.bulk_create(
+                (ReportDailyRollup(day=row['day'], status=row['status'], filed=row['count']) for row in reports),
+                batch_size=batch_size,
+            )
+        total += len(area_rows) + len(report_rows)
+        if progress:
+            progress(window_start, window_end, len(area_rows) + len(report_rows))
+        window_start = window_end + timedelta(days=1)
+    return total
+
+
+def changed_days(since):
+    """Creation days of the areas written after change sequence number `since`, and filing days of their reports"""
+    days = set()
+    querysets = (
+        PollutedArea.objects.filter(change_seq__gt=since),
+        PollutionReport.objects.filter(polluted_area__change_seq__gt=since),
+    )
+    for queryset in querysets:
+        days.update(
+            queryset.order_by().annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct()
+        )
+    return sorted(days)
+
+
+def backfill_days(days, **kwargs):
+    """backfill() each run of consecutive days in the sorted `days`"""
+    total = 0
+    run_start = previous = None
+    for day in [*days, None]:
+        if run_start is not None and (day is None or day != previous + timedelta(days=1)):
+            total += backfill(run_start, previous, **kwargs)
+            run_start = None
+        if run_start is None:
+            run_start = day
+        previous = day
+    return total
+
+
+def trends(start, end):
+    """Per-day series between `start` and `end` inclusive, read from the rollups"""
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    index = {day: position for position, day in enumerate(days)}
+
+    def series():
+        return [0] * len(days)
+
+    areas_total = series()
+    by_type = {value: series() for value, _ in PollutedArea.POLLUTION_TYPES}
+    by_severity = {value: series() for value, _ in PollutedArea.SEVERITY_LEVELS}
+    rows = AreaDailyRollup.objects.filter(day__gte=start, day__lte=end).values_list(
+        'day', 'pollution_type', 'severity', 'created'
+    )
+    for day, pollution_type, severity, created in rows:
+        position = index[day]
+        areas_total[position] += created
+        by_type.setdefault(pollution_type, series())[position] += created
+        by_severity.setdefault(severity, series())[position] += created
+
+    reports_total = series()
+    by_status = {value: series() for value, _ in PollutionReport.STATUS_CHOICES}
+    rows = ReportDailyRollup.objects.filter(day__gte=start, day__lte=end).values_list('day', 'status', 'filed')
+    for day, status, filed in rows:
+        position = index[day]
+        reports_total[position] += filed
+        by_status.setdefault(status, series())[position] += filed
+
+    return {
+        'days': [day.isoformat() for day in days],
+        'areas': {'total': areas_total, 'by_type': by_type, 'by_severity': by_severity},
+        'reports': {'total': reports_total, 'by_status': by_status},
+    }
+
+
+def activity_bounds():
+    """First and last day with any area or report, or None if there is none"""
+    days = []
+    for model in (PollutedArea, PollutionReport):
+        first = model.objects.order_by('created_at').values_list('created_at', flat=True).first()
+        last = model.objects.order_by('-created_at').values_list('created_at', flat=True).first()
+        if first:
+            days.extend((local_day(first), local_day(last)))
+    if not days:
+        return None
+    return min(days), max(days)
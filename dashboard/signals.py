@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from maps.models import PollutedArea, PollutionReport
+from maps.signals import areas_bulk_changed, reports_moderated
+
+from . import rollups, stats
+
+# Area fields the counters and rollups are computed from
+STATISTICS_FIELDS = {*stats.AREA_FIELDS, *rollups.AREA_FIELDS}
+
+
+@receiver(post_save, sender=PollutedArea)
+def update_area_stats(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    stats.update_area(instance, created)
+    rollups.update_area(instance, created)
+
+
+@receiver(post_delete, sender=PollutedArea)
+def remove_area_stats(sender, instance, **kwargs):
+    stats.remove_area(instance)
+    rollups.remove_area(instance)
+
+
+@receiver(post_save, sender=PollutionReport)
+def update_report_stats(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    stats.update_report(instance, created)
+    rollups.update_report(instance, created)
+
+
+@receiver(post_delete, sender=PollutionReport)
+def remove_report_stats(sender, instance, **kwargs):
+    stats.remove_report(instance)
+    rollups.remove_report(instance)
+
+
+@receiver(reports_moderated)
+def move_moderated_reports(sender, status, moved, **kwargs):
+    # Report counters only depend on the reporter; the daily rollups are per status
+    rollups.move_reports(moved, status)
+
+
+@receiver(areas_bulk_changed)
+def rebuild_after_bulk_change(sender, since=None, fields=None, **kwargs):
+    if fields is not None and not STATISTICS_FIELDS.intersection(fields):
+        return
+
+    def rebuild():
+        stats.rebuild()
+        if since is not None:
+            rollups.backfill_days(rollups.changed_days(since))
+        else:
+            bounds = rollups.activity_bounds()
+            if bounds:
+                rollups.backfill(*bounds)
+    transaction.on_commit(rebuild)
@@ -0,0 +1,171 @@
+"""
+Incrementally maintained dashboard statistics.
+
+Every figure on the dashboard is a StatCounter row. Saving or deleting an
+area or report computes the counter keys the old and the new version of the
+row contribute to and applies the difference with F() increments, so the
+dashboard reads everything back with a single lookup on the unique key.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from maps.models import PollutedArea, PollutionReport
+
+from .models import StatCounter
+
+RECENT_DAYS = 30
+
+AREA_FIELDS = ('is_active', 'pollution_type', 'severity', 'created_at', 'created_by_id')
+REPORT_FIELDS = ('reporter_id',)
+
+
+def local_day(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def area_keys(values):
+    """Counter keys an area with these field values contributes to"""
+    if not values['is_active']:
+        return []
+    return [
+        'areas',
+        f"areas:type:{values['pollution_type']}",
+        f"areas:severity:{values['severity']}",
+        f"areas:day:{local_day(values['created_at']).isoformat()}",
+        f"user:{values['created_by_id']}:areas",
+    ]
+
+
+def report_keys(values):
+    return ['reports', f"user:{values['reporter_id']}:reports"]
+
+
+def apply_changes(old_keys, new_keys):
+    """Decrement the old keys and increment the new ones, skipping unchanged keys"""
+    deltas = Counter(new_keys)
+    deltas.subtract(Counter(old_keys))
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        for key, delta in deltas.items():
+            increment(StatCounter, {'key': key}, 'value', delta)
+
+
+def increment(model, lookup, field, delta):
+    """Add `delta` to `field` of the row matching `lookup`, creating the row if needed"""
+    if model.objects.filter(**lookup).update(**{field: F(field) + delta}):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **{field: delta})
+    except IntegrityError:
+        # Created concurrently by another writer
+        model.objects.filter(**lookup).update(**{field: F(field) + delta})
+
+
+def _previous(instance, fields):
+    return {field: instance.previous_value(field) for field in fields}
+
+
+def _current(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+def update_area(instance, created):
+    old = [] if created else area_keys(_previous(instance, AREA_FIELDS))
+    apply_changes(old, area_keys(_current(instance, AREA_FIELDS)))
+
+
+def remove_area(instance):
+    apply_changes(area_keys(_previous(instance, AREA_FIELDS)), [])
+
+
+def update_report(instance, created):
+    old = [] if created else report_keys(_previous(instance, REPORT_FIELDS))
+    apply_changes(old, report_keys(_current(instance, REPORT_FIELDS)))
+
+
+def remove_report(instance):
+    apply_changes(report_keys(_previous(instance, REPORT_FIELDS)), [])
+
+
+def rebuild(batch_size=1000):
+    """Recompute every counter from the areas and reports tables"""
+    counters = Counter()
+    active = PollutedArea.objects.filter(is_active=True).order_by()
+    counters['areas'] = active.count()
+    for row in active.values('pollution_type').annotate(count=Count('id')):
+        counters[f"areas:type:{row['pollution_type']}"] = row['count']
+    for row in active.values('severity').annotate(count=Count('id')):
+        counters[f"areas:severity:{row['severity']}"] = row['count']
+    for row in active.annotate(day=TruncDate('created_at')).values('day').annotate(count=Count('id')):
+        counters[f"areas:day:{row['day'].isoformat()}"] = row['count']
+    for row in active.values('created_by_id').annotate(count=Count('id')):
+        counters[f"user:{row['created_by_id']}:areas"] = row['count']
+
+    reports = PollutionReport.objects.order_by()
+    counters['reports'] = reports.count()
+    for row in reports.values('reporter_id').annotate(count=Count('id')):
+        counters[f"user:{row['reporter_id']}:reports"] = row['count']
+
+    with transaction.atomic():
+        StatCounter.objects.all().delete()
+        StatCounter.objects.bulk_create(
+            (StatCounter(key=key, value=value) for key, value in counters.items() if value),
+            batch_size=batch_size,
+        )
+    return len(counters)
+
+
+def _dashboard_keys(user):
+    today = timezone.localdate()
+    return {
+        'days': [f'areas:day:{(today - timedelta(days=offset)).isoformat()}' for offset in range(RECENT_DAYS)],
+        'types': {f'areas:type:{value}': value for value, _ in PollutedArea.POLLUTION_TYPES},
+        'severities': {f'areas:severity:{value}': value for value, _ in PollutedArea.SEVERITY_LEVELS},
+        'user_areas': f'user:{user.pk}:areas',
+        'user_reports': f'user:{user.pk}:reports',
+    }
+
+
+def _counter_queryset(keys):
+    wanted = ['areas', 'reports', keys['user_areas'], keys['user_reports'], *keys['days'], *keys['types'],
+              *keys['severities']]
+    return StatCounter.objects.filter(key__in=wanted).values_list('key', 'value')
+
+
+def _assemble(keys, values):
+    pollution_stats = sorted(
+        ({'pollution_type': value, 'count': values[key]} for key, value in keys['types'].items() if values.get(key)),
+        key=lambda row: -row['count'],
+    )
+    severity_stats = [
+        {'severity': value, 'count': values[key]} for key, value in keys['severities'].items() if values.get(key)
+    ]
+    return {
+        'total_areas': values.get('areas', 0),
+        'user_areas': values.get(keys['user_areas'], 0),
+        'total_reports': values.get('reports', 0),
+        'user_reports': values.get(keys['user_reports'], 0),
+        'pollution_stats': pollution_stats,
+        'severity_stats': severity_stats,
+        'recent_areas_count': sum(values.get(key, 0) for key in keys['days']),
+    }
+
+
+def dashboard_stats(user):
+    """All dashboard figures for `user`, read with one indexed lookup"""
+    keys = _dashboard_keys(user)
+    return _assemble(keys, dict(_counter_queryset(keys)))
+
+
+async def adashboard_stats(user):
+    """Async version of dashboard_stats()"""
+    keys = _dashboard_keys(user)
+    return _assemble(keys, {key: value async for key, value in _counter_queryset(keys)})
@@ -7,5 +7,9 @@ urlpatterns = [
     path('', views.dashboard_home, name='home'),
     path('my-areas/', views.my_areas, name='my_areas'),
     path('my-reports/', views.my_reports, name='my_reports'),
+    path('api/stats/', views.dashboard_stats_json, name='stats_json'),
+    path('api/trends/', views.trends_json, name='trends_json'),
+    path('api/my-areas/', views.my_areas_json, name='my_areas_json'),
+    path('api/my-reports/', views.my_reports_json, name='my_reports_json'),
 ]
 
@@ -1,65 +1,115 @@
+from datetime import date, timedelta
+
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
+from django.http import JsonResponse
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.functional import SimpleLazyObject
+from core.decorators import async_login_required
+from core.pagination import cursor_page_response, paginate
+from maps.cache import get_data_version, get_reports_version
 from maps.models import PollutedArea, PollutionReport
+from .rollups import MAX_RANGE_DAYS, trends
+from .stats import adashboard_stats, dashboard_stats
+
+MY_AREAS_PER_PAGE = 24
+MY_REPORTS_PER_PAGE = 20
 
 
 @login_required
 def dashboard_home(request):
-    # Get statistics
-    total_areas = PollutedArea.objects.filter(is_active=True).count()
-    user_areas = PollutedArea.objects.filter(created_by=request.user, is_active=True).count()
-    total_reports = PollutionReport.objects.count()
-    user_reports = PollutionReport.objects.filter(reporter=request.user).count()
-    
-    # Recent areas
-    recent_areas = PollutedArea.objects.filter(is_active=True).order_by('-created_at')[:5]
-    
-    # Recent reports
-    recent_reports = PollutionReport.objects.filter(reporter=request.user).order_by('-created_at')[:5]
-    
-    # Pollution type distribution
-    pollution_stats = PollutedArea.objects.filter(is_active=True).values('pollution_type').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Severity distribution
-    severity_stats = PollutedArea.objects.filter(is_active=True).values('severity').annotate(
-        count=Count('id')
-    ).order_by('severity')
-    
-    # Areas created in the last 30 days
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    recent_areas_count = PollutedArea.objects.filter(
-        created_at__gte=thirty_days_ago,
-        is_active=True
-    ).count()
-    
+    user = request.user
     context = {
-        'total_areas': total_areas,
-        'user_areas': user_areas,
-        'total_reports': total_reports,
-        'user_reports': user_reports,
-        'recent_areas': recent_areas,
-        'recent_reports': recent_reports,
-        'pollution_stats': pollution_stats,
-        'severity_stats': severity_stats,
-        'recent_areas_count': recent_areas_count,
+        # The page's fragments are cached per data version; everything below is
+        # lazy and only queried when a fragment has to be rendered again
+        'areas_version': get_data_version(),
+        'reports_version': get_reports_version(),
+        
+        # Counters and histograms, maintained incrementally (see dashboard.stats)
+        'stats': SimpleLazyObject(lambda: dashboard_stats(user)),
+        
+        # Recent areas
+        'recent_areas': PollutedArea.objects.filter(is_active=True).order_by('-created_at')[:5],
+        
+        # Recent reports
+        'recent_reports': PollutionReport.objects.filter(reporter=user).order_by('-created_at')[:5],
     }
-    
     return render(request, 'dashboard/home.html', context)
 
 
+@async_login_required
+async def dashboard_stats_json(request):
+    """Dashboard figures and the latest areas as JSON, served from the async ORM"""
+    context = await adashboard_stats(request.user)
+    context['recent_areas'] = [
+        {
+            'id': area['id'],
+            'name': area['name'],
+            'pollution_type': area['pollution_type'],
+            'severity': area['severity'],
+            'created_at': area['created_at'].isoformat(),
+        }
+        async for area in PollutedArea.objects.filter(is_active=True).order_by('-created_at').values(
+            'id', 'name', 'pollution_type', 'severity', 'created_at'
+        )[:5]
+    ]
+    return JsonResponse(context)
+
+
 @login_required
 def my_areas(request):
-    areas = PollutedArea.objects.filter(created_by=request.user, is_active=True).order_by('-created_at')
-    return render(request, 'dashboard/my_areas.html', {'areas': areas})
+    areas = PollutedArea.objects.filter(created_by=request.user, is_active=True).defer(
+        'polygon_data', 'polygon_lod_low', 'polygon_lod_mid', 'polygon_lod_high'
+    )
+    return render(request, 'dashboard/my_areas.html', {'areas': paginate(request, areas, MY_AREAS_PER_PAGE)})
 
 
 @login_required
 def my_reports(request):
-    reports = PollutionReport.objects.filter(reporter=request.user).order_by('-created_at')
-    return render(request, 'dashboard/my_reports.html', {'reports': reports})
+    reports = PollutionReport.objects.filter(reporter=request.user).select_related('polluted_area', 'verified_by').defer(
+        'polluted_area__polygon_data', 'polluted_area__polygon_lod_low',
+        'polluted_area__polygon_lod_mid', 'polluted_area__polygon_lod_high',
+    )
+    return render(request, 'dashboard/my_reports.html', {'reports': paginate(request, reports, MY_REPORTS_PER_PAGE)})
+
+
+@login_required
+def my_areas_json(request):
+    """The user's active areas, newest first, a page per ?cursor="""
+    areas = PollutedArea.objects.filter(created_by=request.user, is_active=True).values(
+        'id', 'name', 'pollution_type', 'severity', 'area_size', 'created_at'
+    )
+    return cursor_page_response(request, areas, lambda area: {
+        **area, 'created_at': area['created_at'].isoformat(),
+    }, MY_AREAS_PER_PAGE)
+
+
+@login_required
+def my_reports_json(request):
+    """The user's reports, newest first, a page per ?cursor="""
+    reports = PollutionReport.objects.filter(reporter=request.user).values(
+        'id', 'title', 'status', 'polluted_area_id', 'polluted_area__name', 'created_at', 'verified_at'
+    )
+    return cursor_page_response(request, reports, lambda report: {
+        'id': report['id'],
+        'title': report['title'],
+        'status': report['status'],
+        'area': {'id': report['polluted_area_id'], 'name': report['polluted_area__name']},
+        'created_at': report['created_at'].isoformat(),
+        'verified_at': report['verified_at'].isoformat() if report['verified_at'] else None,
+    }, MY_REPORTS_PER_PAGE)
+
 
+@login_required
+def trends_json(request):
+    """Daily area and report counts between ?start= and ?end= (YYYY-MM-DD), the last 30 days by default"""
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=29)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date, expected YYYY-MM-DD'}, status=400)
+    if start > end:
+        return JsonResponse({'error': 'start must not be after end'}, status=400)
+    if (end - start).days >= MAX_RANGE_DAYS:
+        return JsonResponse({'error': f'Range must be shorter than {MAX_RANGE_DAYS} days'}, status=400)
+    return JsonResponse(trends(start, end))
@@ -1,14 +1,108 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _, ngettext
+
+from . import moderation, search
 from .models import PollutedArea, PollutionReport
 
+POLYGON_FIELDS = ('polygon_data', 'polygon_lod_low', 'polygon_lod_mid', 'polygon_lod_high')
+
+# Filtered changelists are counted up to this many rows
+MAX_EXACT_COUNT = 10000
+
+
+def estimated_row_count(model, using='default'):
+    """The database's cheap estimate of a table's row count, or None where there is none"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+                [table],
+            )
+        elif connection.vendor == 'sqlite':
+            # Rowids only grow, so this overestimates by the deleted rows
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for changelists of large tables: the unfiltered count is the
+    database's estimate instead of a COUNT(*) over the whole table, and a
+    filtered count stops at MAX_EXACT_COUNT (narrow the filters to page
+    further).
+    """
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > MAX_EXACT_COUNT:
+                return estimate
+        return queryset.order_by()[:MAX_EXACT_COUNT].count()
+
+
+class LightChangeList(ChangeList):
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(*self.model_admin.list_defer)
+
+
+class ScalableAdminMixin:
+    """
+    Changelist settings for tables with millions of rows: estimated counts,
+    no second COUNT(*) of the unfiltered table, `list_defer` columns left
+    out of the list query and raw id inputs instead of <select>s listing
+    every related row.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_defer = ()
+    
+    def get_changelist(self, request, **kwargs):
+        return LightChangeList
+
+
+class IndexedSearchMixin:
+    """
+    Search text through the full-text index instead of icontains scans;
+    `search_fields` then only cover the remaining (username) lookups,
+    whose matches are added to the indexed ones.
+    """
+    search_kind = None
+    
+    def indexed_search_q(self, search_term):
+        return Q(pk__in=search.matching_ids(self.search_kind, search_term))
+    
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search_term.strip():
+            return results, may_have_duplicates
+        return results | queryset.filter(self.indexed_search_q(search_term)), may_have_duplicates
+
 
 @admin.register(PollutedArea)
-class PollutedAreaAdmin(admin.ModelAdmin):
+class PollutedAreaAdmin(ScalableAdminMixin, IndexedSearchMixin, admin.ModelAdmin):
     list_display = ['name', 'pollution_type', 'severity', 'created_by', 'created_at', 'is_active']
     list_filter = ['pollution_type', 'severity', 'is_active', 'created_at']
-    search_fields = ['name', 'description', 'created_by__username']
-    list_editable = ['is_active']
+    list_select_related = ['created_by']
+    list_defer = ['description', *POLYGON_FIELDS]
+    search_fields = ['created_by__username']
+    search_kind = 'area'
+    raw_id_fields = ['created_by']
     readonly_fields = ['created_at', 'updated_at']
+    actions = ['activate', 'deactivate']
     
     fieldsets = (
         ('Basic Information', {
@@ -27,15 +121,39 @@ class PollutedAreaAdmin(admin.ModelAdmin):
             'fields': ('is_active', 'created_at', 'updated_at')
         }),
     )
+    
+    def _set_active(self, request, queryset, active):
+        # Saved one by one, so clusters, tiles, counters and events are updated incrementally
+        count = 0
+        with transaction.atomic():
+            for area in queryset.exclude(is_active=active).iterator():
+                area.is_active = active
+                area.save(update_fields=['is_active', 'updated_at'])
+                count += 1
+        self.message_user(request, ngettext(
+            '%(count)d area updated.', '%(count)d areas updated.', count,
+        ) % {'count': count}, messages.SUCCESS)
+    
+    @admin.action(description=_('Activate selected areas'))
+    def activate(self, request, queryset):
+        self._set_active(request, queryset, True)
+    
+    @admin.action(description=_('Deactivate selected areas'))
+    def deactivate(self, request, queryset):
+        self._set_active(request, queryset, False)
 
 
 @admin.register(PollutionReport)
-class PollutionReportAdmin(admin.ModelAdmin):
+class PollutionReportAdmin(ScalableAdminMixin, IndexedSearchMixin, admin.ModelAdmin):
     list_display = ['title', 'polluted_area', 'reporter', 'status', 'created_at']
     list_filter = ['status', 'created_at', 'verified_at']
-    search_fields = ['title', 'description', 'reporter__username', 'polluted_area__name']
-    list_editable = ['status']
+    list_select_related = ['polluted_area', 'reporter']
+    list_defer = ['description', 'polluted_area__description', *(f'polluted_area__{field}' for field in POLYGON_FIELDS)]
+    search_fields = ['reporter__username']
+    search_kind = 'report'
+    raw_id_fields = ['polluted_area', 'reporter', 'verified_by']
     readonly_fields = ['created_at', 'updated_at', 'verified_at']
+    actions = ['verify', 'reject', 'resolve']
     
     fieldsets = (
         ('Report Information', {
@@ -49,7 +167,29 @@ class PollutionReportAdmin(admin.ModelAdmin):
         }),
     )
     
+    def indexed_search_q(self, search_term):
+        # Reports are also found by the name or description of their area
+        return super().indexed_search_q(search_term) | Q(polluted_area__in=search.matching_ids('area', search_term))
+    
     def save_model(self, request, obj, form, change):
-        if not change and obj.status == 'verified':
-            obj.verified_by = request.user
+        if not change or 'status' in form.changed_data:
+            moderation.stamp(obj, request.user)
         super().save_model(request, obj, form, change)
+    
+    def _moderate(self, request, queryset, status):
+        count = moderation.moderate(queryset, status, request.user)
+        self.message_user(request, ngettext(
+            '%(count)d report marked as %(status)s.', '%(count)d reports marked as %(status)s.', count,
+        ) % {'count': count, 'status': dict(PollutionReport.STATUS_CHOICES)[status]}, messages.SUCCESS)
+    
+    @admin.action(description=_('Verify selected reports'))
+    def verify(self, request, queryset):
+        self._moderate(request, queryset, 'verified')
+    
+    @admin.action(description=_('Reject selected reports'))
+    def reject(self, request, queryset):
+        self._moderate(request, queryset, 'rejected')
+    
+    @admin.action(description=_('Resolve selected reports'))
+    def resolve(self, request, queryset):
+        self._moderate(request, queryset, 'resolved')
@@ -5,3 +5,5 @@ class MapsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'maps'
 
+    def ready(self):
+        from . import signals  # noqa: F401
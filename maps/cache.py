@@ -0,0 +1,90 @@
+"""
+Versioned caching for the areas API and page fragments.
+
+The data version is the areas change sequence (maps.models.ChangeSequence),
+which the database advances whenever a polluted area is saved, deleted or
+written in bulk. Cached responses and ETags are derived from the version,
+the active language and the query parameters, so nothing ever has to be
+deleted: a change simply makes every older key unreachable. Reports have a
+sequence of their own, and each area's reports a version derived from its
+rows, which the templates' {% cache %} fragments include in their keys the
+same way.
+
+The versions live in the database rather than in the cache, so every
+worker sees a change as soon as it commits, whatever the cache backend.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
+from django.utils import translation
+
+from .models import ChangeSequence, PollutionReport
+
+
+def api_cache():
+    return caches[getattr(settings, 'MAP_API_CACHE', 'default')]
+
+
+def get_data_version():
+    return ChangeSequence.current(ChangeSequence.AREAS)
+
+
+async def aget_data_version():
+    return await ChangeSequence.acurrent(ChangeSequence.AREAS)
+
+
+def bump_data_version():
+    """Advance the data version after areas were changed without save() or delete()"""
+    return ChangeSequence.reserve(ChangeSequence.AREAS)
+
+
+def get_reports_version():
+    """Version of all reports, bumped whenever one is saved, deleted or moderated"""
+    return ChangeSequence.current(ChangeSequence.REPORTS)
+
+
+def get_area_reports_version(area_id):
+    """Version of the reports of one area: changes when one is added, removed or updated"""
+    summary = PollutionReport.objects.filter(polluted_area_id=area_id).order_by().aggregate(
+        count=Count('id'), updated=Max('updated_at'),
+    )
+    updated = summary['updated'].timestamp() if summary['updated'] else 0
+    return f"{summary['count']}:{updated}"
+
+
+def bump_reports_version():
+    return ChangeSequence.reserve(ChangeSequence.REPORTS)
+
+
+def request_fingerprint(request, version=None):
+    """Digest of the data version, language and query parameters of a request"""
+    if version is None:
+        version = get_data_version()
+    params = '&'.join(f'{key}={value}' for key, value in sorted(request.GET.items()))
+    raw = f'{version}|{translation.get_language()}|{request.path}?{params}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def areas_etag(request, version=None):
+    """Strong ETag for an areas API response; costs one indexed ChangeSequence read unless `version` is passed"""
+    return f'"{request_fingerprint(request, version)}"'
+
+
+def response_cache_key(request, version=None):
+    """
+    Cache key of a response body.
+
+    Compute it once, before querying, so a version bump during the query
+    cannot file stale data under the new version.
+    """
+    return f'maps:areas:response:{request_fingerprint(request, version)}'
+
+
+async def aget_cached_response(key):
+    return await api_cache().aget(key)
+
+
+async def aset_cached_response(key, content):
+    await api_cache().aset(key, content, getattr(settings, 'MAP_API_CACHE_TIMEOUT', 60 * 60))
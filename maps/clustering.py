@@ -0,0 +1,153 @@
+"""
+Zoom-dependent clustering of polluted areas.
+
+Areas are bucketed into a hierarchical grid: at map zoom z a cell is a Web
+Mercator tile at zoom z + CELL_SHIFT (64 px on screen). Cell aggregates are
+stored in AreaClusterCell for every zoom up to MAP_CLUSTER_MAX_ZOOM and are
+updated incrementally as areas change, so serving clusters is a single
+indexed range query per request.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import AreaClusterCell, PollutedArea, severity_color
+from .spatial import lnglat_to_tile, tile_range
+
+# Each cluster cell is 1/4 of a 256 px tile, i.e. 64 px on screen.
+CELL_SHIFT = 2
+
+CLUSTER_FIELDS = ('latitude', 'longitude', 'pollution_type', 'severity', 'is_active')
+
+
+def cluster_max_zoom():
+    return getattr(settings, 'MAP_CLUSTER_MAX_ZOOM', 12)
+
+
+def cell_for(lat, lng, zoom):
+    return lnglat_to_tile(lng, lat, zoom + CELL_SHIFT)
+
+
+def _state(values):
+    """The clustering key of an area, or None if it is not clustered"""
+    if not values['is_active'] or values['latitude'] is None or values['longitude'] is None:
+        return None
+    return (values['latitude'], values['longitude'], values['pollution_type'], values['severity'])
+
+
+def _apply(state, sign):
+    lat, lng, pollution_type, severity = state
+    for zoom in range(cluster_max_zoom() + 1):
+        x, y = cell_for(lat, lng, zoom)
+        cells = AreaClusterCell.objects.filter(
+            zoom=zoom, x=x, y=y, pollution_type=pollution_type, severity=severity
+        )
+        updated = cells.update(
+            count=F('count') + sign,
+            lat_sum=F('lat_sum') + sign * lat,
+            lng_sum=F('lng_sum') + sign * lng,
+        )
+        if sign < 0:
+            cells.filter(count__lte=0).delete()
+        elif not updated:
+            try:
+                with transaction.atomic():
+                    AreaClusterCell.objects.create(
+                        zoom=zoom, x=x, y=y, pollution_type=pollution_type, severity=severity,
+                        count=1, lat_sum=lat, lng_sum=lng,
+                    )
+            except IntegrityError:
+                # Another writer created the cell concurrently
+                cells.update(count=F('count') + 1, lat_sum=F('lat_sum') + lat, lng_sum=F('lng_sum') + lng)
+
+
+def update_area(area, created):
+    """Move a saved area's contribution from its previous cells to its current ones"""
+    old = None if created else _state({field: area.previous_value(field) for field in CLUSTER_FIELDS})
+    new = _state({field: getattr(area, field) for field in CLUSTER_FIELDS})
+    if old == new:
+        return
+    with transaction.atomic():
+        if old is not None:
+            _apply(old, -1)
+        if new is not None:
+            _apply(new, 1)
+
+
+def remove_area(area):
+    old = _state({field: area.previous_value(field) for field in CLUSTER_FIELDS})
+    if old is not None:
+        with transaction.atomic():
+            _apply(old, -1)
+
+
+def rebuild(batch_size=5000):
+    """Recompute every cluster cell from scratch. Returns the number of cells written."""
+    total = 0
+    with transaction.atomic():
+        AreaClusterCell.objects.all().delete()
+        for zoom in range(cluster_max_zoom() + 1):
+            cells = defaultdict(lambda: [0, 0.0, 0.0])
+            rows = PollutedArea.objects.filter(is_active=True).values_list(
+                'latitude', 'longitude', 'pollution_type', 'severity'
+            ).order_by().iterator(chunk_size=batch_size)
+            for lat, lng, pollution_type, severity in rows:
+                x, y = cell_for(lat, lng, zoom)
+                cell = cells[(x, y, pollution_type, severity)]
+                cell[0] += 1
+                cell[1] += lat
+                cell[2] += lng
+            AreaClusterCell.objects.bulk_create(
+                (
+                    AreaClusterCell(
+                        zoom=zoom, x=x, y=y, pollution_type=pollution_type, severity=severity,
+                        count=count, lat_sum=lat_sum, lng_sum=lng_sum,
+                    )
+                    for (x, y, pollution_type, severity), (count, lat_sum, lng_sum) in cells.items()
+                ),
+                batch_size=batch_size,
+            )
+            total += len(cells)
+    return total
+
+
+def get_clusters(bbox, zoom):
+    """Return cluster GeoJSON features for the cells intersecting a bbox at `zoom`"""
+    x0, y0, x1, y1 = tile_range(bbox, zoom + CELL_SHIFT)
+    rows = AreaClusterCell.objects.filter(
+        zoom=zoom, x__gte=x0, x__lte=x1, y__gte=y0, y__lte=y1
+    ).values_list('x', 'y', 'pollution_type', 'severity', 'count', 'lat_sum', 'lng_sum')
+
+    clusters = {}
+    for x, y, pollution_type, severity, count, lat_sum, lng_sum in rows:
+        cluster = clusters.setdefault((x, y), {
+            'count': 0, 'lat_sum': 0.0, 'lng_sum': 0.0, 'max_severity': 0, 'pollution_types': {},
+        })
+        cluster['count'] += count
+        cluster['lat_sum'] += lat_sum
+        cluster['lng_sum'] += lng_sum
+        cluster['max_severity'] = max(cluster['max_severity'], severity)
+        cluster['pollution_types'][pollution_type] = cluster['pollution_types'].get(pollution_type, 0) + count
+
+    features = []
+    for (x, y), cluster in clusters.items():
+        count = cluster['count']
+        features.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [cluster['lng_sum'] / count, cluster['lat_sum'] / count],
+            },
+            'properties': {
+                'cluster': True,
+                'cluster_id': f'{zoom}/{x}/{y}',
+                'count': count,
+                'max_severity': cluster['max_severity'],
+                'severity_color': severity_color(cluster['max_severity']),
+                'pollution_types': cluster['pollution_types'],
+                'expansion_zoom': zoom + 1,
+            },
+        })
+    return features
@@ -0,0 +1,252 @@
+"""
+Point-in-polygon lookup: which active areas contain a location.
+
+Each process keeps an in-memory index of the active areas. A PolygonIndex
+is an immutable R-tree packed with the Sort-Tile-Recursive algorithm over
+the polygon extents; candidates found through it are confirmed with a ray
+casting test vectorized over the polygon's edges and all points being
+tested against it. Point-only areas are matched when the location is
+within MAP_CONTAINMENT_POINT_RADIUS meters of them.
+
+The index is refreshed incrementally. When the data version changes (or
+MAP_CONTAINMENT_REFRESH seconds have passed, for changes made by other
+processes with a per-process cache) the areas written after the last synced
+change sequence number (see maps.sync) are loaded into a small overlay that
+shadows the packed tree, and deactivated or deleted ones are masked. Once
+the overlay grows too large, or the tombstones it would need were pruned,
+the tree is rebuilt.
+"""
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .cache import get_data_version
+from .geometry import decode_polygon
+from .models import AreaTombstone, ChangeSequence, PollutedArea
+from .nearby import haversine
+
+NODE_CAPACITY = 16
+
+# Most points accepted by one lookup
+MAX_LOOKUP_POINTS = 10000
+
+# The overlay is folded into a rebuilt tree past this share of the areas
+MAX_OVERLAY_SHARE = 0.1
+MIN_OVERLAY_REBUILD = 500
+
+METERS_PER_DEGREE = 111_320.0
+
+
+def point_radius():
+    return getattr(settings, 'MAP_CONTAINMENT_POINT_RADIUS', 50.0)
+
+
+def refresh_interval():
+    return getattr(settings, 'MAP_CONTAINMENT_REFRESH', 30)
+
+
+def points_in_ring(lats, lngs, ring):
+    """Boolean array telling which points lie inside a ring of [lat, lng] vertices"""
+    y1, x1 = ring[:, 0], ring[:, 1]
+    y2, x2 = np.roll(y1, -1), np.roll(x1, -1)
+    py, px = lats[:, None], lngs[:, None]
+    crosses = (y1 > py) != (y2 > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intersect_x = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+    return np.count_nonzero(crosses & (px < intersect_x), axis=1) % 2 == 1
+
+
+class PolygonIndex:
+    """
+    Static STR-packed R-tree over area extents.
+
+    `entries` are (id, ring, lat, lng) with ring an (n, 2) array of
+    [lat, lng] vertices, or None for point-only areas, which are indexed
+    by their buffer box instead.
+    """
+
+    def __init__(self, entries, buffer_radius):
+        self.buffer_radius = buffer_radius
+        self.size = len(entries)
+        boxes = np.array([self._box(entry) for entry in entries], dtype=float).reshape(-1, 4)
+        order = self._str_order(boxes)
+        self.ids = np.array([entries[i][0] for i in order], dtype=np.int64)
+        self.rings = [entries[i][1] for i in order]
+        self.points = np.array([entries[i][2:4] for i in order], dtype=float).reshape(-1, 2)
+        self.levels = [boxes[order]]
+        while len(self.levels[-1]) > 1:
+            self.levels.append(self._parent_boxes(self.levels[-1]))
+
+    def _box(self, entry):
+        area_id, ring, lat, lng = entry
+        if ring is not None:
+            return ring[:, 0].min(), ring[:, 1].min(), ring[:, 0].max(), ring[:, 1].max()
+        delta_lat = self.buffer_radius / METERS_PER_DEGREE
+        delta_lng = delta_lat / max(math.cos(math.radians(lat)), 1e-6)
+        return lat - delta_lat, lng - delta_lng, lat + delta_lat, lng + delta_lng
+
+    @staticmethod
+    def _str_order(boxes):
+        """Leaf order: vertical slices by center longitude, each sorted by center latitude"""
+        count = len(boxes)
+        if not count:
+            return np.zeros(0, dtype=np.int64)
+        center_lat = (boxes[:, 0] + boxes[:, 2]) / 2
+        center_lng = (boxes[:, 1] + boxes[:, 3]) / 2
+        slices = math.ceil(math.sqrt(math.ceil(count / NODE_CAPACITY)))
+        slice_size = slices * NODE_CAPACITY
+        by_lng = np.argsort(center_lng, kind='stable')
+        parts = []
+        for start in range(0, count, slice_size):
+            part = by_lng[start:start + slice_size]
+            parts.append(part[np.argsort(center_lat[part], kind='stable')])
+        return np.concatenate(parts)
+
+    @staticmethod
+    def _parent_boxes(boxes):
+        groups = range(0, len(boxes), NODE_CAPACITY)
+        return np.array([
+            (*boxes[start:start + NODE_CAPACITY, :2].min(axis=0), *boxes[start:start + NODE_CAPACITY, 2:].max(axis=0))
+            for start in groups
+        ])
+
+    def candidates(self, lat, lng):
+        """Leaf positions whose box contains the point"""
+        if not self.size:
+            return np.zeros(0, dtype=np.int64)
+        nodes = np.arange(len(self.levels[-1]))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[depth][nodes]
+            hits = (boxes[:, 0] <= lat) & (lat <= boxes[:, 2]) & (boxes[:, 1] <= lng) & (lng <= boxes[:, 3])
+            nodes = nodes[hits]
+            if depth:
+                count = len(self.levels[depth - 1])
+                nodes = np.concatenate([
+                    np.arange(node * NODE_CAPACITY, min((node + 1) * NODE_CAPACITY, count)) for node in nodes
+                ]) if len(nodes) else nodes
+        return nodes
+
+    def query(self, lats, lngs, masked=frozenset()):
+        """For each point, the ids of the areas containing it, skipping `masked` ids"""
+        pairs = {}
+        for point, (lat, lng) in enumerate(zip(lats, lngs)):
+            for leaf in self.candidates(lat, lng):
+                pairs.setdefault(int(leaf), []).append(point)
+
+        results = [[] for _ in range(len(lats))]
+        for leaf, points in pairs.items():
+            area_id = int(self.ids[leaf])
+            if area_id in masked:
+                continue
+            points = np.asarray(points)
+            ring = self.rings[leaf]
+            if ring is not None:
+                inside = points_in_ring(lats[points], lngs[points], ring)
+            else:
+                area_lat, area_lng = self.points[leaf]
+                inside = haversine(area_lat, area_lng, lats[points], lngs[points]) <= self.buffer_radius
+            for point in points[inside]:
+                results[point].append(area_id)
+        return results
+
+
+def _entries(queryset):
+    rows = queryset.values_list('id', 'polygon_data', 'polygon_vertex_count', 'latitude', 'longitude')
+    return [
+        (
+            area_id,
+            np.asarray(decode_polygon(data), dtype=float) if vertex_count >= 3 else None,
+            lat,
+            lng,
+        )
+        for area_id, data, vertex_count, lat, lng in rows.iterator(chunk_size=2000)
+    ]
+
+
+class ContainmentIndex:
+    """The per-process index: a packed tree, an overlay of recent changes and a mask"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._base = None
+
+    def _rebuild(self, version):
+        # `version` was read before loading, so changes committed meanwhile are synced again later
+        entries = _entries(PollutedArea.objects.filter(is_active=True))
+        self._base = PolygonIndex(entries, point_radius())
+        self._overlay_entries = {}
+        self._overlay = PolygonIndex([], point_radius())
+        self._masked = frozenset()
+        self._cursor = version
+
+    def _sync(self, version):
+        if self._cursor < ChangeSequence.current(ChangeSequence.AREAS_PRUNED):
+            self._rebuild(version)
+            return
+        # Every change up to the current sequence number has committed (see ChangeSequence)
+        window = {'change_seq__gt': self._cursor, 'change_seq__lte': version}
+        changed = PollutedArea.objects.filter(**window)
+        reload = _entries(changed.filter(is_active=True))
+        removed = set(changed.filter(is_active=False).values_list('id', flat=True))
+        removed.update(AreaTombstone.objects.filter(**window).values_list('area_id', flat=True))
+
+        overlay = {area_id: entry for area_id, entry in self._overlay_entries.items() if area_id not in removed}
+        overlay.update((entry[0], entry) for entry in reload)
+        masked = self._masked | removed | set(overlay)
+        if len(masked) > max(MIN_OVERLAY_REBUILD, MAX_OVERLAY_SHARE * self._base.size):
+            self._rebuild(version)
+            return
+
+        self._overlay_entries = overlay
+        self._overlay = PolygonIndex(list(overlay.values()), point_radius())
+        self._masked = frozenset(masked)
+        self._cursor = version
+
+    def refresh(self, force=False):
+        """Bring the index up to date with the database if the data may have changed"""
+        version = get_data_version()
+        with self._lock:
+            if self._base is None or force:
+                self._rebuild(version)
+            elif version != self._cursor or time.monotonic() - self._checked > refresh_interval():
+                self._sync(version)
+            else:
+                return
+            self._checked = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._base = None
+
+    def lookup(self, points):
+        """For each (lat, lng) point, the ids of the active areas containing it"""
+        self.refresh()
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        lats, lngs = points[:, 0], points[:, 1]
+        with self._lock:
+            base, overlay, masked = self._base, self._overlay, self._masked
+        results = base.query(lats, lngs, masked)
+        for result, extra in zip(results, overlay.query(lats, lngs)):
+            result.extend(extra)
+        return results
+
+
+_index = ContainmentIndex()
+
+
+def areas_containing(points):
+    """
+    Service entry point: ids of the active areas containing each point.
+
+    `points` is a sequence of (lat, lng) pairs; the result has one list of
+    area ids per point, in the same order.
+    """
+    return _index.lookup(points)
+
+
+def invalidate():
+    """Drop this process's index; it is rebuilt on the next lookup"""
+    _index.invalidate()
@@ -0,0 +1,191 @@
+"""
+Live change events for map clients.
+
+Once a transaction commits, saving or deleting an area, creating a
+report or changing its status and moderating reports in bulk publish a
+compact event to the broker. The
+events API streams them to every connected client as Server-Sent Events,
+keeping only the events whose extent intersects the client's bbox.
+
+A connection costs a Subscription with a small queue and one suspended
+coroutine, woken only by a matching event or the heartbeat. The default
+LocalBroker fans out within the process, which covers one ASGI worker;
+with several workers set MAP_EVENT_BROKER to a LocalBroker subclass whose
+publish() sends the event through a shared pub/sub (Redis, PostgreSQL
+LISTEN/NOTIFY) and which passes what it receives to deliver().
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Events queued for a slow client before its stream is ended (it reconnects and reloads)
+MAX_QUEUED_EVENTS = 100
+
+# Clients reconnect after this many milliseconds when a stream ends
+RECONNECT_DELAY = 5000
+
+
+class Event:
+    """An event serialized once, with the extents it is relevant to"""
+    __slots__ = ('name', 'payload', 'extents')
+
+    def __init__(self, name, data, extents):
+        self.name = name
+        self.payload = f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+        # (min_lat, min_lng, max_lat, max_lng) tuples, e.g. an area's old and new extent
+        self.extents = [extent for extent in extents if extent and None not in extent]
+
+    def intersects(self, bbox):
+        min_lng, min_lat, max_lng, max_lat = bbox
+        return any(
+            e_min_lat <= max_lat and e_max_lat >= min_lat and e_min_lng <= max_lng and e_max_lng >= min_lng
+            for e_min_lat, e_min_lng, e_max_lat, e_max_lng in self.extents
+        )
+
+
+class Subscription:
+    """One client's filtered view of the events; read and offered to on its event loop only"""
+
+    def __init__(self, bbox, loop):
+        self.bbox = bbox
+        self.loop = loop
+        self.queue = asyncio.Queue(MAX_QUEUED_EVENTS)
+
+    def wants(self, event):
+        return self.bbox is None or event.intersects(self.bbox)
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.close()
+
+    def close(self):
+        """End the stream after the events already read"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class LocalBroker:
+    """In-process publish/subscribe; publish() may be called from any thread"""
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, bbox=None):
+        """Subscribe the running event loop's caller to the events intersecting `bbox`"""
+        subscription = Subscription(bbox, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        self.deliver(event)
+
+    def deliver(self, event):
+        """Hand an event to the matching local subscriptions, with one callback per event loop"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        by_loop = defaultdict(list)
+        for subscription in subscriptions:
+            if subscription.wants(event):
+                by_loop[subscription.loop].append(subscription)
+        for loop, matching in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_offer_all, matching, event)
+            except RuntimeError:
+                # The loop was closed without the streams ending
+                for subscription in matching:
+                    self.unsubscribe(subscription)
+
+
+def _offer_all(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.offer(event)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'MAP_EVENT_BROKER', 'maps.events.LocalBroker'))()
+
+
+async def stream(bbox=None, disconnected=None):
+    """
+    Server-Sent Events body: the matching events as they come, with a
+    comment line every MAP_EVENTS_HEARTBEAT seconds to keep proxies from
+    timing out the idle connection. Ends when `disconnected` (an
+    asyncio.Event) is set, or when the client falls too far behind.
+    """
+    broker = get_broker()
+    heartbeat = getattr(settings, 'MAP_EVENTS_HEARTBEAT', 20)
+    subscription = broker.subscribe(bbox)
+    watcher = None
+    if disconnected is not None:
+        watcher = asyncio.ensure_future(disconnected.wait())
+        watcher.add_done_callback(lambda _: subscription.close())
+    try:
+        yield f'retry: {RECONNECT_DELAY}\n\n'.encode()
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b': heartbeat\n\n'
+                continue
+            if event is None:
+                return
+            yield event.payload
+    finally:
+        broker.unsubscribe(subscription)
+        if watcher is not None:
+            watcher.cancel()
+
+
+def area_event(area, action, extents):
+    """Event for an area that was `created`, `updated` or `deleted` (or deactivated)"""
+    data = {'action': action, 'id': area.pk}
+    if action != 'deleted':
+        data.update({
+            'name': area.name,
+            'pollution_type': area.pollution_type,
+            'severity': area.severity,
+            'latitude': area.latitude,
+            'longitude': area.longitude,
+        })
+    return Event('area', data, extents)
+
+
+def report_event(report, action, extent):
+    """Event for a report that was `created` or changed `status`"""
+    return Event('report', {
+        'action': action,
+        'id': report.pk,
+        'area_id': report.polluted_area_id,
+        'title': report.title,
+        'status': report.status,
+    }, [extent])
+
+
+def moderation_event(status, count, area_extents):
+    """Event for `count` reports of several areas moved to `status` at once, given {area id: extent}"""
+    return Event('report', {
+        'action': 'moderated',
+        'status': status,
+        'count': count,
+        'area_ids': sorted(area_extents),
+    }, area_extents.values())
+
+
+def reload_event():
+    """Event telling every client to reload, after areas were written in bulk"""
+    return Event('reload', {}, [(-90.0, -180.0, 90.0, 180.0)])
@@ -0,0 +1,329 @@
+"""
+Bulk export of polluted areas with their reports.
+
+Areas are read as `.values()` rows in primary key order, one chunk at a
+time, and the reports of each chunk are fetched with a single `__in` query,
+so memory stays flat however large the table is. Filters are applied in the
+database. Three output formats are written as byte chunks:
+
+csv         One row per area; its reports are a JSON list in `reports`.
+geojsonseq  One GeoJSON feature per line with the reports in its properties.
+columnar    Column-oriented binary, see write_columnar_block() below.
+"""
+import csv
+import io
+import json
+import struct
+import sys
+from array import array
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .geometry import decode_polygon
+from .models import PollutedArea, PollutionReport
+
+FORMATS = ('csv', 'geojsonseq', 'columnar')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'geojsonseq': 'application/geo+json-seq',
+    'columnar': 'application/octet-stream',
+}
+
+EXTENSIONS = {'csv': 'csv', 'geojsonseq': 'geojsons', 'columnar': 'col'}
+
+EXPORT_CHUNK_SIZE = 2000
+
+AREA_FIELDS = (
+    'id', 'external_id', 'name', 'description', 'pollution_type', 'severity', 'latitude', 'longitude',
+    'area_size', 'polygon_data', 'is_active', 'created_at', 'updated_at', 'created_by__username',
+)
+
+REPORT_FIELDS = (
+    'id', 'polluted_area_id', 'title', 'description', 'status', 'created_at',
+    'reporter__username', 'verified_by__username', 'verified_at',
+)
+
+CSV_COLUMNS = (
+    'id', 'external_id', 'name', 'description', 'pollution_type', 'severity', 'latitude', 'longitude',
+    'area_size', 'polygon', 'is_active', 'created_at', 'updated_at', 'created_by', 'report_count', 'reports',
+)
+
+
+def parse_filters(params):
+    """
+    Validate export filters from a query dict or command options.
+
+    Accepts `type` (comma separated pollution types), `min_severity`,
+    `max_severity`, `since` and `until` (inclusive YYYY-MM-DD days of
+    creation) and `include_inactive`. Raises ValueError.
+    """
+    filters = {}
+    if params.get('type'):
+        types = [value.strip() for value in params['type'].split(',') if value.strip()]
+        known = {value for value, _ in PollutedArea.POLLUTION_TYPES}
+        unknown = set(types) - known
+        if unknown:
+            raise ValueError(f"Unknown pollution type: {', '.join(sorted(unknown))}")
+        filters['types'] = types
+    for name in ('min_severity', 'max_severity'):
+        if params.get(name) not in (None, ''):
+            filters[name] = int(params[name])
+    for name in ('since', 'until'):
+        if params.get(name):
+            filters[name] = date.fromisoformat(str(params[name]))
+    if filters.get('since') and filters.get('until') and filters['since'] > filters['until']:
+        raise ValueError('since must not be after until')
+    filters['include_inactive'] = str(params.get('include_inactive', '')).lower() in ('1', 'true', 'yes')
+    return filters
+
+
+def _day_start(day):
+    value = datetime.combine(day, time.min)
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+
+def filter_areas(queryset, types=None, min_severity=None, max_severity=None, since=None, until=None,
+                 include_inactive=False):
+    if not include_inactive:
+        queryset = queryset.filter(is_active=True)
+    if types:
+        queryset = queryset.filter(pollution_type__in=types)
+    if min_severity is not None:
+        queryset = queryset.filter(severity__gte=min_severity)
+    if max_severity is not None:
+        queryset = queryset.filter(severity__lte=max_severity)
+    if since:
+        queryset = queryset.filter(created_at__gte=_day_start(since))
+    if until:
+        queryset = queryset.filter(created_at__lt=_day_start(until + timedelta(days=1)))
+    return queryset
+
+
+def iter_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of (area row, [report rows]), paging through the areas by primary key"""
+    rows = queryset.order_by('pk').values(*AREA_FIELDS)
+    last_id = 0
+    while True:
+        areas = list(rows.filter(pk__gt=last_id)[:chunk_size])
+        if not areas:
+            return
+        last_id = areas[-1]['id']
+        reports = {}
+        report_rows = PollutionReport.objects.filter(
+            polluted_area_id__in=[area['id'] for area in areas]
+        ).order_by('polluted_area_id', 'pk').values(*REPORT_FIELDS)
+        for report in report_rows:
+            reports.setdefault(report['polluted_area_id'], []).append(report)
+        yield [(area, reports.get(area['id'], [])) for area in areas]
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def report_dict(report):
+    return {
+        'id': report['id'],
+        'title': report['title'],
+        'description': report['description'],
+        'status': report['status'],
+        'created_at': _isoformat(report['created_at']),
+        'reporter': report['reporter__username'],
+        'verified_by': report['verified_by__username'],
+        'verified_at': _isoformat(report['verified_at']),
+    }
+
+
+def area_properties(area, reports):
+    return {
+        'id': area['id'],
+        'external_id': area['external_id'],
+        'name': area['name'],
+        'description': area['description'],
+        'pollution_type': area['pollution_type'],
+        'severity': area['severity'],
+        'area_size': area['area_size'],
+        'is_active': area['is_active'],
+        'created_at': _isoformat(area['created_at']),
+        'updated_at': _isoformat(area['updated_at']),
+        'created_by': area['created_by__username'],
+        'reports': [report_dict(report) for report in reports],
+    }
+
+
+def iter_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue().encode()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        for area, reports in chunk:
+            polygon = decode_polygon(area['polygon_data'])
+            writer.writerow([
+                area['id'], area['external_id'] or '', area['name'], area['description'],
+                area['pollution_type'], area['severity'], area['latitude'], area['longitude'],
+                '' if area['area_size'] is None else area['area_size'],
+                json.dumps(polygon) if polygon else '', int(area['is_active']),
+                _isoformat(area['created_at']), _isoformat(area['updated_at']), area['created_by__username'],
+                len(reports), json.dumps([report_dict(report) for report in reports], ensure_ascii=False),
+            ])
+        yield buffer.getvalue().encode()
+
+
+def iter_geojsonseq(chunks):
+    for chunk in chunks:
+        lines = []
+        for area, reports in chunk:
+            polygon = decode_polygon(area['polygon_data'])
+            if polygon:
+                geometry = {'type': 'Polygon', 'coordinates': [[[lng, lat] for lat, lng in polygon]]}
+            else:
+                geometry = {'type': 'Point', 'coordinates': [area['longitude'], area['latitude']]}
+            feature = {'type': 'Feature', 'geometry': geometry, 'properties': area_properties(area, reports)}
+            lines.append(json.dumps(feature, ensure_ascii=False) + '\n')
+        yield ''.join(lines).encode()
+
+
+# Columnar format. The stream starts with COLUMNAR_MAGIC and is followed by
+# blocks, one per table and chunk: a one byte table tag (b'A' areas,
+# b'R' reports), a little-endian uint32 header length and a JSON header
+# {"rows": n, "columns": [[name, type], ...]}, then each column in order:
+#
+#   i4, i8, f8   n little-endian values; missing f8 values are NaN and
+#                missing i8 timestamps (microseconds since the epoch) are
+#                COLUMNAR_NULL
+#   str, bytes   n + 1 uint32 offsets followed by the concatenated UTF-8
+#                strings or raw bytes; missing values are empty
+#
+# Polygons are the stored polygon_data: packed int32 (lat, lng) pairs in
+# units of 1e-7 degrees.
+COLUMNAR_MAGIC = b'PTCOL1\n'
+COLUMNAR_NULL = -2 ** 63
+
+AREA_COLUMNS = (
+    ('id', 'i8'), ('external_id', 'str'), ('name', 'str'), ('description', 'str'),
+    ('pollution_type', 'str'), ('severity', 'i4'), ('latitude', 'f8'), ('longitude', 'f8'),
+    ('area_size', 'f8'), ('polygon', 'bytes'), ('is_active', 'i4'), ('created_at', 'i8'),
+    ('updated_at', 'i8'), ('created_by', 'str'),
+)
+
+REPORT_COLUMNS = (
+    ('id', 'i8'), ('area_id', 'i8'), ('title', 'str'), ('description', 'str'), ('status', 'str'),
+    ('created_at', 'i8'), ('reporter', 'str'), ('verified_by', 'str'), ('verified_at', 'i8'),
+)
+
+ARRAY_TYPES = {'i4': 'i', 'i8': 'q', 'f8': 'd'}
+
+
+def _timestamp(value):
+    if value is None:
+        return COLUMNAR_NULL
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return int(value.timestamp() * 1_000_000)
+
+
+def _pack(values, code):
+    packed = array(code, values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _encode_column(values, column_type):
+    if column_type in ARRAY_TYPES:
+        return _pack(values, ARRAY_TYPES[column_type])
+    if column_type == 'str':
+        values = [(value or '').encode() for value in values]
+    else:
+        values = [bytes(value) if value else b'' for value in values]
+    offsets = [0]
+    for value in values:
+        offsets.append(offsets[-1] + len(value))
+    return _pack(offsets, 'I') + b''.join(values)
+
+
+def write_columnar_block(tag, columns, data):
+    """Encode one block; `data` maps column names to lists of values"""
+    rows = len(data[columns[0][0]])
+    header = json.dumps({'rows': rows, 'columns': [list(column) for column in columns]}).encode()
+    parts = [tag, struct.pack('<I', len(header)), header]
+    parts.extend(_encode_column(data[name], column_type) for name, column_type in columns)
+    return b''.join(parts)
+
+
+def iter_columnar(chunks):
+    yield COLUMNAR_MAGIC
+    for chunk in chunks:
+        areas = [area for area, _ in chunk]
+        reports = [report for _, area_reports in chunk for report in area_reports]
+        yield write_columnar_block(b'A', AREA_COLUMNS, {
+            'id': [area['id'] for area in areas],
+            'external_id': [area['external_id'] for area in areas],
+            'name': [area['name'] for area in areas],
+            'description': [area['description'] for area in areas],
+            'pollution_type': [area['pollution_type'] for area in areas],
+            'severity': [area['severity'] for area in areas],
+            'latitude': [area['latitude'] for area in areas],
+            'longitude': [area['longitude'] for area in areas],
+            'area_size': [float('nan') if area['area_size'] is None else area['area_size'] for area in areas],
+            'polygon': [area['polygon_data'] for area in areas],
+            'is_active': [int(area['is_active']) for area in areas],
+            'created_at': [_timestamp(area['created_at']) for area in areas],
+            'updated_at': [_timestamp(area['updated_at']) for area in areas],
+            'created_by': [area['created_by__username'] for area in areas],
+        })
+        if reports:
+            yield write_columnar_block(b'R', REPORT_COLUMNS, {
+                'id': [report['id'] for report in reports],
+                'area_id': [report['polluted_area_id'] for report in reports],
+                'title': [report['title'] for report in reports],
+                'description': [report['description'] for report in reports],
+                'status': [report['status'] for report in reports],
+                'created_at': [_timestamp(report['created_at']) for report in reports],
+                'reporter': [report['reporter__username'] for report in reports],
+                'verified_by': [report['verified_by__username'] for report in reports],
+                'verified_at': [_timestamp(report['verified_at']) for report in reports],
+            })
+
+
+def read_columnar(stream):
+    """Decode a columnar export, yielding (tag, {column: values}) per block"""
+    if stream.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError('Not a columnar export')
+    while True:
+        tag = stream.read(1)
+        if not tag:
+            return
+        header = json.loads(stream.read(struct.unpack('<I', stream.read(4))[0]))
+        rows = header['rows']
+        block = {}
+        for name, column_type in header['columns']:
+            if column_type in ARRAY_TYPES:
+                values = array(ARRAY_TYPES[column_type])
+                values.frombytes(stream.read(rows * values.itemsize))
+            else:
+                values = array('I')
+                values.frombytes(stream.read((rows + 1) * values.itemsize))
+            if sys.byteorder != 'little':
+                values.byteswap()
+            if column_type not in ARRAY_TYPES:
+                data = stream.read(values[-1])
+                values = [data[values[i]:values[i + 1]] for i in range(rows)]
+                if column_type == 'str':
+                    values = [value.decode() for value in values]
+            block[name] = list(values)
+        yield tag, block
+
+
+WRITERS = {'csv': iter_csv, 'geojsonseq': iter_geojsonseq, 'columnar': iter_columnar}
+
+
+def export(queryset, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Encoded chunks of `queryset` exported in `file_format`"""
+    return WRITERS[file_format](iter_chunks(queryset, chunk_size))
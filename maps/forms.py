@@ -2,6 +2,9 @@ from django import forms
 from django.utils.translation import gettext_lazy as _
 from .models import PollutedArea, PollutionReport
 
+# Computed from the polygon on save (PollutedArea.update_measurements)
+DERIVED_FIELDS = ('area_size', 'latitude', 'longitude')
+
 
 class PollutedAreaForm(forms.ModelForm):
     latitude = forms.FloatField(
@@ -40,6 +43,13 @@ class PollutedAreaForm(forms.ModelForm):
             widget=forms.HiddenInput(),
             required=False
         )
+        # For polygon areas the derived fields are shown but not taken from the input
+        # (the map's add form disables them in the browser once a polygon is drawn)
+        if self.instance.has_polygon():
+            for name in DERIVED_FIELDS:
+                self.fields[name].disabled = True
+                self.fields[name].required = False
+                self.fields[name].help_text = _('Computed from the polygon')
 
 
 class PollutionReportForm(forms.ModelForm):
@@ -0,0 +1,139 @@
+"""
+GeoJSON serialization of polluted areas from `.values()` rows.
+
+Working from plain rows avoids instantiating models, and the generators
+below let large result sets be streamed with flat memory.
+"""
+import json
+
+from django.urls import reverse
+
+from .geometry import decode_polygon, lod_geometry
+from .models import PollutedArea, severity_color
+
+# Columns needed to build a feature besides its geometry, see feature_values()
+FEATURE_FIELDS = (
+    'id', 'name', 'description', 'pollution_type', 'severity', 'latitude', 'longitude',
+    'created_at', 'created_by__username', 'image',
+)
+
+STREAM_CHUNK_SIZE = 2000
+
+# Flush streamed output in chunks of roughly this many bytes
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+def pollution_type_labels():
+    """Display labels for pollution types in the active language"""
+    return {value: str(label) for value, label in PollutedArea.POLLUTION_TYPES}
+
+
+def area_feature(row, labels):
+    coordinates = decode_polygon(row['geometry'])
+    if coordinates:
+        geometry = {
+            'type': 'Polygon',
+            'coordinates': [coordinates]
+        }
+    else:
+        geometry = {
+            'type': 'Point',
+            'coordinates': [row['longitude'], row['latitude']]
+        }
+
+    return {
+        'type': 'Feature',
+        'geometry': geometry,
+        'properties': {
+            'id': row['id'],
+            'name': row['name'],
+            'pollution_type': labels.get(row['pollution_type'], row['pollution_type']),
+            'severity': row['severity'],
+            'severity_color': severity_color(row['severity']),
+            'description': row['description'],
+            'created_at': row['created_at'].isoformat(),
+            'created_by': row['created_by__username'],
+            'has_polygon': bool(coordinates),
+            'image_url': reverse('maps:area_image', args=[row['id'], 'popup', 'webp']) if row['image'] else None
+        }
+    }
+
+
+def feature_values(queryset, zoom=None):
+    """Rows for area_feature(), with the polygon simplified for `zoom` when given"""
+    return queryset.values(*FEATURE_FIELDS, geometry=lod_geometry(zoom))
+
+
+def feature_rows(queryset, zoom=None, chunk_size=STREAM_CHUNK_SIZE):
+    return feature_values(queryset, zoom).iterator(chunk_size=chunk_size)
+
+
+def afeature_rows(queryset, zoom=None, chunk_size=STREAM_CHUNK_SIZE):
+    return feature_values(queryset, zoom).aiterator(chunk_size=chunk_size)
+
+
+def _buffered(pieces):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_BUFFER_SIZE:
+            yield ''.join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def iter_feature_collection(rows, labels):
+    """Yield a FeatureCollection document as encoded chunks"""
+    def pieces():
+        yield '{"type": "FeatureCollection", "features": ['
+        for index, row in enumerate(rows):
+            if index:
+                yield ', '
+            yield json.dumps(area_feature(row, labels))
+        yield ']}'
+    return _buffered(pieces())
+
+
+def iter_feature_sequence(rows, labels):
+    """Yield newline-delimited GeoJSON features (GeoJSONSeq) as encoded chunks"""
+    return _buffered(json.dumps(area_feature(row, labels)) + '\n' for row in rows)
+
+
+async def _abuffered(pieces):
+    buffer = []
+    size = 0
+    async for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_BUFFER_SIZE:
+            yield ''.join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def aiter_feature_collection(rows, labels):
+    """Async version of iter_feature_collection() over async `rows`"""
+    async def pieces():
+        yield '{"type": "FeatureCollection", "features": ['
+        first = True
+        async for row in rows:
+            if not first:
+                yield ', '
+            first = False
+            yield json.dumps(area_feature(row, labels))
+        yield ']}'
+    return _abuffered(pieces())
+
+
+def aiter_feature_sequence(rows, labels):
+    """Async version of iter_feature_sequence() over async `rows`"""
+    async def pieces():
+        async for row in rows:
+            yield json.dumps(area_feature(row, labels)) + '\n'
+    return _abuffered(pieces())
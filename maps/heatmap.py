@@ -0,0 +1,148 @@
+"""
+Severity-weighted density rasters of the active areas.
+
+The points of all active areas are held in memory as NumPy arrays already
+projected to normalized Web Mercator, and reloaded only when the data
+version changes. A raster bins them with histogram2d (weighted by
+severity) over the requested bbox plus a margin, blurs the counts with a
+separable Gaussian kernel and crops the margin, so density near the edges
+includes areas just outside and adjacent tiles line up. Rows run north to
+south, as in an image.
+"""
+import io
+import threading
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .cache import api_cache, get_data_version
+from .models import PollutedArea
+from .spatial import MAX_LATITUDE
+
+MAX_GRID_SIZE = 1024
+MAX_BLUR_RADIUS = 32
+DEFAULT_BLUR_RADIUS = 8
+
+# Color ramp from low to high intensity as (position, RGBA)
+COLOR_RAMP = (
+    (0.0, (40, 167, 69, 0)),
+    (0.2, (40, 167, 69, 140)),
+    (0.45, (255, 193, 7, 180)),
+    (0.7, (253, 126, 20, 210)),
+    (0.9, (220, 53, 69, 230)),
+    (1.0, (111, 66, 193, 240)),
+)
+
+
+def heatmap_scale():
+    """Density at which the PNG intensity reaches ~63%, in severity units per pixel"""
+    return getattr(settings, 'MAP_HEATMAP_SCALE', 0.05)
+
+
+class PointArrays:
+    """Projected points of the active areas, reloaded when the data version changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self.x = self.y = self.weights = self.types = np.zeros(0)
+
+    def load(self):
+        rows = list(PollutedArea.objects.filter(is_active=True).order_by().values_list(
+            'longitude', 'latitude', 'severity', 'pollution_type'
+        ).iterator(chunk_size=5000))
+        coordinates = np.array([row[:3] for row in rows], dtype=float).reshape(-1, 3)
+        lat = np.radians(np.clip(coordinates[:, 1], -MAX_LATITUDE, MAX_LATITUDE))
+        self.x = (np.clip(coordinates[:, 0], -180.0, 180.0) + 180.0) / 360.0
+        self.y = (1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0
+        self.weights = coordinates[:, 2]
+        self.types = np.array([row[3] for row in rows], dtype=object)
+
+    def current(self, version):
+        with self._lock:
+            if version != self._version:
+                self.load()
+                self._version = version
+            return self.x, self.y, self.weights, self.types
+
+
+_points = PointArrays()
+
+
+def gaussian_kernel(radius):
+    """Normalized 1D Gaussian with sigma = radius / 3, 2 * radius + 1 taps"""
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (offsets / max(radius / 3.0, 1e-9)) ** 2)
+    return kernel / kernel.sum()
+
+
+def blur(grid, radius):
+    """Separable Gaussian blur; the result is smaller by `radius` on every side"""
+    if radius <= 0:
+        return grid
+    kernel = gaussian_kernel(radius)
+    taps = len(kernel)
+    rows = sum(kernel[i] * grid[:, i:grid.shape[1] - taps + 1 + i] for i in range(taps))
+    return sum(kernel[i] * rows[i:rows.shape[0] - taps + 1 + i, :] for i in range(taps))
+
+
+def density_grid(bounds, width, height, radius=DEFAULT_BLUR_RADIUS, types=None, version=None):
+    """
+    Blurred severity-weighted counts over normalized Mercator `bounds`.
+
+    `bounds` is (x0, y0, x1, y1) with y pointing south; returns a float32
+    array of shape (height, width). Pass the data `version` if it is
+    already known to save reading it again.
+    """
+    if version is None:
+        version = get_data_version()
+    x, y, weights, point_types = _points.current(version)
+    if types:
+        mask = np.isin(point_types, list(types))
+        x, y, weights = x[mask], y[mask], weights[mask]
+    x0, y0, x1, y1 = bounds
+    pixel_x = (x1 - x0) / width
+    pixel_y = (y1 - y0) / height
+    counts, _, _ = np.histogram2d(
+        y, x,
+        bins=[height + 2 * radius, width + 2 * radius],
+        range=[[y0 - radius * pixel_y, y1 + radius * pixel_y], [x0 - radius * pixel_x, x1 + radius * pixel_x]],
+        weights=weights,
+    )
+    return blur(counts, radius).astype(np.float32)
+
+
+def colorize(grid):
+    """RGBA image of a density grid through COLOR_RAMP"""
+    intensity = 1.0 - np.exp(-grid / heatmap_scale())
+    positions = [position for position, _ in COLOR_RAMP]
+    channels = [
+        np.interp(intensity, positions, [color[channel] for _, color in COLOR_RAMP])
+        for channel in range(4)
+    ]
+    rgba = np.stack(channels, axis=-1).round().astype(np.uint8)
+    return Image.fromarray(rgba, 'RGBA')
+
+
+def encode(grid, output_format):
+    if output_format == 'png':
+        output = io.BytesIO()
+        colorize(grid).save(output, 'PNG', optimize=True)
+        return output.getvalue()
+    return grid.astype('<f4').tobytes()
+
+
+def render(bounds, width, height, radius, types, output_format):
+    """Encoded raster, cached per data version and parameters"""
+    version = get_data_version()
+    key = 'maps:heatmap:{}:{}:{}x{}:{}:{}:{}'.format(
+        version, ','.join(f'{value:.9f}' for value in bounds), width, height, radius,
+        ','.join(sorted(types or ())), output_format,
+    )
+    cache = api_cache()
+    content = cache.get(key)
+    if content is None:
+        content = encode(density_grid(bounds, width, height, radius, types, version), output_format)
+        cache.set(key, content, getattr(settings, 'MAP_API_CACHE_TIMEOUT', 60 * 60))
+    return content
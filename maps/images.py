@@ -0,0 +1,142 @@
+"""
+Resized derivatives of uploaded area photos.
+
+Every image gets a WebP and a JPEG copy at each size in DERIVATIVE_SIZES,
+with its EXIF orientation applied. Derivative names are derived from the
+source name, size and quality, so they are found again without any
+bookkeeping and a replaced photo simply gets new ones. They are generated
+in a background thread after the upload is committed (see maps.signals),
+and on demand by the area_image view if a page asks for one that is
+missing.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name: (max width, max height, crop to fill)
+DERIVATIVE_SIZES = {
+    'thumbnail': (160, 160, True),
+    'popup': (320, 240, False),
+    'detail': (1280, 1280, False),
+}
+
+# extension: (Pillow format, content type)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+
+DERIVATIVE_DIR = 'pollution_images/derivatives'
+
+# Raised by generate() for missing, corrupt or oversized source images
+UNREADABLE_IMAGE_ERRORS = (OSError, Image.DecompressionBombError)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def image_quality():
+    return getattr(settings, 'MAP_IMAGE_QUALITY', 80)
+
+
+def derivative_name(source_name, size, extension):
+    """Storage name of a derivative, stable for a given source, size and quality"""
+    width, height, crop = DERIVATIVE_SIZES[size]
+    digest = hashlib.sha1(f'{source_name}|{width}x{height}|{crop}|{image_quality()}'.encode()).hexdigest()
+    stem = os.path.splitext(os.path.basename(source_name))[0][:40]
+    return f'{DERIVATIVE_DIR}/{digest[:2]}/{stem}-{digest[:12]}-{size}.{extension}'
+
+
+def derivative_exists(source_name, size, extension):
+    return default_storage.exists(derivative_name(source_name, size, extension))
+
+
+def derivative_url(source_name, size, extension):
+    return default_storage.url(derivative_name(source_name, size, extension))
+
+
+def _render(image, size, pil_format):
+    width, height, crop = DERIVATIVE_SIZES[size]
+    if crop:
+        resized = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+    else:
+        resized = image.copy()
+        resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    resized.save(output, pil_format, quality=image_quality(), optimize=pil_format == 'JPEG')
+    return output.getvalue()
+
+
+def generate(source_name, force=False):
+    """Write the missing derivatives of an image (all of them if `force`). Returns how many were written."""
+    targets = [
+        (size, extension, derivative_name(source_name, size, extension))
+        for size in DERIVATIVE_SIZES
+        for extension in DERIVATIVE_FORMATS
+    ]
+    if not force:
+        targets = [target for target in targets if not default_storage.exists(target[2])]
+    if not targets:
+        return 0
+
+    with default_storage.open(source_name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        # JPEG has no alpha channel: flatten transparent images onto white
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+
+    for size, extension, name in targets:
+        content = _render(image, size, DERIVATIVE_FORMATS[extension][0])
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(content))
+    return len(targets)
+
+
+def _generate_in_background(source_name):
+    try:
+        generate(source_name)
+    except Exception:
+        logger.exception('Could not generate derivatives of %s', source_name)
+    finally:
+        with _executor_lock:
+            _pending.discard(source_name)
+
+
+def schedule(source_name):
+    """Generate the derivatives of an image in a background thread"""
+    global _executor
+    with _executor_lock:
+        if source_name in _pending:
+            return
+        _pending.add(source_name)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MAP_IMAGE_WORKERS', 2), thread_name_prefix='image-derivatives'
+            )
+    _executor.submit(_generate_in_background, source_name)
+
+
+def ensure(source_name, size, extension):
+    """Name of a derivative, generating the image's derivatives now if it is missing"""
+    name = derivative_name(source_name, size, extension)
+    if not default_storage.exists(name):
+        generate(source_name)
+    return name
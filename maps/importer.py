@@ -0,0 +1,164 @@
+"""
+Bulk import of polluted areas from CSV, GeoJSON and NDJSON files.
+
+Source records are normalized to the fields of PollutedAreaForm, validated
+with that form and turned into ready-to-insert field values (packed polygon,
+levels of detail, extent and quadkey included). parse_batch() does all of
+this without touching the database so it can run in worker processes; the
+import_areas command then upserts the results by external_id.
+"""
+import csv
+import json
+import os
+
+from .forms import PollutedAreaForm
+from .models import PollutedArea
+
+FORMATS = ('csv', 'geojson', 'ndjson')
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.geojson': 'geojson',
+    '.json': 'geojson',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.geojsonl': 'ndjson',
+    '.geojsons': 'ndjson',
+}
+
+FORM_FIELDS = ('name', 'description', 'pollution_type', 'severity', 'latitude', 'longitude', 'area_size')
+
+# Fields overwritten when a record with a known external_id is imported again
+UPSERT_FIELDS = (
+    'name', 'description', 'pollution_type', 'severity', 'latitude', 'longitude', 'area_size',
+    'polygon_data', 'polygon_vertex_count', 'polygon_lod_low', 'polygon_lod_mid', 'polygon_lod_high',
+    'min_lat', 'min_lng', 'max_lat', 'max_lng', 'quadkey', 'updated_at',
+)
+
+
+def detect_format(path):
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+class MalformedRecord:
+    """Placeholder for a source line that is not valid JSON; parse_record() reports it as invalid"""
+
+    def __init__(self, line, error):
+        self.line = line
+        self.error = error
+
+    def __str__(self):
+        return f'line {self.line}: invalid JSON: {self.error}'
+
+
+def read_records(path, file_format):
+    """Yield raw source records as dicts (or MalformedRecord for bad NDJSON lines), in file order"""
+    if file_format == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as source:
+            yield from csv.DictReader(source)
+    elif file_format == 'geojson':
+        with open(path, encoding='utf-8') as source:
+            data = json.load(source)
+        if data.get('type') == 'FeatureCollection':
+            yield from data.get('features') or []
+        else:
+            yield data
+    elif file_format == 'ndjson':
+        with open(path, encoding='utf-8') as source:
+            for number, line in enumerate(source, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as error:
+                    yield MalformedRecord(number, error)
+    else:
+        raise ValueError(f'Unknown format: {file_format}')
+
+
+def normalize_record(record):
+    """
+    Map a CSV row, GeoJSON feature or flat JSON object to form data.
+
+    Features may have a Point or Polygon geometry ([lng, lat] positions);
+    the form's latitude/longitude default to the point or the polygon's
+    vertex mean, which update_measurements() then replaces with the
+    centroid. CSV rows carry the polygon as a JSON list of [lat, lng]
+    pairs in a `polygon` column.
+    """
+    if record.get('type') == 'Feature':
+        properties = dict(record.get('properties') or {})
+        properties.setdefault('external_id', record.get('id'))
+        geometry = record.get('geometry') or {}
+        coordinates = geometry.get('coordinates')
+        if geometry.get('type') == 'Point' and coordinates:
+            properties.setdefault('longitude', coordinates[0])
+            properties.setdefault('latitude', coordinates[1])
+        elif geometry.get('type') == 'Polygon' and coordinates:
+            ring = [[position[1], position[0]] for position in coordinates[0]]
+            if len(ring) > 1 and ring[0] == ring[-1]:
+                ring.pop()
+            properties['polygon'] = ring
+            if ring:
+                properties.setdefault('latitude', sum(lat for lat, _ in ring) / len(ring))
+                properties.setdefault('longitude', sum(lng for _, lng in ring) / len(ring))
+        record = properties
+
+    data = {field: record.get(field) for field in FORM_FIELDS if record.get(field) not in (None, '')}
+    polygon = record.get('polygon') or record.get('polygon_coordinates')
+    if isinstance(polygon, str):
+        polygon = json.loads(polygon)
+    external_id = record.get('external_id')
+    return data, polygon or None, str(external_id) if external_id not in (None, '') else None
+
+
+def _check_polygon(polygon):
+    if not isinstance(polygon, list) or len(polygon) < 3:
+        raise ValueError('polygon needs at least three [lat, lng] pairs')
+    coordinates = []
+    for pair in polygon:
+        lat, lng = (float(value) for value in pair)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError(f'polygon vertex out of range: {pair}')
+        coordinates.append([lat, lng])
+    return coordinates
+
+
+def parse_record(record):
+    """Return (field values, None) for a valid record or (None, errors)"""
+    if isinstance(record, MalformedRecord):
+        return None, {'__all__': [str(record)]}
+    try:
+        data, polygon, external_id = normalize_record(record)
+        if polygon is not None:
+            polygon = _check_polygon(polygon)
+    except (ValueError, TypeError, AttributeError) as error:
+        return None, {'__all__': [str(error)]}
+
+    form = PollutedAreaForm(data=data)
+    if not form.is_valid():
+        return None, {field: [str(message) for message in messages] for field, messages in form.errors.items()}
+    area = form.instance
+    area.external_id = external_id
+    if polygon is not None:
+        area.set_polygon_coordinates(polygon)
+    area.update_measurements()
+    area.update_bounds()
+    values = {field: getattr(area, field) for field in UPSERT_FIELDS if field != 'updated_at'}
+    values['external_id'] = external_id
+    return values, None
+
+
+def parse_batch(batch):
+    """Worker: parse a list of (record number, raw record) pairs"""
+    results = []
+    for number, record in batch:
+        values, errors = parse_record(record)
+        results.append((number, values, errors))
+    return results
+
+
+def build_areas(values_list, user):
+    """Unsaved PollutedArea instances for bulk_create"""
+    return [PollutedArea(created_by=user, **values) for values in values_list]
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from maps.models import PollutedArea
+
+
+def _percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+class Command(BaseCommand):
+    help = 'Compare the throughput of the read API endpoints through the WSGI and ASGI handlers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username the requests are made as')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and handler')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to benchmark (repeatable); defaults to the areas, area and stats APIs')
+        parser.add_argument('--uncached', action='store_true',
+                            help='Make every URL unique so the areas API response cache is never hit')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            self.user = User.objects.get(**{User.USERNAME_FIELD: options['user']})
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {options['user']}")
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+
+        paths = options['paths'] or self._default_paths()
+        self.uncached = options['uncached']
+        self.stdout.write(f"{'path':<48} {'handler':<7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6}")
+        # The test clients send Host: testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for path in paths:
+                for handler, run in (('wsgi', self._run_wsgi), ('asgi', self._run_asgi)):
+                    elapsed, latencies, errors = run(path, options['requests'], options['concurrency'])
+                    self.stdout.write(
+                        f'{path[:48]:<48} {handler:<7} {len(latencies) / elapsed:>9.1f} '
+                        f'{_percentile(latencies, 0.5) * 1000:>8.1f} {_percentile(latencies, 0.95) * 1000:>8.1f} '
+                        f'{errors:>6}'
+                    )
+
+    def _default_paths(self):
+        paths = [reverse('maps:areas_json') + '?cluster=0', reverse('maps:areas_json') + '?zoom=6']
+        area_id = PollutedArea.objects.filter(is_active=True).values_list('pk', flat=True).first()
+        if area_id:
+            paths.append(reverse('maps:area_json', args=[area_id]))
+        paths.append(reverse('dashboard:stats_json'))
+        return paths
+
+    def _url(self, path, number):
+        if not self.uncached:
+            return path
+        return f"{path}{'&' if '?' in path else '?'}_bench={time.time_ns()}-{number}"
+
+    def _clients(self, client_class, count):
+        clients = []
+        for _ in range(count):
+            client = client_class()
+            client.force_login(self.user)
+            clients.append(client)
+        return clients
+
+    def _run_wsgi(self, path, requests, concurrency):
+        """Each client sends its share of the requests sequentially from its own thread"""
+        clients = self._clients(Client, concurrency)
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def work(client, count):
+            try:
+                for number in range(count):
+                    started = time.perf_counter()
+                    response = client.get(self._url(path, number))
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    latency = time.perf_counter() - started
+                    with lock:
+                        latencies.append(latency)
+                        errors[0] += response.status_code >= 400
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            futures = [
+                executor.submit(work, client, self._share(requests, concurrency, index))
+                for index, client in enumerate(clients)
+            ]
+            for future in futures:
+                future.result()
+        return time.perf_counter() - started, latencies, errors[0]
+
+    def _run_asgi(self, path, requests, concurrency):
+        """Each client sends its share of the requests sequentially from its own task on one event loop"""
+        clients = self._clients(AsyncClient, concurrency)
+        latencies = []
+        errors = 0
+
+        async def work(client, count):
+            nonlocal errors
+            for number in range(count):
+                started = time.perf_counter()
+                response = await client.get(self._url(path, number))
+                if response.streaming:
+                    [chunk async for chunk in response.streaming_content]
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code >= 400
+
+        async def main():
+            await asyncio.gather(*(
+                work(client, self._share(requests, concurrency, index)) for index, client in enumerate(clients)
+            ))
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return time.perf_counter() - started, latencies, errors
+
+    def _share(self, requests, concurrency, index):
+        return requests // concurrency + (index < requests % concurrency)
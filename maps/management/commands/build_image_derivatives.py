@@ -0,0 +1,55 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+
+from maps import images
+from maps.models import PollutedArea
+
+
+def _generate(args):
+    """Worker: generate the derivatives of one image, returning (name, written, error)"""
+    name, force = args
+    try:
+        return name, images.generate(name, force=force), None
+    except images.UNREADABLE_IMAGE_ERRORS as error:
+        return name, 0, str(error)
+
+
+class Command(BaseCommand):
+    help = 'Generate resized derivatives of uploaded area photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives that already exist')
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='Number of worker processes (1 disables multiprocessing)')
+
+    def handle(self, *args, **options):
+        names = list(
+            PollutedArea.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by().values_list('image', flat=True).distinct()
+        )
+        tasks = [(name, options['force']) for name in names]
+        if options['processes'] > 1:
+            pool = multiprocessing.Pool(options['processes'])
+            results = pool.imap_unordered(_generate, tasks)
+        else:
+            pool = None
+            results = map(_generate, tasks)
+
+        written = failed = 0
+        try:
+            for done, (name, count, error) in enumerate(results, start=1):
+                written += count
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                if done % 100 == 0:
+                    self.stdout.write(f'{done}/{len(tasks)} images processed')
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} derivatives for {len(tasks)} images, {failed} could not be read.'
+        ))
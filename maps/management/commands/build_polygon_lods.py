@@ -0,0 +1,83 @@
+import multiprocessing
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from maps import sync
+from maps.geometry import POLYGON_LODS, build_lods, decode_polygon
+from maps.models import PollutedArea
+from maps.signals import areas_bulk_changed
+
+LOD_FIELDS = [field for field, _ in POLYGON_LODS]
+
+
+def _simplify_batch(rows):
+    """Worker: compute the levels of detail for a batch of (id, polygon_data) rows"""
+    return [(area_id, build_lods(decode_polygon(data))) for area_id, data in rows]
+
+
+class Command(BaseCommand):
+    help = 'Compute simplified polygon levels of detail for existing polluted areas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Areas simplified per worker task and per bulk update')
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='Number of worker processes (1 disables multiprocessing)')
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Only process areas that have no level of detail yet')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        areas = PollutedArea.objects.filter(polygon_vertex_count__gt=3)
+        if options['missing_only']:
+            areas = areas.filter(**{f'{field}__isnull': True for field in LOD_FIELDS})
+        total = areas.count()
+
+        # Workers get plain bytes and never touch the database; spawned ones still import this
+        # module, and with it the models, so they set up Django first
+        connections.close_all()
+        if options['processes'] > 1:
+            pool = multiprocessing.Pool(options['processes'], initializer=django.setup)
+            results = pool.imap_unordered(_simplify_batch, self._batches(areas, batch_size))
+        else:
+            pool = None
+            results = map(_simplify_batch, self._batches(areas, batch_size))
+
+        done = 0
+        try:
+            for batch in results:
+                updates = []
+                for area_id, lods in batch:
+                    area = PollutedArea(pk=area_id)
+                    for field, data in lods.items():
+                        setattr(area, field, data)
+                    updates.append(area)
+                with transaction.atomic():
+                    # The served geometry changed, so delta sync clients must get it again
+                    sync.stamp(updates)
+                    PollutedArea.objects.bulk_update(updates, [*LOD_FIELDS, 'change_seq'])
+                done += len(updates)
+                self.stdout.write(f'{done}/{total} areas simplified')
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if done:
+            # The areas API and the cached tiles serve the new levels
+            areas_bulk_changed.send(sender=PollutedArea, fields=LOD_FIELDS)
+        self.stdout.write(self.style.SUCCESS(f'Built levels of detail for {done} areas.'))
+
+    def _batches(self, areas, batch_size):
+        """Yield (id, polygon_data) batches, paging by primary key"""
+        last_id = 0
+        while True:
+            rows = list(
+                areas.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'polygon_data')[:batch_size]
+            )
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [(area_id, bytes(data)) for area_id, data in rows]
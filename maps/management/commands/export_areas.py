@@ -0,0 +1,45 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from maps import export
+from maps.models import PollutedArea
+
+
+class Command(BaseCommand):
+    help = 'Export polluted areas and their reports as CSV, GeoJSONSeq or columnar binary'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write, or - for standard output")
+        parser.add_argument('--format', choices=export.FORMATS, default='csv')
+        parser.add_argument('--type', help='Comma separated pollution types to export')
+        parser.add_argument('--min-severity', type=int)
+        parser.add_argument('--max-severity', type=int)
+        parser.add_argument('--since', help='First day of creation to export (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last day of creation to export (YYYY-MM-DD)')
+        parser.add_argument('--include-inactive', action='store_true', help='Also export deleted areas')
+        parser.add_argument('--chunk-size', type=int, default=export.EXPORT_CHUNK_SIZE,
+                            help='Areas read per query')
+
+    def handle(self, *args, **options):
+        try:
+            filters = export.parse_filters(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        areas = export.filter_areas(PollutedArea.objects.all(), **filters)
+        chunks = export.export(areas, options['format'], chunk_size=options['chunk_size'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        size = 0
+        with open(options['output'], 'wb') as target:
+            for chunk in chunks:
+                target.write(chunk)
+                size += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {size} bytes to {options['output']}."))
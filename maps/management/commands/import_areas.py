@@ -0,0 +1,135 @@
+import json
+import multiprocessing
+import os
+from itertools import islice
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from maps.importer import FORMATS, UPSERT_FIELDS, build_areas, detect_format, parse_batch, read_records
+from maps import sync
+from maps.models import ChangeSequence, PollutedArea
+from maps.signals import areas_bulk_changed
+
+
+class Command(BaseCommand):
+    help = 'Import polluted areas from a CSV, GeoJSON or NDJSON file, upserting by external_id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--user', required=True, help='Username recorded as the creator of new areas')
+        parser.add_argument('--format', choices=FORMATS, help='Input format (detected from the extension by default)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Records parsed per worker task and written per transaction')
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='Number of parsing processes (1 disables multiprocessing)')
+        parser.add_argument('--checkpoint', help='File recording progress; an existing one resumes the import')
+        parser.add_argument('--dry-run', action='store_true', help='Validate every record without writing anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+        if file_format is None:
+            raise CommandError('Cannot detect the file format, pass --format')
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        User = get_user_model()
+        try:
+            user = User.objects.get(**{User.USERNAME_FIELD: options['user']})
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {options['user']}")
+
+        dry_run = options['dry_run']
+        checkpoint = None if dry_run else options['checkpoint']
+        skip = self._read_checkpoint(checkpoint, path)
+        if skip:
+            self.stdout.write(f'Resuming after record {skip}')
+
+        # Every area this run writes gets a later change sequence number
+        since = ChangeSequence.current(ChangeSequence.AREAS)
+        batches = self._batches(read_records(path, file_format), options['batch_size'], skip)
+        # Workers only parse and validate; they never touch the database, but the forms they
+        # use need the app registry, which a spawned worker has to set up itself
+        connections.close_all()
+        if options['processes'] > 1:
+            pool = multiprocessing.Pool(options['processes'], initializer=django.setup)
+            results = pool.imap(parse_batch, batches)
+        else:
+            pool = None
+            results = map(parse_batch, batches)
+
+        imported = invalid = 0
+        try:
+            for batch in results:
+                valid = []
+                for number, values, errors in batch:
+                    if errors:
+                        invalid += 1
+                        self.stderr.write(f'Record {number}: {json.dumps(errors, ensure_ascii=False)}')
+                    else:
+                        valid.append(values)
+                if valid and not dry_run:
+                    self._write(valid, user)
+                imported += len(valid)
+                last = batch[-1][0]
+                if checkpoint:
+                    self._write_checkpoint(checkpoint, path, last)
+                self.stdout.write(f'{last} records read, {imported} valid, {invalid} invalid')
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if imported and not dry_run:
+                # bulk_create sends no post_save; refresh everything derived from the areas
+                areas_bulk_changed.send(sender=PollutedArea, since=since)
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        verb = 'Validated' if dry_run else 'Imported'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {imported} areas, {invalid} invalid records skipped.'))
+
+    def _batches(self, records, batch_size, skip):
+        """Yield lists of (record number, record), numbering from 1 and skipping the first `skip`"""
+        numbered = islice(enumerate(records, start=1), skip, None)
+        while True:
+            batch = list(islice(numbered, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _write(self, valid, user):
+        # The last occurrence of an external_id within a batch wins; one
+        # INSERT ... ON CONFLICT cannot update the same row twice
+        unique = {}
+        for position, values in enumerate(valid):
+            unique[values['external_id'] or position] = values
+        areas = build_areas(unique.values(), user)
+        with transaction.atomic():
+            # New and updated rows alike reach delta sync clients
+            sync.stamp(areas)
+            PollutedArea.objects.bulk_create(
+                areas,
+                batch_size=len(unique),
+                update_conflicts=True,
+                unique_fields=['external_id'],
+                update_fields=[*UPSERT_FIELDS, 'change_seq'],
+            )
+
+    def _read_checkpoint(self, checkpoint, path):
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as source:
+            state = json.load(source)
+        if state.get('source') != os.path.abspath(path):
+            raise CommandError(f"Checkpoint {checkpoint} belongs to {state.get('source')}")
+        return state['records']
+
+    def _write_checkpoint(self, checkpoint, path, records):
+        temporary = f'{checkpoint}.tmp'
+        with open(temporary, 'w') as target:
+            json.dump({'source': os.path.abspath(path), 'records': records}, target)
+        os.replace(temporary, checkpoint)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from maps import sync
+
+
+class Command(BaseCommand):
+    help = 'Delete old tombstones of deleted areas; delta sync clients with older cursors must reload'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Keep tombstones younger than this many days')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+        deleted = sync.prune_tombstones(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} tombstones.'))
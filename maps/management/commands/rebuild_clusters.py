@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from maps import clustering
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed map clustering grid from all active polluted areas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cells = clustering.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {cells} cluster cells up to zoom {clustering.cluster_max_zoom()}.'
+        ))
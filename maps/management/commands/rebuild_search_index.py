@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from maps import search
+from maps.models import PollutedArea, PollutionReport
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of areas and reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Documents indexed per batch')
+
+    def handle(self, *args, **options):
+        index = search.get_index()
+        self.stdout.write(f'Using the {"FTS5" if isinstance(index, search.FtsIndex) else "inverted"} index')
+        search.populate(
+            index,
+            areas=PollutedArea.objects.all(),
+            reports=PollutionReport.objects.all(),
+            batch_size=options['batch_size'],
+            progress=lambda kind, done: self.stdout.write(f'{done} {kind}s indexed'),
+        )
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,79 @@
+import multiprocessing
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from maps import sync
+from maps.geometry import decode_polygon, geodesic_area, polygon_centroid
+from maps.models import PollutedArea
+from maps.signals import areas_bulk_changed
+
+MEASUREMENT_FIELDS = ['area_size', 'latitude', 'longitude']
+
+
+def _measure_batch(rows):
+    """Worker: (id, area, latitude, longitude) for a batch of (id, polygon_data) rows"""
+    results = []
+    for area_id, data in rows:
+        coordinates = decode_polygon(data)
+        results.append((area_id, geodesic_area(coordinates), *polygon_centroid(coordinates)))
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Recompute the geodesic area and centroid of every polluted area with a polygon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Areas measured per worker task and per bulk update')
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='Number of worker processes (1 disables multiprocessing)')
+
+    def handle(self, *args, **options):
+        areas = PollutedArea.objects.filter(polygon_vertex_count__gte=3)
+        total = areas.count()
+
+        # Workers get plain bytes and never touch the database, but a spawned worker imports
+        # this module's models when it unpickles _measure_batch, so it sets up Django first
+        connections.close_all()
+        if options['processes'] > 1:
+            pool = multiprocessing.Pool(options['processes'], initializer=django.setup)
+            results = pool.imap_unordered(_measure_batch, self._batches(areas, options['batch_size']))
+        else:
+            pool = None
+            results = map(_measure_batch, self._batches(areas, options['batch_size']))
+
+        done = 0
+        try:
+            for batch in results:
+                updates = [
+                    PollutedArea(pk=area_id, area_size=area_size, latitude=latitude, longitude=longitude)
+                    for area_id, area_size, latitude, longitude in batch
+                ]
+                with transaction.atomic():
+                    sync.stamp(updates)
+                    PollutedArea.objects.bulk_update(updates, [*MEASUREMENT_FIELDS, 'change_seq'])
+                done += len(updates)
+                self.stdout.write(f'{done}/{total} areas measured')
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if done:
+            # Centroids moved the points the clusters and caches are built from
+            areas_bulk_changed.send(sender=PollutedArea, fields=MEASUREMENT_FIELDS)
+        self.stdout.write(self.style.SUCCESS(f'Recomputed area and centroid of {done} areas.'))
+
+    def _batches(self, areas, batch_size):
+        """Yield (id, polygon_data) batches, paging by primary key"""
+        last_id = 0
+        while True:
+            rows = list(
+                areas.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'polygon_data')[:batch_size]
+            )
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [(area_id, bytes(data)) for area_id, data in rows]
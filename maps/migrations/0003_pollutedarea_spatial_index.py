@@ -0,0 +1,194 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:37
+
+import json
+import math
+
+import django.core.validators
+from django.db import migrations, models
+
+# Frozen copies of the maps.spatial helpers as of this migration, so later
+# changes to that module cannot change what this migration writes
+MAX_LATITUDE = 85.0511287798
+
+MAX_INDEX_LEVEL = 18
+
+
+def lnglat_to_tile(lng, lat, zoom):
+    n = 1 << zoom
+    lat_rad = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    x = (max(-180.0, min(180.0, lng)) + 180.0) / 360.0
+    y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0
+    return min(n - 1, max(0, int(x * n))), min(n - 1, max(0, int(y * n)))
+
+
+def tile_to_quadkey(x, y, zoom):
+    digits = []
+    for level in range(zoom, 0, -1):
+        mask = 1 << (level - 1)
+        digit = 0
+        if x & mask:
+            digit += 1
+        if y & mask:
+            digit += 2
+        digits.append(str(digit))
+    return "".join(digits)
+
+
+def quadkey_for_bounds(min_lat, min_lng, max_lat, max_lng):
+    for level in range(MAX_INDEX_LEVEL, 0, -1):
+        x0, y0 = lnglat_to_tile(min_lng, max_lat, level)
+        x1, y1 = lnglat_to_tile(max_lng, min_lat, level)
+        if x0 == x1 and y0 == y1:
+            return tile_to_quadkey(x0, y0, level)
+    return ""
+
+
+def bounds_from_coordinates(coordinates):
+    lats = [float(point[0]) for point in coordinates]
+    lngs = [float(point[1]) for point in coordinates]
+    return min(lats), min(lngs), max(lats), max(lngs)
+
+
+def populate_bounds(apps, schema_editor):
+    PollutedArea = apps.get_model("maps", "PollutedArea")
+    areas = PollutedArea.objects.only(
+        "latitude", "longitude", "polygon_coordinates"
+    ).iterator(chunk_size=2000)
+    batch = []
+    for area in areas:
+        try:
+            coordinates = json.loads(area.polygon_coordinates or "[]")
+        except (json.JSONDecodeError, TypeError):
+            coordinates = []
+        try:
+            bounds = bounds_from_coordinates(coordinates)
+        except (ValueError, TypeError, LookupError):
+            # No polygon, or one that is not a list of [lat, lng] pairs
+            bounds = (area.latitude, area.longitude, area.latitude, area.longitude)
+        area.min_lat, area.min_lng, area.max_lat, area.max_lng = bounds
+        area.quadkey = quadkey_for_bounds(*bounds)
+        batch.append(area)
+        if len(batch) >= 2000:
+            PollutedArea.objects.bulk_update(
+                batch, ["min_lat", "min_lng", "max_lat", "max_lng", "quadkey"]
+            )
+            batch = []
+    if batch:
+        PollutedArea.objects.bulk_update(
+            batch, ["min_lat", "min_lng", "max_lat", "max_lng", "quadkey"]
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0002_pollutedarea_polygon_coordinates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="max_lat",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="max_lng",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="min_lat",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="min_lng",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="quadkey",
+            field=models.CharField(
+                blank=True, db_index=True, default="", editable=False, max_length=24
+            ),
+        ),
+        migrations.AlterField(
+            model_name="pollutedarea",
+            name="area_size",
+            field=models.FloatField(
+                blank=True,
+                help_text="Area size in square meters",
+                null=True,
+                verbose_name="Area Size",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="pollutedarea",
+            name="description",
+            field=models.TextField(blank=True, verbose_name="Description"),
+        ),
+        migrations.AlterField(
+            model_name="pollutedarea",
+            name="latitude",
+            field=models.FloatField(
+                help_text="Latitude coordinate", verbose_name="Latitude"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="pollutedarea",
+            name="longitude",
+            field=models.FloatField(
+                help_text="Longitude coordinate", verbose_name="Longitude"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="pollutedarea",
+            name="name",
+            field=models.CharField(max_length=200, verbose_name="Name"),
+        ),
+        migrations.AlterField(
+            model_name="pollutedarea",
+            name="pollution_type",
+            field=models.CharField(
+                choices=[
+                    ("air", "Air Pollution"),
+                    ("water", "Water Pollution"),
+                    ("soil", "Soil Pollution"),
+                    ("noise", "Noise Pollution"),
+                    ("light", "Light Pollution"),
+                    ("other", "Other"),
+                ],
+                max_length=20,
+                verbose_name="Pollution Type",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="pollutedarea",
+            name="polygon_coordinates",
+            field=models.TextField(
+                blank=True,
+                help_text="Polygon coordinates as JSON",
+                null=True,
+                verbose_name="Polygon Coordinates",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="pollutedarea",
+            name="severity",
+            field=models.IntegerField(
+                choices=[
+                    (1, "Low"),
+                    (2, "Moderate"),
+                    (3, "High"),
+                    (4, "Critical"),
+                    (5, "Extreme"),
+                ],
+                validators=[
+                    django.core.validators.MinValueValidator(1),
+                    django.core.validators.MaxValueValidator(5),
+                ],
+                verbose_name="Severity",
+            ),
+        ),
+        migrations.RunPython(populate_bounds, migrations.RunPython.noop),
+    ]
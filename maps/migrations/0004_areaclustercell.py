@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0003_pollutedarea_spatial_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AreaClusterCell",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("zoom", models.PositiveSmallIntegerField()),
+                ("x", models.IntegerField()),
+                ("y", models.IntegerField()),
+                ("pollution_type", models.CharField(max_length=20)),
+                ("severity", models.IntegerField()),
+                ("count", models.IntegerField(default=0)),
+                ("lat_sum", models.FloatField(default=0)),
+                ("lng_sum", models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="areaclustercell",
+            constraint=models.UniqueConstraint(
+                fields=("zoom", "x", "y", "pollution_type", "severity"),
+                name="unique_area_cluster_cell",
+            ),
+        ),
+    ]
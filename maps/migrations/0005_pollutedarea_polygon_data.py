@@ -0,0 +1,175 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:52
+
+import json
+import math
+import sys
+from array import array
+
+from django.db import migrations, models
+
+# Frozen copies of the maps.geometry and maps.spatial helpers as of this
+# migration, so later changes to those modules cannot change what it writes
+COORDINATE_SCALE = 10_000_000
+
+MAX_LATITUDE = 85.0511287798
+
+MAX_INDEX_LEVEL = 18
+
+
+def normalize_coordinates(coordinates):
+    normalized = []
+    for lat, lng in coordinates:
+        lat, lng = float(lat), float(lng)
+        if not (math.isfinite(lat) and math.isfinite(lng)) or not -90 <= lat <= 90:
+            raise ValueError(f"Coordinate out of range: {lat}, {lng}")
+        if not -180 <= lng <= 180:
+            lng = (lng + 180) % 360 - 180
+        normalized.append([lat, lng])
+    return normalized
+
+
+def encode_polygon(coordinates):
+    packed = array("i")
+    for lat, lng in coordinates:
+        packed.append(int(round(lat * COORDINATE_SCALE)))
+        packed.append(int(round(lng * COORDINATE_SCALE)))
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def decode_polygon(data):
+    if not data:
+        return []
+    packed = array("i")
+    packed.frombytes(bytes(data))
+    if sys.byteorder != "little":
+        packed.byteswap()
+    values = [value / COORDINATE_SCALE for value in packed]
+    return [[values[i], values[i + 1]] for i in range(0, len(values), 2)]
+
+
+def lnglat_to_tile(lng, lat, zoom):
+    n = 1 << zoom
+    lat_rad = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    x = (max(-180.0, min(180.0, lng)) + 180.0) / 360.0
+    y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0
+    return min(n - 1, max(0, int(x * n))), min(n - 1, max(0, int(y * n)))
+
+
+def tile_to_quadkey(x, y, zoom):
+    digits = []
+    for level in range(zoom, 0, -1):
+        mask = 1 << (level - 1)
+        digit = 0
+        if x & mask:
+            digit += 1
+        if y & mask:
+            digit += 2
+        digits.append(str(digit))
+    return "".join(digits)
+
+
+def quadkey_for_bounds(min_lat, min_lng, max_lat, max_lng):
+    for level in range(MAX_INDEX_LEVEL, 0, -1):
+        x0, y0 = lnglat_to_tile(min_lng, max_lat, level)
+        x1, y1 = lnglat_to_tile(max_lng, min_lat, level)
+        if x0 == x1 and y0 == y1:
+            return tile_to_quadkey(x0, y0, level)
+    return ""
+
+
+def bounds_from_coordinates(coordinates):
+    lats = [point[0] for point in coordinates]
+    lngs = [point[1] for point in coordinates]
+    return min(lats), min(lngs), max(lats), max(lngs)
+
+
+def pack_polygons(apps, schema_editor):
+    PollutedArea = apps.get_model("maps", "PollutedArea")
+    areas = (
+        PollutedArea.objects.exclude(polygon_coordinates__isnull=True)
+        .exclude(polygon_coordinates="")
+        .only("polygon_coordinates")
+    )
+    batch = []
+    for area in areas.iterator(chunk_size=2000):
+        try:
+            coordinates = json.loads(area.polygon_coordinates)
+        except (json.JSONDecodeError, TypeError):
+            coordinates = []
+        if not coordinates:
+            continue
+        try:
+            coordinates = normalize_coordinates(coordinates)
+        except (ValueError, TypeError):
+            # Not a list of valid [lat, lng] pairs; leave the area without a polygon
+            continue
+        area.polygon_data = encode_polygon(coordinates)
+        area.polygon_vertex_count = len(coordinates)
+        bounds = bounds_from_coordinates(coordinates)
+        area.min_lat, area.min_lng, area.max_lat, area.max_lng = bounds
+        area.quadkey = quadkey_for_bounds(*bounds)
+        batch.append(area)
+        if len(batch) >= 2000:
+            PollutedArea.objects.bulk_update(batch, PACKED_FIELDS)
+            batch = []
+    if batch:
+        PollutedArea.objects.bulk_update(batch, PACKED_FIELDS)
+
+
+def unpack_polygons(apps, schema_editor):
+    PollutedArea = apps.get_model("maps", "PollutedArea")
+    areas = PollutedArea.objects.filter(polygon_vertex_count__gt=0).only(
+        "polygon_data"
+    )
+    batch = []
+    for area in areas.iterator(chunk_size=2000):
+        area.polygon_coordinates = json.dumps(decode_polygon(area.polygon_data))
+        batch.append(area)
+        if len(batch) >= 2000:
+            PollutedArea.objects.bulk_update(batch, ["polygon_coordinates"])
+            batch = []
+    if batch:
+        PollutedArea.objects.bulk_update(batch, ["polygon_coordinates"])
+
+
+PACKED_FIELDS = [
+    "polygon_data",
+    "polygon_vertex_count",
+    "min_lat",
+    "min_lng",
+    "max_lat",
+    "max_lng",
+    "quadkey",
+]
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0004_areaclustercell"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="polygon_data",
+            field=models.BinaryField(
+                blank=True,
+                editable=False,
+                help_text="Packed polygon coordinates",
+                null=True,
+                verbose_name="Polygon Coordinates",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="polygon_vertex_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(pack_polygons, unpack_polygons),
+        migrations.RemoveField(
+            model_name="pollutedarea",
+            name="polygon_coordinates",
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0005_pollutedarea_polygon_data"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="polygon_lod_high",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="polygon_lod_low",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="polygon_lod_mid",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0006_pollutedarea_polygon_lods"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pollutedarea",
+            index=models.Index(
+                fields=["is_active", "-created_at"], name="area_active_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pollutionreport",
+            index=models.Index(
+                fields=["reporter", "-created_at"], name="report_reporter_recent_idx"
+            ),
+        ),
+    ]
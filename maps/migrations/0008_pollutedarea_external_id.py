@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0007_recent_activity_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="external_id",
+            field=models.CharField(
+                blank=True, editable=False, max_length=100, null=True, unique=True
+            ),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+from maps.search import (
+    FtsIndex,
+    InvertedIndex,
+    create_fts_table,
+    drop_fts_table,
+    populate,
+    use_fts,
+)
+
+
+def build_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if use_fts(connection):
+        create_fts_table(connection)
+        index = FtsIndex(connection)
+    else:
+        index = InvertedIndex(apps.get_model("maps", "SearchTerm"))
+    populate(
+        index,
+        areas=apps.get_model("maps", "PollutedArea").objects.all(),
+        reports=apps.get_model("maps", "PollutionReport").objects.all(),
+    )
+
+
+def remove_fts_table(apps, schema_editor):
+    drop_fts_table(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0008_pollutedarea_external_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=64)),
+                ("kind", models.CharField(max_length=10)),
+                ("object_id", models.BigIntegerField()),
+                ("area_id", models.BigIntegerField()),
+                ("weight", models.FloatField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["term", "kind"], name="search_term_idx"),
+                    models.Index(
+                        fields=["kind", "object_id"], name="search_document_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(build_search_index, remove_fts_table),
+    ]
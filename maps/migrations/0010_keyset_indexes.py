@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0009_search_index"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="pollutedarea",
+            name="area_active_recent_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="pollutionreport",
+            name="report_reporter_recent_idx",
+        ),
+        migrations.AddIndex(
+            model_name="pollutedarea",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["-created_at", "-id"],
+                name="area_active_keyset_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pollutedarea",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["created_by", "-created_at", "-id"],
+                name="area_owner_keyset_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pollutionreport",
+            index=models.Index(
+                fields=["reporter", "-created_at", "-id"],
+                name="report_reporter_keyset_idx",
+            ),
+        ),
+    ]
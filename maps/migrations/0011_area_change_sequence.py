@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:11
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_areas(apps, schema_editor):
+    # Existing areas get their id as sequence number, starting the counter after them
+    PollutedArea = apps.get_model("maps", "PollutedArea")
+    PollutedArea.objects.update(change_seq=F("id"))
+    last = PollutedArea.objects.aggregate(last=Max("id"))["last"] or 0
+    apps.get_model("maps", "ChangeSequence").objects.create(name="areas", value=last)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0010_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AreaTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("area_id", models.BigIntegerField()),
+                ("change_seq", models.BigIntegerField(db_index=True)),
+                ("deleted_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ChangeSequence",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("value", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="pollutedarea",
+            name="change_seq",
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(number_existing_areas, migrations.RunPython.noop),
+    ]
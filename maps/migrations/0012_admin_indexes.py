@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("maps", "0011_area_change_sequence"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pollutedarea",
+            index=models.Index(fields=["-created_at", "-id"], name="area_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pollutedarea",
+            index=models.Index(
+                fields=["pollution_type", "-created_at"], name="area_type_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pollutedarea",
+            index=models.Index(
+                fields=["severity", "-created_at"], name="area_severity_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pollutionreport",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="report_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pollutionreport",
+            index=models.Index(
+                fields=["status", "-created_at"], name="report_status_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pollutionreport",
+            index=models.Index(fields=["verified_at"], name="report_verified_idx"),
+        ),
+    ]
@@ -1,11 +1,62 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import F
 from django.utils.translation import gettext_lazy as _
-import json
 
+from .geometry import (
+    build_lods, decode_polygon, encode_polygon, geodesic_area, normalize_coordinates, polygon_centroid,
+)
+from .spatial import bounds_from_coordinates, quadkey_for_bounds, bbox_q
 
-class PollutedArea(models.Model):
+SEVERITY_COLORS = {
+    1: '#28a745',  # Green
+    2: '#ffc107',  # Yellow
+    3: '#fd7e14',  # Orange
+    4: '#dc3545',  # Red
+    5: '#6f42c1',  # Purple
+}
+
+
+def severity_color(severity):
+    return SEVERITY_COLORS.get(severity, '#6c757d')
+
+
+class TrackedFieldsMixin:
+    """
+    Remembers field values as last loaded from or saved to the database, so
+    post_save/post_delete receivers can diff the previous and current state.
+    """
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+    
+    def previous_value(self, field):
+        """Value of a field as last loaded from or saved to the database"""
+        loaded = getattr(self, '_loaded_values', {})
+        if field in loaded:
+            return loaded[field]
+        return getattr(self, field)
+
+
+class PollutedAreaQuerySet(models.QuerySet):
+    def in_bbox(self, bbox, zoom=None):
+        """Areas whose point or polygon extent intersects a (minLng, minLat, maxLng, maxLat) bbox"""
+        return self.filter(bbox_q(bbox, zoom))
+
+
+class PollutedArea(TrackedFieldsMixin, models.Model):
     POLLUTION_TYPES = [
         ('air', _('Air Pollution')),
         ('water', _('Water Pollution')),
@@ -29,55 +80,105 @@ class PollutedArea(models.Model):
     severity = models.IntegerField(choices=SEVERITY_LEVELS, validators=[MinValueValidator(1), MaxValueValidator(5)], verbose_name=_('Severity'))
     latitude = models.FloatField(help_text=_("Latitude coordinate"), verbose_name=_('Latitude'))
     longitude = models.FloatField(help_text=_("Longitude coordinate"), verbose_name=_('Longitude'))
-    polygon_coordinates = models.TextField(help_text=_("Polygon coordinates as JSON"), null=True, blank=True, verbose_name=_('Polygon Coordinates'))
+    polygon_data = models.BinaryField(help_text=_("Packed polygon coordinates"), null=True, blank=True, editable=False, verbose_name=_('Polygon Coordinates'))
+    polygon_vertex_count = models.PositiveIntegerField(default=0, editable=False)
+    # Simplified copies of polygon_data for lower zooms, see geometry.POLYGON_LODS
+    polygon_lod_low = models.BinaryField(null=True, blank=True, editable=False)
+    polygon_lod_mid = models.BinaryField(null=True, blank=True, editable=False)
+    polygon_lod_high = models.BinaryField(null=True, blank=True, editable=False)
     area_size = models.FloatField(help_text=_("Area size in square meters"), null=True, blank=True, verbose_name=_('Area Size'))
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='polluted_areas')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     image = models.ImageField(upload_to='pollution_images/', null=True, blank=True)
+    # Identifier in the source dataset of imported areas, used to upsert re-imports
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True, editable=False)
+    
+    # Spatial index: the extent is set with the polygon, the quadkey on every save
+    min_lat = models.FloatField(null=True, blank=True, editable=False)
+    min_lng = models.FloatField(null=True, blank=True, editable=False)
+    max_lat = models.FloatField(null=True, blank=True, editable=False)
+    max_lng = models.FloatField(null=True, blank=True, editable=False)
+    quadkey = models.CharField(max_length=24, blank=True, default='', db_index=True, editable=False)
+    # Position of the last write in the areas change sequence, for delta sync (maps.sync)
+    change_seq = models.BigIntegerField(default=0, db_index=True, editable=False)
+    
+    objects = PollutedAreaQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
         verbose_name = _('Polluted Area')
         verbose_name_plural = _('Polluted Areas')
+        indexes = [
+            # Keyset pagination (core.pagination) of the map list and of an owner's areas. Partial,
+            # as SQLite compiles is_active=True to a bare "is_active" an index column can't match
+            models.Index(fields=['-created_at', '-id'], name='area_active_keyset_idx', condition=models.Q(is_active=True)),
+            models.Index(
+                fields=['created_by', '-created_at', '-id'], name='area_owner_keyset_idx', condition=models.Q(is_active=True)
+            ),
+            # Admin changelist: its ordering and the type and severity filters
+            models.Index(fields=['-created_at', '-id'], name='area_created_idx'),
+            models.Index(fields=['pollution_type', '-created_at'], name='area_type_created_idx'),
+            models.Index(fields=['severity', '-created_at'], name='area_severity_created_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.update_measurements()
+        self.update_bounds()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'change_seq'}
+        # Stamped in the writing transaction, so writes commit in sequence order
+        with transaction.atomic():
+            self.change_seq = ChangeSequence.reserve(ChangeSequence.AREAS)
+            super().save(*args, **kwargs)
+    
+    def update_measurements(self):
+        """Derive area_size and the point from the polygon, if there is one"""
+        if self.has_polygon():
+            coordinates = self.get_polygon_coordinates()
+            self.area_size = geodesic_area(coordinates)
+            self.latitude, self.longitude = polygon_centroid(coordinates)
+    
+    def update_bounds(self):
+        """Recompute the quadkey, taking the extent from the point if there is no polygon"""
+        if not self.has_polygon():
+            self.min_lat = self.max_lat = self.latitude
+            self.min_lng = self.max_lng = self.longitude
+        self.quadkey = quadkey_for_bounds(self.min_lat, self.min_lng, self.max_lat, self.max_lng)
     
     def get_polygon_coordinates(self):
         """Return polygon coordinates as a list of [lat, lng] pairs"""
-        if self.polygon_coordinates:
-            try:
-                return json.loads(self.polygon_coordinates)
-            except (json.JSONDecodeError, TypeError):
-                return []
-        return []
+        # Decode at most once per loaded value of polygon_data
+        cached = getattr(self, '_polygon_cache', None)
+        if cached is None or cached[0] is not self.polygon_data:
+            cached = (self.polygon_data, decode_polygon(self.polygon_data))
+            self._polygon_cache = cached
+        return cached[1]
     
     def set_polygon_coordinates(self, coordinates):
-        """Set polygon coordinates from a list of [lat, lng] pairs"""
+        """Set polygon coordinates from a list of [lat, lng] pairs; raises ValueError for invalid ones"""
+        coordinates = normalize_coordinates(coordinates or [])
+        self.polygon_data = encode_polygon(coordinates)
+        self.polygon_vertex_count = len(coordinates) if coordinates else 0
+        for field, data in build_lods(coordinates).items():
+            setattr(self, field, data)
         if coordinates:
-            self.polygon_coordinates = json.dumps(coordinates)
-        else:
-            self.polygon_coordinates = None
+            self.min_lat, self.min_lng, self.max_lat, self.max_lng = bounds_from_coordinates(coordinates)
     
     def has_polygon(self):
         """Check if this area has polygon data"""
-        return bool(self.polygon_coordinates and self.get_polygon_coordinates())
+        return self.polygon_vertex_count > 0
     
     def __str__(self):
         return f"{self.name} - {self.get_pollution_type_display()}"
     
     @property
     def severity_color(self):
-        colors = {
-            1: '#28a745',  # Green
-            2: '#ffc107',  # Yellow
-            3: '#fd7e14',  # Orange
-            4: '#dc3545',  # Red
-            5: '#6f42c1',  # Purple
-        }
-        return colors.get(self.severity, '#6c757d')
+        return severity_color(self.severity)
 
 
-class PollutionReport(models.Model):
+class PollutionReport(TrackedFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('pending', _('Pending')),
         ('verified', _('Verified')),
@@ -97,6 +198,113 @@ class PollutionReport(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['reporter', '-created_at', '-id'], name='report_reporter_keyset_idx'),
+            # Admin changelist: its ordering and the status and verified date filters
+            models.Index(fields=['-created_at', '-id'], name='report_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='report_status_created_idx'),
+            models.Index(fields=['verified_at'], name='report_verified_idx'),
+        ]
     
     def __str__(self):
         return f"Report: {self.title} - {self.get_status_display()}"
+
+
+class AreaClusterCell(models.Model):
+    """
+    Precomputed clustering grid for the map.
+
+    One row per (zoom, cell, pollution type, severity) holding the number of
+    active areas in it and the sums of their coordinates, so cells can be
+    updated with plain increments when a single area changes.
+    """
+    zoom = models.PositiveSmallIntegerField()
+    x = models.IntegerField()
+    y = models.IntegerField()
+    pollution_type = models.CharField(max_length=20)
+    severity = models.IntegerField()
+    count = models.IntegerField(default=0)
+    lat_sum = models.FloatField(default=0)
+    lng_sum = models.FloatField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['zoom', 'x', 'y', 'pollution_type', 'severity'],
+                name='unique_area_cluster_cell',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Cluster {self.zoom}/{self.x}/{self.y} {self.pollution_type}:{self.severity} ({self.count})"
+
+
+class SearchTerm(models.Model):
+    """
+    Posting of the built-in inverted search index, used when SQLite FTS5 is
+    not available: one row per distinct term of an area or report with the
+    term's weight in that document (see maps.search).
+    """
+    term = models.CharField(max_length=64)
+    kind = models.CharField(max_length=10)
+    object_id = models.BigIntegerField()
+    area_id = models.BigIntegerField()
+    weight = models.FloatField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'kind'], name='search_term_idx'),
+            models.Index(fields=['kind', 'object_id'], name='search_document_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.term} in {self.kind} {self.object_id}"
+
+
+class ChangeSequence(models.Model):
+    """
+    Named counter handing out increasing change sequence numbers.
+
+    Numbers are reserved with an UPDATE inside the writing transaction, so
+    the counter row (or SQLite's database) stays locked until that
+    transaction commits and changes become visible in sequence order.
+    """
+    AREAS = 'areas'
+    # Highest sequence number of the area tombstones pruned so far
+    AREAS_PRUNED = 'areas_pruned'
+    # Bumped whenever reports change, as the version of the cached report fragments
+    REPORTS = 'reports'
+    
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    
+    @classmethod
+    def reserve(cls, name, count=1):
+        """First of `count` new consecutive numbers of a sequence"""
+        sequence = cls.objects.filter(name=name)
+        with transaction.atomic():
+            if not sequence.update(value=F('value') + count):
+                cls.objects.create(name=name, value=count)
+            return sequence.values_list('value', flat=True).get() - count + 1
+    
+    @classmethod
+    def current(cls, name):
+        """Last number handed out by a sequence (0 if none yet)"""
+        return cls.objects.filter(name=name).values_list('value', flat=True).first() or 0
+    
+    @classmethod
+    async def acurrent(cls, name):
+        return await cls.objects.filter(name=name).values_list('value', flat=True).afirst() or 0
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class AreaTombstone(models.Model):
+    """Record of a deleted polluted area, so delta sync clients can drop it"""
+    area_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField(db_index=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Area {self.area_id} deleted at {self.change_seq}"
@@ -0,0 +1,46 @@
+"""
+Moderation of pollution reports.
+
+Verifying, rejecting or resolving a report records who did it and when in
+verified_by and verified_at; moving it back to pending clears them.
+moderate() does this for any number of reports with a single UPDATE and
+then sends reports_moderated, as the UPDATE sends no per-row signals, so
+the data derived from report statuses can follow.
+"""
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import PollutionReport
+from .signals import reports_moderated
+
+MODERATED_STATUSES = ('verified', 'rejected', 'resolved')
+
+
+def _moderation_fields(status, user):
+    if status in MODERATED_STATUSES:
+        return {'verified_by': user, 'verified_at': timezone.now()}
+    return {'verified_by': None, 'verified_at': None}
+
+
+def stamp(report, user):
+    """Record `user` as the moderator of a report whose status was just set"""
+    for field, value in _moderation_fields(report.status, user).items():
+        setattr(report, field, value)
+
+
+def moderate(queryset, status, user):
+    """Set `status` on the reports of `queryset` that don't have it yet, returning how many changed"""
+    reports = queryset.exclude(status=status).order_by()
+    with transaction.atomic():
+        # (filing day, old status, count) of the reports about to change, for the daily rollups
+        moved = list(
+            reports.annotate(day=TruncDate('created_at')).values_list('day', 'status').annotate(count=Count('id'))
+        )
+        area_ids = set(reports.values_list('polluted_area_id', flat=True).distinct())
+        fields = _moderation_fields(status, user)
+        updated = reports.update(status=status, updated_at=fields['verified_at'] or timezone.now(), **fields)
+        if updated:
+            reports_moderated.send(sender=PollutionReport, status=status, moved=moved, area_ids=area_ids)
+    return updated
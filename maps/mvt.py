@@ -0,0 +1,212 @@
+"""
+Minimal Mapbox Vector Tile (v2.1) encoder.
+
+Only what the polluted areas layer needs is implemented: point and polygon
+geometries, clipped to the tile (plus a buffer) and quantized to the tile
+extent, with string and unsigned integer attributes. The protobuf wire
+format is written by hand so no extra dependency is required.
+"""
+from .spatial import mercator_xy
+
+EXTENT = 4096
+BUFFER = 64
+
+GEOM_POINT = 1
+GEOM_POLYGON = 3
+
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _uint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _bytes_field(field, data):
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b''.join(_varint(v) for v in values))
+
+
+def _command(command, count):
+    return (command & 0x7) | (count << 3)
+
+
+def _clip_ring(ring, lo, hi):
+    """Sutherland-Hodgman clipping of a ring against the square [lo, hi]"""
+    edges = (
+        (lambda p: p[0] >= lo, lambda a, b: _intersect_x(a, b, lo)),
+        (lambda p: p[0] <= hi, lambda a, b: _intersect_x(a, b, hi)),
+        (lambda p: p[1] >= lo, lambda a, b: _intersect_y(a, b, lo)),
+        (lambda p: p[1] <= hi, lambda a, b: _intersect_y(a, b, hi)),
+    )
+    for inside, intersect in edges:
+        if not ring:
+            break
+        clipped = []
+        prev = ring[-1]
+        for point in ring:
+            if inside(point):
+                if not inside(prev):
+                    clipped.append(intersect(prev, point))
+                clipped.append(point)
+            elif inside(prev):
+                clipped.append(intersect(prev, point))
+            prev = point
+        ring = clipped
+    return ring
+
+
+def _intersect_x(a, b, x):
+    t = (x - a[0]) / (b[0] - a[0])
+    return (x, a[1] + t * (b[1] - a[1]))
+
+
+def _intersect_y(a, b, y):
+    t = (y - a[1]) / (b[1] - a[1])
+    return (a[0] + t * (b[0] - a[0]), y)
+
+
+class TileProjection:
+    """Projects lng/lat into the integer coordinate space of one tile"""
+
+    def __init__(self, z, x, y, extent=EXTENT):
+        self.scale = (1 << z) * extent
+        self.origin_x = x * extent
+        self.origin_y = y * extent
+
+    def __call__(self, lng, lat):
+        mx, my = mercator_xy(lng, lat)
+        return (mx * self.scale - self.origin_x, my * self.scale - self.origin_y)
+
+
+def encode_point(point):
+    x, y = (int(round(v)) for v in point)
+    return [_command(CMD_MOVE_TO, 1), _zigzag(x), _zigzag(y)]
+
+
+def encode_polygon(ring, extent=EXTENT, buffer=BUFFER):
+    """
+    Clip, quantize and encode an exterior ring in tile coordinates.
+
+    Returns None if nothing of the ring is left inside the buffered tile.
+    """
+    ring = _clip_ring(ring, -buffer, extent + buffer)
+    quantized = []
+    for x, y in ring:
+        point = (int(round(x)), int(round(y)))
+        if not quantized or quantized[-1] != point:
+            quantized.append(point)
+    if len(quantized) > 1 and quantized[0] == quantized[-1]:
+        quantized.pop()
+    if len(quantized) < 3:
+        return None
+
+    # Exterior rings must wind clockwise in tile space (y pointing down)
+    area = sum(
+        quantized[i - 1][0] * quantized[i][1] - quantized[i][0] * quantized[i - 1][1]
+        for i in range(len(quantized))
+    )
+    if area == 0:
+        return None
+    if area < 0:
+        quantized.reverse()
+
+    geometry = [_command(CMD_MOVE_TO, 1)]
+    cursor_x, cursor_y = 0, 0
+    for index, (x, y) in enumerate(quantized):
+        if index == 1:
+            geometry.append(_command(CMD_LINE_TO, len(quantized) - 1))
+        geometry.extend((_zigzag(x - cursor_x), _zigzag(y - cursor_y)))
+        cursor_x, cursor_y = x, y
+    geometry.append(_command(CMD_CLOSE_PATH, 1))
+    return geometry
+
+
+class LayerBuilder:
+    """Accumulates features and their deduplicated attribute tables for one layer"""
+
+    def __init__(self, name, extent=EXTENT):
+        self.name = name
+        self.extent = extent
+        self.keys = []
+        self.values = []
+        self._key_index = {}
+        self._value_index = {}
+        self.features = []
+
+    def _tag(self, key, value):
+        if key not in self._key_index:
+            self._key_index[key] = len(self.keys)
+            self.keys.append(key)
+        value_key = (type(value), value)
+        if value_key not in self._value_index:
+            self._value_index[value_key] = len(self.values)
+            self.values.append(value)
+        return self._key_index[key], self._value_index[value_key]
+
+    def add_feature(self, feature_id, geom_type, geometry, properties):
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.extend(self._tag(key, value))
+        data = _uint_field(1, feature_id)
+        data += _packed_field(2, tags)
+        data += _uint_field(3, geom_type)
+        data += _packed_field(4, geometry)
+        self.features.append(data)
+
+    def encode(self):
+        data = _uint_field(15, 2) + _bytes_field(1, self.name.encode())
+        for feature in self.features:
+            data += _bytes_field(2, feature)
+        for key in self.keys:
+            data += _bytes_field(3, key.encode())
+        for value in self.values:
+            if isinstance(value, str):
+                encoded = _bytes_field(1, value.encode())
+            elif isinstance(value, int) and value >= 0:
+                encoded = _uint_field(5, value)
+            elif isinstance(value, int):
+                encoded = _key(6, 0) + _varint((value << 1) ^ (value >> 63))
+            else:
+                raise TypeError(f'Unsupported attribute value {value!r}')
+            data += _bytes_field(4, encoded)
+        data += _uint_field(5, self.extent)
+        return data
+
+
+def encode_tile(layers):
+    """Encode a tile from LayerBuilders, skipping empty layers"""
+    return b''.join(
+        _bytes_field(3, layer.encode()) for layer in layers if layer.features
+    )
+
+
+def buffer_degrees(zoom, extent=EXTENT, buffer=BUFFER):
+    """Longitude span of the tile buffer at `zoom`, used to widen the tile query"""
+    return 360.0 / (1 << zoom) * buffer / extent
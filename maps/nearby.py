@@ -0,0 +1,152 @@
+"""
+Radius and nearest-neighbour search around a point.
+
+Candidates are prefiltered with the quadkey index (spatial.bbox_q) over a
+bbox enclosing the search circle, then ranked by their great-circle
+distance computed with NumPy for all candidates at once. The distance to
+an area is measured to the nearest point of its extent, so a point inside
+a polygon's extent is at distance 0.
+
+Each query loads at most k * CANDIDATES_PER_RESULT rows, the closest by a
+latitude/longitude gap computed by the database. The gap is chosen to
+bound the true distance from below, so when the cap cuts a box short the
+ranked rows are still exact up to the distance that bound guarantees.
+"""
+import math
+
+import numpy as np
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least, Mod
+
+from .spatial import bbox_q
+
+EARTH_RADIUS = 6371008.8
+
+MAX_NEARBY_RESULTS = 100
+
+# Radius of the first k-nearest search; it grows fourfold until enough areas are found
+# (overshooting is cheap, as each search loads a capped number of rows)
+INITIAL_SEARCH_RADIUS = 1000.0
+SEARCH_RADIUS_GROWTH = 4
+
+# Half the equatorial circumference: farther than any point on Earth
+MAX_SEARCH_RADIUS = math.pi * EARTH_RADIUS
+
+# Rows loaded per query for each requested result
+CANDIDATES_PER_RESULT = 8
+
+CANDIDATE_FIELDS = (
+    'id', 'name', 'pollution_type', 'severity', 'latitude', 'longitude',
+    'min_lat', 'min_lng', 'max_lat', 'max_lng',
+)
+
+
+def haversine(lat, lng, lats, lngs):
+    """Distances in meters from (lat, lng) to arrays of points, all in degrees"""
+    lat, lng = math.radians(lat), math.radians(lng)
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def search_q(lat, lng, radius):
+    """Filter matching areas whose extent intersects the bbox around a search circle"""
+    delta_lat = math.degrees(radius / EARTH_RADIUS)
+    min_lat, max_lat = max(-90.0, lat - delta_lat), min(90.0, lat + delta_lat)
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 90.0 or delta_lat >= 90.0:
+        return bbox_q((-180.0, min_lat, 180.0, max_lat))
+    delta_lng = min(180.0, delta_lat / math.cos(math.radians(widest)))
+    min_lng, max_lng = lng - delta_lng, lng + delta_lng
+    if max_lng - min_lng >= 360.0:
+        return bbox_q((-180.0, min_lat, 180.0, max_lat))
+    # Split a bbox crossing the antimeridian in two
+    if min_lng < -180.0:
+        return bbox_q((min_lng + 360.0, min_lat, 180.0, max_lat)) | bbox_q((-180.0, min_lat, max_lng, max_lat))
+    if max_lng > 180.0:
+        return bbox_q((min_lng, min_lat, 180.0, max_lat)) | bbox_q((-180.0, min_lat, max_lng - 360.0, max_lat))
+    return bbox_q((min_lng, min_lat, max_lng, max_lat))
+
+
+def extent_distances(lat, lng, rows):
+    """Distance from (lat, lng) to the nearest point of each row's extent"""
+    extents = np.array(
+        [(row['min_lat'], row['min_lng'], row['max_lat'], row['max_lng']) for row in rows], dtype=float
+    ).reshape(-1, 4)
+    nearest_lat = np.clip(lat, extents[:, 0], extents[:, 2])
+    nearest_lng = np.clip(lng, extents[:, 1], extents[:, 3])
+    return haversine(lat, lng, nearest_lat, nearest_lng)
+
+
+def _search_lng_scale(lat, radius):
+    """Cosine of the highest latitude in the bbox around a search circle"""
+    delta_lat = math.degrees(radius / EARTH_RADIUS)
+    return math.cos(math.radians(min(90.0, abs(lat) + delta_lat)))
+
+
+def gap_expression(lat, lng, lng_scale):
+    """
+    Squared gap in degrees between (lat, lng) and each area's extent, with
+    the longitude gap taken the short way round and scaled by `lng_scale`
+    """
+    lat, lng = Value(float(lat)), Value(float(lng))
+    lat_gap = Greatest(F('min_lat') - lat, lat - F('max_lat'), Value(0.0))
+    direct = Greatest(F('min_lng') - lng, lng - F('max_lng'), Value(0.0))
+    around = Least(Mod(F('min_lng') - lng + 360.0, Value(360.0)), Mod(lng - F('max_lng') + 360.0, Value(360.0)))
+    lng_gap = Least(direct, around) * Value(lng_scale)
+    return lat_gap * lat_gap + lng_gap * lng_gap
+
+
+def gap_lower_bound(gap):
+    """
+    Smallest distance in meters an area with this gap can be at. With gaps
+    in radians, hav(d) >= hav(dlat) + cos^2(lat) hav(dlng) >= gap / pi^2.
+    """
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(max(gap, 0.0)) * math.radians(1) / math.pi))
+
+
+def _ranked(queryset, lat, lng, radius, limit):
+    """
+    Candidates in the bbox around a search circle as (distance, row) pairs,
+    closest first, the distance up to which no other area can be closer and
+    whether the bbox was loaded completely
+    """
+    gap = gap_expression(lat, lng, _search_lng_scale(lat, radius))
+    rows = list(
+        queryset.filter(search_q(lat, lng, radius)).annotate(gap=gap).order_by('gap').values(*CANDIDATE_FIELDS, 'gap')[:limit]
+    )
+    if not rows:
+        return [], radius, True
+    distances = extent_distances(lat, lng, rows)
+    order = np.argsort(distances, kind='stable')
+    ranked = [(float(distances[i]), rows[i]) for i in order]
+    if len(rows) < limit:
+        return ranked, radius, True
+    return ranked, min(radius, gap_lower_bound(rows[-1]['gap'])), False
+
+
+def nearby(queryset, lat, lng, radius=None, k=10):
+    """
+    Up to `k` (distance, row) pairs from `queryset`, closest first.
+
+    With a `radius` (meters) only areas within it are returned. Without
+    one the search radius starts at INITIAL_SEARCH_RADIUS and grows until
+    the bbox holds `k` areas; one more search through the k-th of them
+    then finds the nearest `k`, or the whole Earth has been searched.
+    """
+    limit = k * CANDIDATES_PER_RESULT
+    search_radius = radius if radius is not None else INITIAL_SEARCH_RADIUS
+    while True:
+        ranked, certain, complete = _ranked(queryset, lat, lng, search_radius, limit)
+        found = [pair for pair in ranked if pair[0] <= certain]
+        if len(found) >= k or (complete and (radius is not None or search_radius >= MAX_SEARCH_RADIUS)):
+            for _, row in found[:k]:
+                del row['gap']
+            return found[:k]
+        if not complete:
+            # The cap cut the bbox short before `k` areas were certain; load more of it
+            limit *= 4
+        elif len(ranked) >= k:
+            search_radius = min(ranked[k - 1][0], MAX_SEARCH_RADIUS)
+        else:
+            search_radius = min(search_radius * SEARCH_RADIUS_GROWTH, MAX_SEARCH_RADIUS)
@@ -0,0 +1,379 @@
+"""
+Full-text search over area names and descriptions and report titles and
+descriptions.
+
+Text is normalized before indexing and querying: compatibility forms are
+decomposed and combining marks (Latin accents, Arabic harakat, hamza)
+dropped, Arabic letter variants folded to their Persian forms, Persian and
+Arabic-Indic digits mapped to ASCII. Tokens are runs of letters and
+digits; a compound joined with zero-width non-joiners yields both its
+parts and the joined word, so "می‌روم" is found as "میروم" or "می روم".
+
+Documents live in an SQLite FTS5 table ranked with bm25 when FTS5 is
+available, and otherwise in the SearchTerm inverted index, one posting per
+document and term, ranked by a saturated, title-boosted term frequency
+times the term's inverse document frequency. Both match every query token,
+the last one as a prefix so results can be shown while typing; the
+inverted index expands a prefix to its most common terms only and ranks
+in the database, returning just the best matches.
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .cache import api_cache, get_data_version, get_reports_version
+from .models import PollutedArea, PollutionReport, SearchTerm, severity_color
+
+FTS_TABLE = 'maps_search_fts'
+
+KINDS = ('area', 'report')
+
+# Weight of a title match relative to a match in the description
+TITLE_WEIGHT = 4.0
+
+# Shorter final query tokens are matched exactly rather than as a prefix
+MIN_PREFIX_LENGTH = 2
+
+# Most index terms a query prefix is expanded to
+MAX_PREFIX_TERMS = 50
+
+MAX_TERM_LENGTH = 64
+MAX_SEARCH_RESULTS = 50
+
+# Most matches the admin search narrows a changelist to
+MAX_ADMIN_MATCHES = 1000
+
+SNIPPET_LENGTH = 160
+
+RESULT_AREA_FIELDS = ('name', 'pollution_type', 'severity', 'latitude', 'longitude')
+
+CHARACTER_MAP = str.maketrans({
+    'ي': 'ی',  # Arabic yeh
+    'ى': 'ی',  # Alef maksura
+    'ك': 'ک',  # Arabic kaf
+    'ة': 'ه',  # Teh marbuta
+    'ە': 'ه',  # Ae, left by decomposing heh with yeh above
+    'ٱ': 'ا',  # Alef wasla
+    'ـ': None,      # Tatweel
+    '‍': None,      # Zero-width joiner
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+})
+
+ZWNJ = '\u200c'
+
+# Runs of letters and digits; a compound written with zero-width non-joiners is one match
+TOKEN_RE = re.compile(r'[^\W_]+(?:\u200c[^\W_]+)*')
+
+TOKEN_SATURATION = 1.2
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(character for character in text if not unicodedata.combining(character))
+    return text.translate(CHARACTER_MAP).casefold()
+
+
+def tokenize(text):
+    tokens = []
+    for word in TOKEN_RE.findall(normalize(text)):
+        if ZWNJ in word:
+            # Also written with a space or joined up: index both the parts and the whole
+            tokens.extend(word.split(ZWNJ))
+            word = word.replace(ZWNJ, '')
+        tokens.append(word[:MAX_TERM_LENGTH])
+    return tokens
+
+
+def area_documents(queryset):
+    """(object id, area id, title, body) of areas"""
+    for area_id, name, description in queryset.values_list('pk', 'name', 'description').iterator(chunk_size=2000):
+        yield area_id, area_id, name, description
+
+
+def report_documents(queryset):
+    """(object id, area id, title, body) of reports"""
+    rows = queryset.values_list('pk', 'polluted_area_id', 'title', 'description')
+    yield from rows.iterator(chunk_size=2000)
+
+
+def fts5_available(db_connection):
+    if db_connection.vendor != 'sqlite':
+        return False
+    try:
+        with db_connection.cursor() as cursor:
+            cursor.execute('CREATE VIRTUAL TABLE temp.maps_fts5_probe USING fts5(text)')
+            cursor.execute('DROP TABLE temp.maps_fts5_probe')
+    except Exception:
+        return False
+    return True
+
+
+def use_fts(db_connection):
+    """Whether the FTS5 backend should be used on a connection"""
+    return getattr(settings, 'MAP_SEARCH_BACKEND', 'auto') != 'inverted' and fts5_available(db_connection)
+
+
+def create_fts_table(db_connection):
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            "area_id UNINDEXED, title, body, tokenize = 'unicode61 remove_diacritics 0')"
+        )
+
+
+def drop_fts_table(db_connection):
+    with db_connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def _match_expression(tokens):
+    terms = [f'"{token}"' for token in tokens]
+    if len(tokens[-1]) >= MIN_PREFIX_LENGTH:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class FtsIndex:
+    """
+    Documents in an FTS5 table; the rowid packs the object id and its kind
+    (even for areas, odd for reports) so updates and deletes are lookups.
+    """
+
+    def __init__(self, db_connection):
+        self.connection = db_connection
+
+    @staticmethod
+    def _rowid(kind, object_id):
+        return object_id * 2 + KINDS.index(kind)
+
+    def index(self, kind, documents):
+        rows = [
+            (self._rowid(kind, object_id), area_id, ' '.join(tokenize(title)), ' '.join(tokenize(body)))
+            for object_id, area_id, title, body in documents
+        ]
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, area_id, title, body) VALUES (%s, %s, %s, %s)', rows)
+
+    def remove(self, kind, ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(self._rowid(kind, pk),) for pk in ids])
+
+    def clear(self, kind):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid %% 2 = %s', [KINDS.index(kind)])
+
+    def search(self, tokens, kinds=None, active_only=True, limit=MAX_SEARCH_RESULTS):
+        """(kind, object id, area id, score) of the best matches, best first"""
+        sql = f'SELECT f.rowid, f.area_id, -bm25({FTS_TABLE}, 0.0, {TITLE_WEIGHT}, 1.0) AS score FROM {FTS_TABLE} f'
+        if active_only:
+            sql += f' JOIN {PollutedArea._meta.db_table} a ON a.id = f.area_id AND a.is_active'
+        sql += f' WHERE {FTS_TABLE} MATCH %s'
+        params = [_match_expression(tokens)]
+        if kinds and set(kinds) != set(KINDS):
+            sql += ' AND f.rowid %% 2 = %s'
+            params.append(KINDS.index(kinds[0]))
+        sql += ' ORDER BY score DESC LIMIT %s'
+        params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [(KINDS[rowid % 2], rowid // 2, area_id, score) for rowid, area_id, score in cursor.fetchall()]
+
+
+class InvertedIndex:
+    """Documents as SearchTerm postings"""
+
+    def __init__(self, model=SearchTerm):
+        self.model = model
+
+    def _postings(self, kind, documents):
+        for object_id, area_id, title, body in documents:
+            title_counts, body_counts = Counter(tokenize(title)), Counter(tokenize(body))
+            for term in title_counts.keys() | body_counts.keys():
+                weight = sum(
+                    field_weight * count / (count + TOKEN_SATURATION)
+                    for field_weight, count in ((TITLE_WEIGHT, title_counts[term]), (1.0, body_counts[term]))
+                )
+                yield self.model(term=term, kind=kind, object_id=object_id, area_id=area_id, weight=weight)
+
+    def index(self, kind, documents):
+        documents = list(documents)
+        with transaction.atomic():
+            self.remove(kind, [document[0] for document in documents])
+            self.model.objects.bulk_create(self._postings(kind, documents), batch_size=2000)
+
+    def remove(self, kind, ids):
+        self.model.objects.filter(kind=kind, object_id__in=ids).delete()
+
+    def clear(self, kind):
+        self.model.objects.filter(kind=kind).delete()
+
+    def _document_count(self, active_only):
+        """Number of searchable documents, for the IDF; cached per areas and reports version"""
+        cache = api_cache()
+        key = f'maps:search:documents:{int(active_only)}:{get_data_version()}:{get_reports_version()}'
+        total = cache.get(key)
+        if total is None:
+            areas = PollutedArea.objects.filter(is_active=True) if active_only else PollutedArea.objects.all()
+            reports = PollutionReport.objects.filter(polluted_area__in=areas) if active_only else PollutionReport.objects.all()
+            total = areas.count() + reports.count()
+            cache.set(key, total, getattr(settings, 'MAP_API_CACHE_TIMEOUT', 60 * 60))
+        return total
+
+    def _term_idfs(self, postings, token, prefix, total):
+        """{term: inverse document frequency} of the terms a query token matches"""
+        if prefix:
+            # A range over the index instead of LIKE, which SQLite cannot serve from it
+            matches = postings.filter(term__gte=token, term__lt=token + '\U0010ffff')
+        else:
+            matches = postings.filter(term=token)
+        # The most common expansions of a prefix cover the most documents
+        rows = matches.values('term').annotate(documents=Count('pk')).order_by('-documents', 'term')
+        return {row['term']: math.log(1 + total / row['documents']) for row in rows[:MAX_PREFIX_TERMS]}
+
+    def search(self, tokens, kinds=None, active_only=True, limit=MAX_SEARCH_RESULTS):
+        """(kind, object id, area id, score) of the best matches, best first"""
+        postings = self.model.objects.all()
+        conditions, condition_params = '', []
+        if kinds:
+            postings = postings.filter(kind__in=kinds)
+            conditions += f" AND kind IN ({', '.join(['%s'] * len(kinds))})"
+            condition_params.extend(kinds)
+        if active_only:
+            postings = postings.filter(area_id__in=PollutedArea.objects.filter(is_active=True).values('pk'))
+            conditions += f' AND area_id IN (SELECT id FROM {PollutedArea._meta.db_table} WHERE is_active)'
+        total = self._document_count(active_only)
+
+        # A document's score for a token is that of its best matching term;
+        # the database sums them over the tokens and returns only the best
+        # documents matching every token
+        selects, params = [], []
+        for position, token in enumerate(tokens):
+            prefix = position == len(tokens) - 1 and len(token) >= MIN_PREFIX_LENGTH
+            idfs = self._term_idfs(postings, token, prefix, total)
+            if not idfs:
+                return []
+            selects.append(
+                f"SELECT kind, object_id, MAX(area_id) AS area_id, "
+                f"MAX(weight * CASE term {'WHEN %s THEN %s ' * len(idfs)}END) AS score "
+                f"FROM {self.model._meta.db_table} "
+                f"WHERE term IN ({', '.join(['%s'] * len(idfs))}){conditions} GROUP BY kind, object_id"
+            )
+            params.extend(value for item in idfs.items() for value in item)
+            params.extend(idfs)
+            params.extend(condition_params)
+        sql = (
+            f"SELECT kind, object_id, MAX(area_id), SUM(score) AS total FROM ({' UNION ALL '.join(selects)}) matches "
+            'GROUP BY kind, object_id HAVING COUNT(*) = %s ORDER BY total DESC, kind, object_id LIMIT %s'
+        )
+        params.extend([len(tokens), limit])
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [tuple(row) for row in cursor.fetchall()]
+
+
+_fts = None
+
+
+def get_index():
+    """The index in use: FTS5 once its table exists, the inverted index otherwise"""
+    global _fts
+    if _fts is None:
+        _fts = use_fts(connection) and FTS_TABLE in connection.introspection.table_names()
+    return FtsIndex(connection) if _fts else InvertedIndex()
+
+
+def populate(index, areas=None, reports=None, batch_size=2000, progress=None):
+    """Replace the documents of each kind given as a queryset in `index`, in batches"""
+    for kind, documents in (('area', areas), ('report', reports)):
+        if documents is None:
+            continue
+        documents = area_documents(documents) if kind == 'area' else report_documents(documents)
+        index.clear(kind)
+        done = 0
+        while True:
+            batch = [document for _, document in zip(range(batch_size), documents)]
+            if batch:
+                index.index(kind, batch)
+                done += len(batch)
+            if progress:
+                progress(kind, done)
+            if len(batch) < batch_size:
+                break
+
+
+def index_areas(ids):
+    get_index().index('area', area_documents(PollutedArea.objects.filter(pk__in=ids)))
+
+
+def index_reports(ids):
+    get_index().index('report', report_documents(PollutionReport.objects.filter(pk__in=ids)))
+
+
+def remove(kind, ids):
+    get_index().remove(kind, ids)
+
+
+def rebuild_areas():
+    """Reindex every area, after bulk writes that sent no per-row signals"""
+    populate(get_index(), areas=PollutedArea.objects.all())
+
+
+def matching_ids(kind, query, limit=MAX_ADMIN_MATCHES):
+    """Ids of the best matching areas or reports, active or not, for the admin"""
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    return [object_id for _, object_id, _, _ in get_index().search(tokens, [kind], False, limit)]
+
+
+def _snippet(text):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= SNIPPET_LENGTH else text[:SNIPPET_LENGTH - 1].rstrip() + '…'
+
+
+def search(query, kinds=None, limit=20):
+    """
+    Ranked matches among the active areas and their reports.
+
+    Each result has the matched object's kind, id, title and a snippet of
+    its description, plus the area it belongs to with its location.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    hits = get_index().search(tokens, kinds, True, limit)
+    areas = PollutedArea.objects.only(*RESULT_AREA_FIELDS).in_bulk({area_id for _, _, area_id, _ in hits})
+    reports = PollutionReport.objects.only('title', 'description').in_bulk(
+        {object_id for kind, object_id, _, _ in hits if kind == 'report'}
+    )
+
+    results = []
+    for kind, object_id, area_id, score in hits:
+        area = areas.get(area_id)
+        matched = area if kind == 'area' else reports.get(object_id)
+        if area is None or matched is None:
+            continue
+        results.append({
+            'kind': kind,
+            'id': object_id,
+            'title': area.name if kind == 'area' else matched.title,
+            'snippet': _snippet(matched.description),
+            'score': round(score, 4),
+            'area': {
+                'id': area.pk,
+                'name': area.name,
+                'pollution_type': area.pollution_type,
+                'severity': area.severity,
+                'severity_color': severity_color(area.severity),
+                'latitude': area.latitude,
+                'longitude': area.longitude,
+            },
+        })
+    return results
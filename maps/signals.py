@@ -0,0 +1,177 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import clustering, events, images, search, sync, tiles
+from .cache import bump_data_version, bump_reports_version
+from .models import PollutedArea, PollutionReport
+
+EXTENT_FIELDS = ('min_lat', 'min_lng', 'max_lat', 'max_lng')
+
+AREA_SEARCH_FIELDS = ('name', 'description')
+REPORT_SEARCH_FIELDS = ('title', 'description', 'polluted_area_id')
+
+# Sent after areas were written in bulk (bulk_create, bulk_update, update()),
+# which sends no per-row signals; receivers rebuild their derived data.
+# Optional `since` is the areas change sequence number read before the
+# write, so every area written has a later change_seq, and optional
+# `fields` names the only fields that were written.
+areas_bulk_changed = Signal()
+
+# Sent by maps.moderation.moderate() after setting the `status` of reports
+# with one UPDATE; `moved` lists (filing day, old status, count) and
+# `area_ids` holds the areas of the changed reports.
+reports_moderated = Signal()
+
+
+@receiver(post_save, sender=PollutedArea)
+def update_clusters_on_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    clustering.update_area(instance, created)
+
+
+@receiver(post_delete, sender=PollutedArea)
+def update_clusters_on_delete(sender, instance, **kwargs):
+    clustering.remove_area(instance)
+
+
+@receiver(post_save, sender=PollutedArea)
+def invalidate_tiles_on_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    old = None if created else tuple(instance.previous_value(field) for field in EXTENT_FIELDS)
+    new = tuple(getattr(instance, field) for field in EXTENT_FIELDS)
+    transaction.on_commit(lambda: tiles.invalidate_bounds(old, new))
+
+
+@receiver(post_delete, sender=PollutedArea)
+def invalidate_tiles_on_delete(sender, instance, **kwargs):
+    old = tuple(instance.previous_value(field) for field in EXTENT_FIELDS)
+    transaction.on_commit(lambda: tiles.invalidate_bounds(old))
+
+
+@receiver(post_delete, sender=PollutedArea)
+def record_tombstone_on_delete(sender, instance, **kwargs):
+    # Written in the deleting transaction, so the tombstone exists exactly when the deletion does
+    sync.record_deletion(instance.pk)
+
+
+@receiver(post_save, sender=PollutionReport)
+@receiver(post_delete, sender=PollutionReport)
+def bump_reports_version_on_change(sender, instance, raw=False, **kwargs):
+    # Area fragments follow their reports' rows; the overall version is a counter
+    if raw:
+        return
+    transaction.on_commit(bump_reports_version)
+
+
+@receiver(reports_moderated)
+def bump_reports_version_after_moderation(sender, **kwargs):
+    transaction.on_commit(bump_reports_version)
+
+
+def _file_name(value):
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_save, sender=PollutedArea)
+def generate_image_derivatives(sender, instance, created, raw, **kwargs):
+    if raw or not instance.image:
+        return
+    name = instance.image.name
+    if not created and _file_name(instance.previous_value('image')) == name:
+        return
+    transaction.on_commit(lambda: images.schedule(name))
+
+
+def _changed(instance, fields):
+    return any(instance.previous_value(field) != getattr(instance, field) for field in fields)
+
+
+@receiver(post_save, sender=PollutedArea)
+def index_area_on_save(sender, instance, created, raw, **kwargs):
+    if raw or not (created or _changed(instance, AREA_SEARCH_FIELDS)):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: search.index_areas([pk]))
+
+
+@receiver(post_delete, sender=PollutedArea)
+def unindex_area_on_delete(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: search.remove('area', [pk]))
+
+
+@receiver(post_save, sender=PollutionReport)
+def index_report_on_save(sender, instance, created, raw, **kwargs):
+    if raw or not (created or _changed(instance, REPORT_SEARCH_FIELDS)):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: search.index_reports([pk]))
+
+
+@receiver(post_delete, sender=PollutionReport)
+def unindex_report_on_delete(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: search.remove('report', [pk]))
+
+
+def _publish(event):
+    transaction.on_commit(lambda: events.get_broker().publish(event))
+
+
+@receiver(post_save, sender=PollutedArea)
+def publish_area_on_save(sender, instance, created, raw, **kwargs):
+    was_active = not created and instance.previous_value('is_active')
+    if raw or not (instance.is_active or was_active):
+        return
+    action = 'created' if created else 'updated' if instance.is_active else 'deleted'
+    old = None if created else tuple(instance.previous_value(field) for field in EXTENT_FIELDS)
+    new = tuple(getattr(instance, field) for field in EXTENT_FIELDS)
+    _publish(events.area_event(instance, action, [old, new]))
+
+
+@receiver(post_delete, sender=PollutedArea)
+def publish_area_on_delete(sender, instance, **kwargs):
+    if instance.previous_value('is_active'):
+        old = tuple(instance.previous_value(field) for field in EXTENT_FIELDS)
+        _publish(events.area_event(instance, 'deleted', [old]))
+
+
+@receiver(post_save, sender=PollutionReport)
+def publish_report_on_save(sender, instance, created, raw, **kwargs):
+    if raw or not (created or _changed(instance, ('status',))):
+        return
+    extent = PollutedArea.objects.filter(pk=instance.polluted_area_id).values_list(*EXTENT_FIELDS).first()
+    _publish(events.report_event(instance, 'created' if created else 'status', extent))
+
+
+@receiver(reports_moderated)
+def publish_reports_moderated(sender, status, moved, area_ids, **kwargs):
+    # One event for the whole batch, reaching the clients viewing any of its areas
+    extents = {
+        pk: extent for pk, *extent in
+        PollutedArea.objects.filter(pk__in=area_ids, is_active=True).values_list('pk', *EXTENT_FIELDS)
+    }
+    if extents:
+        _publish(events.moderation_event(status, sum(count for *_, count in moved), extents))
+
+
+@receiver(areas_bulk_changed)
+def rebuild_after_bulk_change(sender, **kwargs):
+    def rebuild():
+        clustering.rebuild()
+        tiles.invalidate_all()
+        bump_data_version()
+    transaction.on_commit(rebuild)
+
+
+@receiver(areas_bulk_changed)
+def reindex_areas_after_bulk_change(sender, **kwargs):
+    transaction.on_commit(search.rebuild_areas)
+
+
+@receiver(areas_bulk_changed)
+def publish_reload_after_bulk_change(sender, **kwargs):
+    _publish(events.reload_event())
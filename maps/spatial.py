@@ -0,0 +1,181 @@
+"""
+Spatial indexing helpers for polluted areas.
+
+Every area is assigned the quadkey of the smallest Web Mercator tile that
+fully contains its bounding box. Quadkeys are stored in an indexed column, so
+a viewport query becomes a handful of equality and prefix-range lookups on a
+single B-tree index instead of a scan over latitude/longitude.
+"""
+import math
+
+from django.db.models import Q
+
+# Web Mercator cannot represent the poles, so latitudes are clamped.
+MAX_LATITUDE = 85.0511287798
+
+# Deepest quadtree level an area can be assigned to (~150 m tiles).
+MAX_INDEX_LEVEL = 18
+
+# Maximum number of quadtree cells used to cover a viewport.
+MAX_COVER_CELLS = 16
+
+# Sorts after every quadkey digit ('0'-'3'), used as a prefix range bound.
+QUADKEY_UPPER_BOUND = '4'
+
+
+def clamp_latitude(lat):
+    return max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+
+
+def clamp_longitude(lng):
+    return max(-180.0, min(180.0, lng))
+
+
+def mercator_xy(lng, lat):
+    """Project a point to Web Mercator, normalized to [0, 1] with y pointing south"""
+    lat_rad = math.radians(clamp_latitude(lat))
+    x = (clamp_longitude(lng) + 180.0) / 360.0
+    y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0
+    return x, y
+
+
+def lnglat_to_tile(lng, lat, zoom):
+    """Return the (x, y) Web Mercator tile containing a point at `zoom`"""
+    n = 1 << zoom
+    x, y = mercator_xy(lng, lat)
+    return min(n - 1, max(0, int(x * n))), min(n - 1, max(0, int(y * n)))
+
+
+def tile_bounds(x, y, zoom):
+    """Return (min_lng, min_lat, max_lng, max_lat) of a Web Mercator tile"""
+    n = 1 << zoom
+
+    def tile_lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return (
+        x / n * 360.0 - 180.0,
+        tile_lat(y + 1),
+        (x + 1) / n * 360.0 - 180.0,
+        tile_lat(y),
+    )
+
+
+def tile_to_quadkey(x, y, zoom):
+    digits = []
+    for level in range(zoom, 0, -1):
+        mask = 1 << (level - 1)
+        digit = 0
+        if x & mask:
+            digit += 1
+        if y & mask:
+            digit += 2
+        digits.append(str(digit))
+    return ''.join(digits)
+
+
+def tile_range(bbox, zoom):
+    """Return (x0, y0, x1, y1), the tiles at `zoom` covering a bbox"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    x0, y0 = lnglat_to_tile(min_lng, max_lat, zoom)
+    x1, y1 = lnglat_to_tile(max_lng, min_lat, zoom)
+    return x0, y0, x1, y1
+
+
+def quadkey_for_bounds(min_lat, min_lng, max_lat, max_lng, max_level=MAX_INDEX_LEVEL):
+    """Return the quadkey of the smallest tile fully containing the bounds"""
+    for level in range(max_level, 0, -1):
+        x0, y0, x1, y1 = tile_range((min_lng, min_lat, max_lng, max_lat), level)
+        if x0 == x1 and y0 == y1:
+            return tile_to_quadkey(x0, y0, level)
+    return ''
+
+
+def bounds_from_coordinates(coordinates):
+    """Return (min_lat, min_lng, max_lat, max_lng) for a list of [lat, lng] pairs"""
+    lats = [point[0] for point in coordinates]
+    lngs = [point[1] for point in coordinates]
+    return min(lats), min(lngs), max(lats), max(lngs)
+
+
+def parse_bbox(value):
+    """
+    Parse a `minLng,minLat,maxLng,maxLat` query parameter.
+
+    Raises ValueError if the value is malformed.
+    """
+    parts = value.split(',')
+    if len(parts) != 4:
+        raise ValueError('bbox must be minLng,minLat,maxLng,maxLat')
+    min_lng, min_lat, max_lng, max_lat = (float(part) for part in parts)
+    if not all(math.isfinite(v) for v in (min_lng, min_lat, max_lng, max_lat)):
+        raise ValueError('bbox values must be finite numbers')
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError('bbox minimums must not exceed maximums')
+    return (
+        clamp_longitude(min_lng),
+        max(-90.0, min_lat),
+        clamp_longitude(max_lng),
+        min(90.0, max_lat),
+    )
+
+
+def parse_zoom(value):
+    """Parse an optional `zoom` query parameter. Raises ValueError if malformed."""
+    if value in (None, ''):
+        return None
+    zoom = int(value)
+    if not 0 <= zoom <= 24:
+        raise ValueError('zoom must be between 0 and 24')
+    return zoom
+
+
+def covering_quadkeys(bbox, zoom=None):
+    """
+    Return the quadkeys of the cells covering a bbox.
+
+    The deepest level whose cover stays within MAX_COVER_CELLS is used. When
+    the map zoom is known it caps the level, since a viewport at zoom z spans
+    only a few tiles at level z.
+    """
+    level = MAX_INDEX_LEVEL if zoom is None else min(zoom, MAX_INDEX_LEVEL)
+    while level > 0:
+        x0, y0, x1, y1 = tile_range(bbox, level)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= MAX_COVER_CELLS:
+            break
+        level -= 1
+    if level == 0:
+        return ['']
+    x0, y0, x1, y1 = tile_range(bbox, level)
+    return [
+        tile_to_quadkey(x, y, level)
+        for x in range(x0, x1 + 1)
+        for y in range(y0, y1 + 1)
+    ]
+
+
+def bbox_q(bbox, zoom=None):
+    """
+    Build a filter matching areas whose extent intersects a bbox.
+
+    An area intersecting a covering cell is either stored in that cell or
+    one of its descendants (a prefix range on the quadkey index), or in one
+    of its ancestors (an exact quadkey match). The denormalized extent
+    columns then discard candidates that only share a cell with the bbox.
+    """
+    cells = covering_quadkeys(bbox, zoom)
+    ancestors = {cell[:length] for cell in cells for length in range(len(cell))}
+
+    index_q = Q()
+    for cell in cells:
+        index_q |= Q(quadkey__gte=cell, quadkey__lt=cell + QUADKEY_UPPER_BOUND)
+    if ancestors:
+        index_q |= Q(quadkey__in=sorted(ancestors))
+
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return index_q & Q(
+        min_lat__lte=max_lat,
+        max_lat__gte=min_lat,
+        min_lng__lte=max_lng,
+        max_lng__gte=min_lng,
+    )
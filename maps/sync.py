@@ -0,0 +1,113 @@
+"""
+Delta sync of polluted areas.
+
+Every write to an area stamps it with the next number of the areas change
+sequence (PollutedArea.change_seq), and deleting one leaves an AreaTombstone
+stamped the same way. A client keeping a local copy asks the areas API for
+`?since=<cursor>` and gets, in sequence order, the active areas changed
+after the cursor, the ids of the areas deactivated or deleted after it and
+the cursor to send next time; `since=0` starts a copy from scratch.
+
+Tombstones older than a retention period are pruned; cursors from before
+the last pruned tombstone can no longer be served and the client has to
+start over.
+"""
+import heapq
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .geometry import lod_geometry
+from .geojson import FEATURE_FIELDS, area_feature, pollution_type_labels
+from .models import AreaTombstone, ChangeSequence, PollutedArea
+
+DEFAULT_CHANGES = 1000
+
+MAX_CHANGES = 5000
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def parse_cursor(value):
+    if not (value.isascii() and value.isdigit()):
+        raise ValueError('since must be a cursor from an earlier response, or 0')
+    return int(value)
+
+
+def stamp(areas):
+    """Give areas about to be bulk written new sequence numbers; call in the writing transaction"""
+    if areas:
+        first = ChangeSequence.reserve(ChangeSequence.AREAS, len(areas))
+        for offset, area in enumerate(areas):
+            area.change_seq = first + offset
+
+
+def record_deletion(area_id):
+    """Leave a tombstone for a deleted area; call in the deleting transaction"""
+    with transaction.atomic():
+        AreaTombstone.objects.create(area_id=area_id, change_seq=ChangeSequence.reserve(ChangeSequence.AREAS))
+
+
+def changes(since, zoom=None, limit=DEFAULT_CHANGES):
+    """
+    Areas API delta response for the changes after the `since` cursor.
+
+    Returns {"features": [...], "deleted": [ids], "cursor": n, "more": bool};
+    with `more` the page was cut at `limit` changes and the client should
+    ask again from the new cursor straight away. Raises CursorExpired if
+    tombstones after `since` were already pruned.
+    """
+    if since and since < ChangeSequence.current(ChangeSequence.AREAS_PRUNED):
+        raise CursorExpired('Cursor expired; reload all areas with since=0')
+    # Everything up to the counter has committed (see ChangeSequence), so the
+    # changes up to it are complete; later ones are left for the next call
+    upper = ChangeSequence.current(ChangeSequence.AREAS)
+    areas = PollutedArea.objects.filter(change_seq__gt=since, change_seq__lte=upper).order_by('change_seq')
+    tombstones = AreaTombstone.objects.filter(change_seq__gt=since, change_seq__lte=upper).order_by('change_seq')
+    if since:
+        area_rows = areas.values(*FEATURE_FIELDS, 'change_seq', 'is_active', geometry=lod_geometry(zoom))[:limit + 1]
+        deletions = [
+            {'id': area_id, 'change_seq': change_seq}
+            for area_id, change_seq in tombstones.values_list('area_id', 'change_seq')[:limit + 1]
+        ]
+    else:
+        # A new copy needs no deletions
+        area_rows = areas.filter(is_active=True).values(
+            *FEATURE_FIELDS, 'change_seq', 'is_active', geometry=lod_geometry(zoom)
+        )[:limit + 1]
+        deletions = []
+
+    entries = list(heapq.merge(area_rows, deletions, key=lambda row: row['change_seq']))
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    labels = pollution_type_labels()
+    features, deleted = [], []
+    for row in entries:
+        if row.get('is_active'):
+            features.append(area_feature(row, labels))
+        else:
+            deleted.append(row['id'])
+    return {
+        'type': 'FeatureCollection',
+        'features': features,
+        'deleted': deleted,
+        'cursor': entries[-1]['change_seq'] if more else max(upper, since),
+        'more': more,
+    }
+
+
+def prune_tombstones(days):
+    """Delete tombstones older than `days`, returning how many were removed"""
+    cutoff = timezone.now() - timedelta(days=days)
+    with transaction.atomic():
+        old = AreaTombstone.objects.filter(deleted_at__lt=cutoff)
+        last = old.order_by('-change_seq').values_list('change_seq', flat=True).first()
+        if last is None:
+            return 0
+        ChangeSequence.objects.update_or_create(name=ChangeSequence.AREAS_PRUNED, defaults={'value': last})
+        deleted, _ = AreaTombstone.objects.filter(change_seq__lte=last).delete()
+    return deleted
@@ -0,0 +1,29 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import format_html
+
+from maps import images
+
+register = template.Library()
+
+
+def image_url(area, size, extension):
+    """Derivative URL if it exists, otherwise the view that generates it on demand"""
+    if images.derivative_exists(area.image.name, size, extension):
+        return images.derivative_url(area.image.name, size, extension)
+    return reverse('maps:area_image', args=[area.pk, size, extension])
+
+
+@register.simple_tag
+def area_picture(area, size, css_class='', alt=None, style=''):
+    """<picture> of an area's photo at a derivative size, WebP with a JPEG fallback"""
+    if not area.image:
+        return ''
+    return format_html(
+        '<picture><source srcset="{}" type="image/webp"><img src="{}" alt="{}" class="{}" style="{}" loading="lazy"></picture>',
+        image_url(area, size, 'webp'),
+        image_url(area, size, 'jpg'),
+        area.name if alt is None else alt,
+        css_class,
+        style,
+    )
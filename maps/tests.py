@@ -0,0 +1,729 @@
+import io
+import json
+import math
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.pagination import CursorPaginator, InvalidCursor
+from dashboard import rollups, stats
+from dashboard.models import AreaDailyRollup, ReportDailyRollup, StatCounter
+
+from . import containment, geojson, moderation, mvt, nearby, search, sync, tiles, views
+from .cache import api_cache
+from .geometry import AUTHALIC_RADIUS, geodesic_area, polygon_centroid
+from .models import AreaTombstone, ChangeSequence, PollutedArea, PollutionReport
+from .signals import areas_bulk_changed
+
+
+def make_area(user, name='Area', lat=0.0, lng=0.0, polygon=None, **fields):
+    area = PollutedArea(
+        name=name, pollution_type=fields.pop('pollution_type', 'air'), severity=fields.pop('severity', 3),
+        latitude=lat, longitude=lng, created_by=user, **fields
+    )
+    if polygon:
+        area.set_polygon_coordinates(polygon)
+    area.save()
+    return area
+
+
+def cell_area(min_lat, max_lat, lng_span):
+    """Closed-form area of a latitude/longitude cell on the authalic sphere, in square meters"""
+    return AUTHALIC_RADIUS ** 2 * math.radians(lng_span) * (
+        math.sin(math.radians(max_lat)) - math.sin(math.radians(min_lat))
+    )
+
+
+class GeodesicAreaTests(TestCase):
+    def assertRelativelyClose(self, value, expected, tolerance=1e-9):
+        self.assertLessEqual(abs(value - expected), tolerance * expected, f'{value} != {expected}')
+
+    def test_equatorial_cell(self):
+        ring = [[0, 0], [0, 1], [1, 1], [1, 0]]
+        self.assertRelativelyClose(geodesic_area(ring), cell_area(0, 1, 1))
+
+    def test_sphere_octant(self):
+        # The pole is an edge along the 90th parallel, so it appears twice
+        ring = [[0, 0], [0, 90], [90, 90], [90, 0]]
+        self.assertRelativelyClose(geodesic_area(ring), 4 * math.pi * AUTHALIC_RADIUS ** 2 / 8)
+
+    def test_colorado_bounding_box(self):
+        ring = [[37, -109.05], [37, -102.05], [41, -102.05], [41, -109.05]]
+        area = geodesic_area(ring)
+        self.assertRelativelyClose(area, cell_area(37, 41, 7))
+        # Area of the same box on the WGS 84 ellipsoid
+        self.assertRelativelyClose(area, 269216.89e6, tolerance=0.005)
+
+    def test_ring_crossing_antimeridian(self):
+        ring = [[0, 179], [0, -179], [1, -179], [1, 179]]
+        self.assertRelativelyClose(geodesic_area(ring), cell_area(0, 1, 2))
+
+    def test_orientation_and_degenerate_rings(self):
+        ring = [[0, 0], [0, 1], [1, 1], [1, 0]]
+        self.assertEqual(geodesic_area(ring), geodesic_area(ring[::-1]))
+        self.assertEqual(geodesic_area([[0, 0], [1, 1]]), 0.0)
+        self.assertEqual(geodesic_area(None), 0.0)
+
+
+class PolygonCentroidTests(TestCase):
+    def test_symmetric_ring(self):
+        lat, lng = polygon_centroid([[44, 9], [44, 11], [46, 11], [46, 9]])
+        self.assertAlmostEqual(lat, 45, places=9)
+        self.assertAlmostEqual(lng, 10, places=9)
+
+    def test_symmetric_ring_across_antimeridian(self):
+        lat, lng = polygon_centroid([[-1, 179], [-1, -179], [1, -179], [1, 179]])
+        self.assertAlmostEqual(lat, 0, places=9)
+        self.assertAlmostEqual(abs(lng), 180, places=9)
+
+    def test_degenerate_ring_falls_back_to_vertex_mean(self):
+        lat, lng = polygon_centroid([[10, 20], [10, 20], [10, 20]])
+        self.assertAlmostEqual(lat, 10, places=9)
+        self.assertAlmostEqual(lng, 20, places=9)
+
+
+class StreamingGeoJSONTests(TestCase):
+    def setUp(self):
+        api_cache().clear()
+        self.user = User.objects.create_user('mapper')
+        self.client.force_login(self.user)
+        make_area(self.user, 'Point', 10, 20)
+        make_area(self.user, 'Polygon', polygon=[[0, 0], [0, 1], [1, 1], [1, 0]])
+        make_area(self.user, 'Hidden', 5, 5, is_active=False)
+
+    def test_streamed_collection_matches_buffered_response(self):
+        buffered = self.client.get(reverse('maps:areas_json')).json()
+        response = self.client.get(reverse('maps:areas_json'), {'stream': '1'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), buffered)
+        self.assertEqual(sorted(f['properties']['name'] for f in buffered['features']), ['Point', 'Polygon'])
+
+    def test_feature_sequence(self):
+        response = self.client.get(reverse('maps:areas_json'), {'format': 'geojsonseq'})
+        self.assertEqual(response['Content-Type'], 'application/geo+json-seq')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        features = [json.loads(line) for line in lines]
+        self.assertEqual({f['geometry']['type'] for f in features}, {'Point', 'Polygon'})
+
+    def test_small_buffers_split_the_document_into_chunks(self):
+        rows = list(geojson.feature_values(PollutedArea.objects.filter(is_active=True)))
+        labels = geojson.pollution_type_labels()
+        with mock.patch.object(geojson, 'STREAM_BUFFER_SIZE', 10):
+            chunks = list(geojson.iter_feature_collection(iter(rows), labels))
+
+            async def collect():
+                async def arows():
+                    for row in rows:
+                        yield row
+                return [chunk async for chunk in geojson.aiter_feature_collection(arows(), labels)]
+            async_chunks = async_to_sync(collect)()
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(async_chunks, chunks)
+        self.assertEqual(len(json.loads(b''.join(chunks))['features']), 2)
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(reverse('maps:areas_json'), {'format': 'kml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AreasETagTests(TestCase):
+    def setUp(self):
+        api_cache().clear()
+        self.user = User.objects.create_user('mapper')
+        self.client.force_login(self.user)
+        self.area = make_area(self.user, 'Point', 10, 20)
+        self.url = reverse('maps:areas_json')
+
+    def test_unchanged_data_is_not_modified(self):
+        first = self.client.get(self.url)
+        etag = first['ETag']
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], etag)
+        self.assertEqual(second.content, b'')
+
+    def test_saving_an_area_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.area.name = 'Renamed'
+        self.area.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['features'][0]['properties']['name'], 'Renamed')
+
+    def test_etag_depends_on_query_and_language(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertNotEqual(self.client.get(self.url, {'zoom': '5'})['ETag'], etag)
+        self.assertNotEqual(self.client.get(self.url, HTTP_ACCEPT_LANGUAGE='fa')['ETag'], etag)
+
+    def test_body_is_cached_per_data_version(self):
+        with mock.patch.object(views, '_areas_feature_collection', wraps=views._areas_feature_collection) as build:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+            self.assertEqual(build.call_count, 1)
+            self.assertEqual(second.content, first.content)
+            make_area(self.user, 'Another', 11, 21)
+            third = self.client.get(self.url)
+            self.assertEqual(build.call_count, 2)
+        self.assertEqual(len(third.json()['features']), 2)
+
+
+def counters():
+    return dict(StatCounter.objects.exclude(value=0).values_list('key', 'value'))
+
+
+def bulk_create_areas(user, count, **fields):
+    areas = [
+        PollutedArea(name=f'Bulk {number}', pollution_type='air', severity=2, latitude=number, longitude=number,
+                     created_by=user, **fields)
+        for number in range(count)
+    ]
+    sync.stamp(areas)
+    return PollutedArea.objects.bulk_create(areas)
+
+
+# Bulk change receivers bump the tile generation; keep it out of the on-disk tile cache
+@override_settings(MAP_TILE_CACHE='default')
+class IncrementalStatsTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.reporter = User.objects.create_user('reporter')
+
+    def assertMatchesRebuild(self):
+        incremental = counters()
+        stats.rebuild()
+        self.assertEqual(incremental, counters())
+
+    def test_counters_follow_saves_and_deletes(self):
+        air = make_area(self.owner, 'Air', 1, 1)
+        water = make_area(self.owner, 'Water', 2, 2, pollution_type='water', severity=5)
+        PollutionReport.objects.create(polluted_area=air, reporter=self.reporter, title='Smoke', description='-')
+        self.assertEqual(counters()['areas'], 2)
+        self.assertEqual(counters()[f'user:{self.reporter.pk}:reports'], 1)
+        self.assertMatchesRebuild()
+
+        air.pollution_type, air.severity = 'soil', 1
+        air.save()
+        water.is_active = False
+        water.save()
+        self.assertEqual(counters()['areas'], 1)
+        self.assertNotIn('areas:type:air', counters())
+        self.assertMatchesRebuild()
+
+        air.delete()
+        self.assertNotIn('areas', counters())
+        self.assertNotIn('reports', counters())
+        self.assertMatchesRebuild()
+
+    def test_bulk_changes_rebuild_on_commit(self):
+        make_area(self.owner, 'Existing', 1, 1)
+        since = ChangeSequence.current(ChangeSequence.AREAS)
+        bulk_create_areas(self.owner, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            areas_bulk_changed.send(sender=PollutedArea, since=since)
+            # Nothing is recomputed inside the writing transaction
+            self.assertEqual(counters()['areas'], 1)
+        self.assertEqual(counters()['areas'], 4)
+        self.assertMatchesRebuild()
+
+    def test_bulk_changes_to_other_fields_skip_the_rebuild(self):
+        with mock.patch.object(stats, 'rebuild') as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                areas_bulk_changed.send(sender=PollutedArea, fields=['area_size'])
+        rebuild.assert_not_called()
+
+
+def rollup_rows():
+    return (
+        sorted(AreaDailyRollup.objects.exclude(created=0).values_list('day', 'pollution_type', 'severity', 'created')),
+        sorted(ReportDailyRollup.objects.exclude(filed=0).values_list('day', 'status', 'filed')),
+    )
+
+
+@override_settings(MAP_TILE_CACHE='default')
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mapper')
+        self.today = timezone.localdate()
+
+    def assertMatchesBackfill(self):
+        incremental = rollup_rows()
+        rollups.backfill(*rollups.activity_bounds())
+        self.assertEqual(incremental, rollup_rows())
+
+    def report(self, area, **fields):
+        return PollutionReport.objects.create(polluted_area=area, reporter=self.user, title='Seen', description='-', **fields)
+
+    def test_rollups_follow_saves_moderation_and_deletes(self):
+        area = make_area(self.user, 'Air', 1, 1)
+        reports = [self.report(area) for _ in range(3)]
+        reports[0].status = 'verified'
+        reports[0].save()
+        self.assertEqual(moderation.moderate(PollutionReport.objects.filter(pk=reports[1].pk), 'rejected', self.user), 1)
+        self.assertMatchesBackfill()
+
+        area.severity = 5
+        area.save()
+        reports[2].delete()
+        self.assertMatchesBackfill()
+        trends = rollups.trends(self.today, self.today)
+        self.assertEqual(trends['areas']['by_severity'][5], [1])
+        self.assertEqual(trends['reports']['by_status']['verified'], [1])
+        self.assertEqual(trends['reports']['by_status']['pending'], [0])
+
+        area.delete()
+        self.assertEqual(rollup_rows(), ([], []))
+
+    def test_bulk_changes_reroll_only_the_days_touched(self):
+        old = make_area(self.user, 'Old', 1, 1)
+        day = self.today - timedelta(days=30)
+        PollutedArea.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=30))
+        rollups.backfill(*rollups.activity_bounds())
+        since = ChangeSequence.current(ChangeSequence.AREAS)
+        created = bulk_create_areas(self.user, 2)
+        self.report(created[0])
+        self.assertEqual(rollups.changed_days(since), [self.today])
+
+        with mock.patch.object(rollups, 'backfill', wraps=rollups.backfill) as backfill:
+            with self.captureOnCommitCallbacks(execute=True):
+                areas_bulk_changed.send(sender=PollutedArea, since=since)
+        backfill.assert_called_once_with(self.today, self.today)
+        self.assertIn((day, 'air', 3, 1), rollup_rows()[0])
+        self.assertMatchesBackfill()
+
+    def test_backfill_days_groups_consecutive_days(self):
+        days = [self.today, self.today + timedelta(days=1), self.today + timedelta(days=5)]
+        with mock.patch.object(rollups, 'backfill', return_value=0) as backfill:
+            rollups.backfill_days(days)
+        self.assertEqual(
+            [call.args for call in backfill.call_args_list],
+            [(days[0], days[1]), (days[2], days[2])],
+        )
+
+
+class ImportAreasTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('importer')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def run_import(self, name, content, *args):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write(content)
+        stderr = io.StringIO()
+        call_command('import_areas', path, '--user', 'importer', '--processes', '1', *args,
+                     stdout=io.StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_reimport_updates_areas_by_external_id(self):
+        self.run_import('areas.csv', (
+            'external_id,name,pollution_type,severity,latitude,longitude,polygon\n'
+            'a-1,River,water,2,10,20,\n'
+            'a-2,Field,soil,3,0,0,"[[0, 0], [0, 1], [1, 1], [1, 0]]"\n'
+        ))
+        field = PollutedArea.objects.get(external_id='a-2')
+        self.assertEqual(field.polygon_vertex_count, 4)
+        self.assertAlmostEqual(field.latitude, 0.5, places=3)
+        self.assertGreater(field.change_seq, 0)
+
+        errors = self.run_import('update.ndjson', (
+            '{"external_id": "a-1", "name": "River bend", "pollution_type": "water", "severity": 4, '
+            '"latitude": 10, "longitude": 20}\n'
+            '{"external_id": "a-3", "name": "Bad", "pollution_type": "air", "severity": 9, "latitude": 1, "longitude": 1}\n'
+            '{not json\n'
+        ))
+        self.assertEqual(PollutedArea.objects.count(), 2)
+        river = PollutedArea.objects.get(external_id='a-1')
+        self.assertEqual((river.name, river.severity), ('River bend', 4))
+        self.assertIn('Record 2', errors)
+        self.assertIn('severity', errors)
+        self.assertIn('Record 3', errors)
+
+    def test_geojson_features_and_dry_run(self):
+        collection = {'type': 'FeatureCollection', 'features': [{
+            'type': 'Feature', 'id': 'g-1',
+            'geometry': {'type': 'Polygon', 'coordinates': [[[20, 10], [21, 10], [21, 11], [20, 11], [20, 10]]]},
+            'properties': {'name': 'Lake', 'pollution_type': 'water', 'severity': 2},
+        }]}
+        self.run_import('areas.geojson', json.dumps(collection), '--dry-run')
+        self.assertFalse(PollutedArea.objects.exists())
+        self.run_import('areas.geojson', json.dumps(collection))
+        lake = PollutedArea.objects.get(external_id='g-1')
+        self.assertEqual(lake.get_polygon_coordinates()[0], [10.0, 20.0])
+        self.assertEqual((lake.min_lng, lake.max_lng), (20.0, 21.0))
+
+
+class NearbyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('mapper')
+        rng = np.random.default_rng(7)
+        for number, (lat, lng) in enumerate(zip(rng.uniform(40, 50, 60), rng.uniform(5, 15, 60))):
+            make_area(cls.user, f'Area {number}', float(lat), float(lng), severity=number % 5 + 1)
+        make_area(cls.user, 'Square', polygon=[[44.9, 9.9], [44.9, 10.1], [45.1, 10.1], [45.1, 9.9]])
+
+    def setUp(self):
+        self.areas = PollutedArea.objects.filter(is_active=True)
+
+    def brute_force(self, lat, lng, queryset=None):
+        rows = list((queryset or self.areas).values(*nearby.CANDIDATE_FIELDS))
+        distances = nearby.extent_distances(lat, lng, rows)
+        return sorted((float(distance), row['id']) for distance, row in zip(distances, rows))
+
+    def assertSameResults(self, found, expected):
+        self.assertEqual([row['id'] for _, row in found], [pk for _, pk in expected])
+        for (distance, _), (expected_distance, _) in zip(found, expected):
+            self.assertAlmostEqual(distance, expected_distance, places=6)
+
+    def test_k_nearest_match_brute_force(self):
+        for lat, lng in [(45, 10), (41.3, 5.2), (60, 30), (-30, -60)]:
+            self.assertSameResults(nearby.nearby(self.areas, lat, lng, k=7), self.brute_force(lat, lng)[:7])
+
+    def test_radius_search_returns_everything_within_the_radius(self):
+        expected = [pair for pair in self.brute_force(46, 11) if pair[0] <= 150000]
+        self.assertSameResults(nearby.nearby(self.areas, 46, 11, radius=150000, k=100), expected)
+
+    def test_filtered_queryset(self):
+        severe = self.areas.filter(severity__gte=4)
+        self.assertSameResults(nearby.nearby(severe, 45, 10, k=5), self.brute_force(45, 10, severe)[:5])
+
+    def test_point_inside_a_polygon_extent_is_at_distance_zero(self):
+        distance, row = nearby.nearby(self.areas, 45.05, 10.05, k=1)[0]
+        self.assertEqual((distance, row['name']), (0.0, 'Square'))
+
+    def test_search_wraps_around_the_antimeridian(self):
+        east = make_area(self.user, 'East', 0, -179.9)
+        distance, row = nearby.nearby(self.areas, 0, 179.9, radius=50000, k=1)[0]
+        self.assertEqual(row['id'], east.pk)
+        self.assertAlmostEqual(distance, 22239, delta=5)
+
+    def test_api(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('maps:nearby_areas'), {'lat': 45, 'lng': 10, 'k': 3})
+        features = response.json()['features']
+        self.assertEqual(features[0]['properties']['name'], 'Square')
+        self.assertEqual([f['properties']['distance'] for f in features], sorted(f['properties']['distance'] for f in features))
+        self.assertEqual(self.client.get(reverse('maps:nearby_areas'), {'lat': 45}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('maps:nearby_areas'), {'lat': 45, 'lng': 10, 'k': 0}).status_code, 400)
+
+
+# An L-shaped ring: its bounding box covers the notch at (1.5, 1.5)
+L_SHAPE = [[0, 0], [0, 2], [1, 2], [1, 1], [2, 1], [2, 0]]
+
+
+class ContainmentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mapper')
+        self.shape = make_area(self.user, 'L', polygon=L_SHAPE)
+        self.point = make_area(self.user, 'Point', 10, 10)
+        self.index = containment.ContainmentIndex()
+
+    def test_points_in_ring(self):
+        ring = np.array(L_SHAPE, dtype=float)
+        inside = containment.points_in_ring(np.array([0.5, 1.5, 0.5, 1.5]), np.array([0.5, 0.5, 1.5, 1.5]), ring)
+        self.assertEqual(inside.tolist(), [True, True, True, False])
+
+    def test_lookup(self):
+        # 30 m and 80 m north of the point-only area, matched within 50 m
+        results = self.index.lookup([(0.5, 1.5), (1.5, 1.5), (10.00027, 10), (10.00072, 10), (0.5, 0.5)])
+        self.assertEqual(results, [[self.shape.pk], [], [self.point.pk], [], [self.shape.pk]])
+
+    def test_changes_are_synced_without_a_rebuild(self):
+        self.index.lookup([(0, 0)])
+        base = self.index._base
+        square = make_area(self.user, 'Square', polygon=[[5, 5], [5, 6], [6, 6], [6, 5]])
+        self.shape.is_active = False
+        self.shape.save()
+        self.point.delete()
+        self.assertEqual(self.index.lookup([(5.5, 5.5), (0.5, 0.5), (10, 10)]), [[square.pk], [], []])
+        self.assertIs(self.index._base, base)
+
+        self.shape.is_active = True
+        self.shape.save()
+        self.assertEqual(self.index.lookup([(0.5, 0.5)]), [[self.shape.pk]])
+
+    def test_bulk_written_areas_are_synced(self):
+        self.index.lookup([(0, 0)])
+        moved = list(PollutedArea.objects.filter(pk=self.point.pk))
+        moved[0].latitude = moved[0].min_lat = moved[0].max_lat = 20
+        sync.stamp(moved)
+        PollutedArea.objects.bulk_update(moved, ['latitude', 'min_lat', 'max_lat', 'change_seq'])
+        self.assertEqual(self.index.lookup([(10, 10), (20, 10)]), [[], [self.point.pk]])
+
+    def test_pruned_tombstones_force_a_rebuild(self):
+        self.index.lookup([(0, 0)])
+        base = self.index._base
+        self.point.delete()
+        ChangeSequence.objects.create(name=ChangeSequence.AREAS_PRUNED, value=ChangeSequence.current(ChangeSequence.AREAS))
+        self.assertEqual(self.index.lookup([(10, 10)]), [[]])
+        self.assertIsNot(self.index._base, base)
+
+    def test_api(self):
+        containment.invalidate()
+        self.client.force_login(self.user)
+        url = reverse('maps:areas_containing')
+        self.assertEqual(self.client.get(url, {'lat': 0.5, 'lng': 0.5}).json(), {'results': [[self.shape.pk]]})
+        response = self.client.post(url, json.dumps({'points': [[1.5, 1.5], [10, 10]]}), content_type='application/json')
+        self.assertEqual(response.json(), {'results': [[], [self.point.pk]]})
+        self.assertEqual(self.client.get(url, {'lat': 91, 'lng': 0}).status_code, 400)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('mapper')
+        cls.spill = make_area(cls.user, 'River spill', 1, 1, description='Oil on the water')
+        cls.factory = make_area(cls.user, 'Factory smoke', 2, 2, description='Smoke drifting over the river')
+        cls.closed = make_area(cls.user, 'River closed', 3, 3, is_active=False)
+        cls.persian = make_area(cls.user, 'آلودگی رودخانه', 4, 4, description='هر روز از اینجا می‌روم')
+        cls.report = PollutionReport.objects.create(
+            polluted_area=cls.factory, reporter=cls.user, title='Dead fish', description='Fish in the river'
+        )
+
+    def indexes(self):
+        yield search.InvertedIndex()
+        if search.fts5_available(connection):
+            yield search.FtsIndex(connection)
+
+    def matches(self, index, query, kinds=None, active_only=True):
+        return [(kind, object_id) for kind, object_id, _, _ in index.search(search.tokenize(query), kinds, active_only)]
+
+    def test_tokenize(self):
+        self.assertEqual(search.tokenize('می‌روم'), ['می', 'روم', 'میروم'])
+        self.assertEqual(search.tokenize('Café ك ي ۱۲ ٣'), ['cafe', 'ک', 'ی', '12', '3'])
+
+    def test_indexes_rank_and_filter_matches(self):
+        for index in self.indexes():
+            with self.subTest(index=type(index).__name__):
+                search.populate(index, areas=PollutedArea.objects.all(), reports=PollutionReport.objects.all())
+                river = self.matches(index, 'river')
+                # Title matches first; inactive areas are left out
+                self.assertEqual(river[0], ('area', self.spill.pk))
+                self.assertEqual(set(river), {('area', self.spill.pk), ('area', self.factory.pk), ('report', self.report.pk)})
+                self.assertIn(('area', self.closed.pk), self.matches(index, 'river', active_only=False))
+                self.assertEqual(set(self.matches(index, 'riv')), set(river))
+                self.assertEqual(self.matches(index, 'smoke river'), [('area', self.factory.pk)])
+                self.assertEqual(self.matches(index, 'river', ['report']), [('report', self.report.pk)])
+                self.assertEqual(self.matches(index, 'river nothing'), [])
+                for query in ('میروم', 'می روم', 'آلودگي'):
+                    self.assertEqual(self.matches(index, query), [('area', self.persian.pk)], query)
+
+                index.remove('area', [self.spill.pk])
+                self.assertNotIn(('area', self.spill.pk), self.matches(index, 'river'))
+
+    def test_prefixes_expand_to_the_most_common_terms(self):
+        index = search.InvertedIndex()
+        search.populate(index, areas=PollutedArea.objects.all(), reports=PollutionReport.objects.all())
+        riverside = make_area(self.user, 'Riverside', 5, 5)
+        index.index('area', search.area_documents(PollutedArea.objects.filter(pk=riverside.pk)))
+        self.assertIn(('area', riverside.pk), self.matches(index, 'rive'))
+        with mock.patch.object(search, 'MAX_PREFIX_TERMS', 1):
+            # "river" is in more documents than "riverside", so the prefix expands to it alone
+            self.assertEqual(set(self.matches(index, 'rive')), set(self.matches(index, 'river')))
+
+    def test_api(self):
+        search.populate(search.get_index(), areas=PollutedArea.objects.all(), reports=PollutionReport.objects.all())
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('maps:search_areas'), {'q': 'fish'})
+        result, = response.json()['results']
+        self.assertEqual((result['kind'], result['id'], result['title']), ('report', self.report.pk, 'Dead fish'))
+        self.assertEqual(result['area']['id'], self.factory.pk)
+        self.assertEqual(self.client.get(reverse('maps:search_areas'), {'q': 'x', 'type': 'user'}).status_code, 400)
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        api_cache().clear()
+        self.user = User.objects.create_user('mapper')
+        self.client.force_login(self.user)
+        self.first = make_area(self.user, 'First', 1, 1)
+        self.second = make_area(self.user, 'Second', 2, 2)
+        self.hidden = make_area(self.user, 'Hidden', 3, 3, is_active=False)
+
+    def changes(self, since, **params):
+        response = self.client.get(reverse('maps:areas_json'), {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def names(self, changes):
+        return [feature['properties']['name'] for feature in changes['features']]
+
+    def test_changes_after_a_cursor(self):
+        start = self.changes(0)
+        self.assertEqual(self.names(start), ['First', 'Second'])
+        self.assertEqual((start['deleted'], start['more']), ([], False))
+        self.assertEqual(self.changes(start['cursor'])['features'], [])
+
+        self.second.name = 'Second renamed'
+        self.second.save()
+        self.first.is_active = False
+        self.first.save()
+        third = make_area(self.user, 'Third', 4, 4)
+        third_id = third.pk
+        third.delete()
+        changes = self.changes(start['cursor'])
+        self.assertEqual(self.names(changes), ['Second renamed'])
+        self.assertEqual(changes['deleted'], [self.first.pk, third_id])
+        self.assertEqual(self.changes(changes['cursor'])['features'], [])
+
+    def test_pages_are_cut_at_the_limit(self):
+        page = self.changes(0, limit=1)
+        self.assertEqual((self.names(page), page['more']), (['First'], True))
+        page = self.changes(page['cursor'], limit=1)
+        self.assertEqual((self.names(page), page['more']), (['Second'], True))
+        # Only a copy started from 0 skips inactive areas
+        page = self.changes(page['cursor'], limit=1)
+        self.assertEqual((page['features'], page['deleted'], page['more']), ([], [self.hidden.pk], False))
+
+    def test_bulk_writes_are_stamped(self):
+        cursor = self.changes(0)['cursor']
+        areas = list(PollutedArea.objects.filter(pk=self.first.pk))
+        areas[0].severity = 5
+        sync.stamp(areas)
+        PollutedArea.objects.bulk_update(areas, ['severity', 'change_seq'])
+        changes = self.changes(cursor)
+        self.assertEqual([f['properties']['severity'] for f in changes['features']], [5])
+
+    def test_pruned_cursor_expires(self):
+        cursor = self.changes(0)['cursor']
+        self.second.delete()
+        AreaTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=60))
+        self.assertEqual(sync.prune_tombstones(30), 1)
+        response = self.client.get(reverse('maps:areas_json'), {'since': cursor})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(self.names(self.changes(0)), ['First'])
+
+    def test_invalid_requests(self):
+        url = reverse('maps:areas_json')
+        self.assertEqual(self.client.get(url, {'since': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'since': '0', 'bbox': '0,0,1,1'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'since': '0', 'limit': '0'}).status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('mapper')
+        for number in range(7):
+            make_area(cls.user, f'Area {number}', number, number)
+        # Ties on created_at are broken by id
+        PollutedArea.objects.filter(name__in=['Area 2', 'Area 3', 'Area 4']).update(created_at=timezone.now())
+        make_area(cls.user, 'Hidden', 9, 9, is_active=False)
+
+    def setUp(self):
+        self.areas = PollutedArea.objects.filter(is_active=True)
+        self.expected = list(self.areas.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_walking_forward_and_back(self):
+        paginator = CursorPaginator(self.areas, 3)
+        pages, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            pages.append([area.pk for area in page])
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(pages, [self.expected[:3], self.expected[3:6], self.expected[6:]])
+        self.assertEqual([area.pk for area in paginator.page(page.previous_cursor)], self.expected[3:6])
+        self.assertFalse(paginator.page().has_previous)
+
+    def test_invalid_cursor(self):
+        paginator = CursorPaginator(self.areas, 3)
+        for cursor in ('garbage', 'WyJzaWRld2F5cyJd'):
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+    def test_area_list_api(self):
+        self.client.force_login(self.user)
+        url = reverse('maps:area_list_json')
+        first = self.client.get(url, {'limit': 4}).json()
+        second = self.client.get(url, {'limit': 4, 'cursor': first['next']}).json()
+        self.assertEqual([row['id'] for row in first['results'] + second['results']], self.expected)
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 1000}).status_code, 400)
+
+
+def read_message(data):
+    """(field number, value) pairs of a protobuf message of varint and length-delimited fields"""
+    fields, position = [], 0
+
+    def varint():
+        nonlocal position
+        value = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                return value
+
+    while position < len(data):
+        key = varint()
+        if key & 7 == 2:
+            length = varint()
+            fields.append((key >> 3, data[position:position + length]))
+            position += length
+        else:
+            fields.append((key >> 3, varint()))
+    return fields
+
+
+class VectorTileTests(TestCase):
+    def test_polygon_commands(self):
+        clockwise = [(0, 0), (10, 0), (10, 10), (0, 10)]
+        # MoveTo(1) 0,0; LineTo(3) +10,0 0,+10 -10,0; ClosePath
+        expected = [9, 0, 0, 26, 20, 0, 0, 20, 19, 0, 15]
+        self.assertEqual(mvt.encode_polygon(clockwise), expected)
+        # Counter-clockwise rings are rewound
+        self.assertEqual(mvt.encode_polygon(clockwise[::-1]), expected)
+
+    def test_polygons_are_clipped_to_the_buffered_tile(self):
+        geometry = mvt.encode_polygon([(-1000, -1000), (100, -1000), (100, 100), (-1000, 100)])
+        self.assertEqual(geometry[:3], [9, 127, 127])  # starts at (-64, -64), the buffer corner
+        self.assertIsNone(mvt.encode_polygon([(5000, 5000), (5100, 5000), (5100, 5100)]))
+        self.assertIsNone(mvt.encode_polygon([(0, 0), (0.2, 0.1), (0.1, 0.2)]))
+
+    def test_layer_encoding(self):
+        layer = mvt.LayerBuilder('areas')
+        layer.add_feature(7, mvt.GEOM_POINT, mvt.encode_point((1, 2)), {'severity': 3, 'type': 'air', 'missing': None})
+        layer.add_feature(8, mvt.GEOM_POINT, mvt.encode_point((3, 4)), {'severity': 3})
+        (field, data), = read_message(mvt.encode_tile([layer, mvt.LayerBuilder('empty')]))
+        self.assertEqual(field, 3)
+        message = read_message(data)
+        self.assertEqual(message[0], (15, 2))
+        self.assertEqual(message[1], (1, b'areas'))
+        features = [read_message(value) for field, value in message if field == 2]
+        self.assertEqual(features[0], [(1, 7), (2, bytes([0, 0, 1, 1])), (3, 1), (4, bytes([9, 2, 4]))])
+        self.assertEqual(features[1][1], (2, bytes([0, 0])))
+        self.assertEqual([value for field, value in message if field == 3], [b'severity', b'type'])
+        self.assertEqual(
+            [read_message(value) for field, value in message if field == 4], [[(5, 3)], [(1, b'air')]]
+        )
+        self.assertEqual(message[-1], (5, mvt.EXTENT))
+
+    @override_settings(MAP_TILE_CACHE='default')
+    def test_rendered_tile(self):
+        user = User.objects.create_user('mapper')
+        area = make_area(user, 'Square', polygon=[[1, 1], [1, 2], [2, 2], [2, 1]])
+        make_area(user, 'Elsewhere', -40, -100)
+        tile = tiles.get_tile(4, 8, 7)
+        (_, data), = read_message(tile)
+        message = read_message(data)
+        self.assertIn((1, tiles.LAYER_NAME.encode()), message)
+        features = [dict(read_message(value)) for field, value in message if field == 2]
+        self.assertEqual([(feature[1], feature[3]) for feature in features], [(area.pk, mvt.GEOM_POLYGON)])
+        self.assertEqual(tiles.get_tile(4, 8, 7), tile)
@@ -0,0 +1,149 @@
+"""
+Vector tiles for polluted areas, with a per-tile cache.
+
+Tiles are cached under `maps:mvt:<generation>:<z>:<x>:<y>`. When an area
+changes only the tiles its old and new extents touch are deleted; if that
+would be too many tiles the generation is bumped instead, which orphans the
+whole tile set at once. A tile rendered while an area change commits is
+not kept, as the invalidation may have run before it was written.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import mvt
+from .cache import get_data_version
+from .geometry import decode_polygon, lod_geometry
+from .models import PollutedArea, severity_color
+from .spatial import clamp_latitude, clamp_longitude, mercator_xy, tile_bounds
+
+LAYER_NAME = 'polluted_areas'
+
+GENERATION_KEY = 'maps:mvt:generation'
+
+# Above this many tiles an invalidation bumps the generation instead.
+MAX_INVALIDATED_TILES = 2000
+
+
+def tile_max_zoom():
+    return getattr(settings, 'MAP_TILE_MAX_ZOOM', 16)
+
+
+def tile_cache():
+    return caches[getattr(settings, 'MAP_TILE_CACHE', 'default')]
+
+
+def _generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Seed from the clock so a lost counter never resurrects old tiles
+        cache.add(GENERATION_KEY, int(time.time()), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _tile_key(generation, z, x, y):
+    return f'maps:mvt:{generation}:{z}:{x}:{y}'
+
+
+def render_tile(z, x, y):
+    """Encode the polluted areas layer of one tile"""
+    min_lng, min_lat, max_lng, max_lat = tile_bounds(x, y, z)
+    pad = mvt.buffer_degrees(z)
+    bbox = (
+        clamp_longitude(min_lng - pad),
+        max(-90.0, min_lat - pad),
+        clamp_longitude(max_lng + pad),
+        min(90.0, max_lat + pad),
+    )
+    rows = PollutedArea.objects.filter(is_active=True).in_bbox(bbox, z).annotate(
+        geometry=lod_geometry(z)
+    ).values_list(
+        'id', 'severity', 'pollution_type', 'latitude', 'longitude', 'geometry'
+    ).order_by('severity', 'id')
+
+    project = mvt.TileProjection(z, x, y)
+    lo, hi = -mvt.BUFFER, mvt.EXTENT + mvt.BUFFER
+    layer = mvt.LayerBuilder(LAYER_NAME)
+    for area_id, severity, pollution_type, lat, lng, geometry_data in rows:
+        coordinates = decode_polygon(geometry_data)
+        if coordinates:
+            ring = [project(point[1], point[0]) for point in coordinates]
+            geometry = mvt.encode_polygon(ring)
+            geom_type = mvt.GEOM_POLYGON
+        else:
+            point = project(lng, lat)
+            inside = lo <= point[0] <= hi and lo <= point[1] <= hi
+            geometry = mvt.encode_point(point) if inside else None
+            geom_type = mvt.GEOM_POINT
+        if geometry is None:
+            continue
+        layer.add_feature(area_id, geom_type, geometry, {
+            'id': area_id,
+            'severity': severity,
+            'severity_color': severity_color(severity),
+            'pollution_type': pollution_type,
+        })
+    return mvt.encode_tile([layer])
+
+
+def get_tile(z, x, y):
+    """Return the encoded tile, rendering and caching it on a miss"""
+    cache = tile_cache()
+    key = _tile_key(_generation(cache), z, x, y)
+    data = cache.get(key)
+    if data is None:
+        version = get_data_version()
+        data = render_tile(z, x, y)
+        cache.set(key, data, getattr(settings, 'MAP_TILE_CACHE_TIMEOUT', 24 * 60 * 60))
+        # An area change committed while rendering may have invalidated this tile before
+        # it was written; drop it again rather than serve it until it expires
+        if get_data_version() != version:
+            cache.delete(key)
+    return data
+
+
+def _tiles_touching(bounds, zoom):
+    """Tiles at `zoom` whose buffered extent intersects (min_lat, min_lng, max_lat, max_lng)"""
+    min_lat, min_lng, max_lat, max_lng = bounds
+    n = 1 << zoom
+    margin = mvt.BUFFER / mvt.EXTENT
+    fx0, fy1 = mercator_xy(min_lng, clamp_latitude(min_lat))
+    fx1, fy0 = mercator_xy(max_lng, clamp_latitude(max_lat))
+    x0 = max(0, math.floor(fx0 * n - margin))
+    x1 = min(n - 1, math.floor(fx1 * n + margin))
+    y0 = max(0, math.floor(fy0 * n - margin))
+    y1 = min(n - 1, math.floor(fy1 * n + margin))
+    return x0, y0, x1, y1
+
+
+def invalidate_bounds(*extents):
+    """Drop cached tiles touched by any of the given extents"""
+    extents = [bounds for bounds in extents if bounds and None not in bounds]
+    if not extents:
+        return
+    cache = tile_cache()
+    generation = _generation(cache)
+    keys = set()
+    for zoom in range(tile_max_zoom() + 1):
+        for bounds in extents:
+            x0, y0, x1, y1 = _tiles_touching(bounds, zoom)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) + len(keys) > MAX_INVALIDATED_TILES:
+                invalidate_all()
+                return
+            keys.update(
+                _tile_key(generation, zoom, x, y)
+                for x in range(x0, x1 + 1)
+                for y in range(y0, y1 + 1)
+            )
+    cache.delete_many(list(keys))
+
+
+def invalidate_all():
+    cache = tile_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, int(time.time()), None)
@@ -9,7 +9,18 @@ urlpatterns = [
     path('area/<int:pk>/', views.PollutedAreaDetailView.as_view(), name='area_detail'),
     path('area/<int:pk>/edit/', views.edit_polluted_area, name='edit_area'),
     path('area/<int:pk>/delete/', views.delete_polluted_area, name='delete_area'),
+    path('area/<int:pk>/image/<slug:size>.<slug:extension>', views.area_image, name='area_image'),
     path('area/<int:area_pk>/report/', views.add_report, name='add_report'),
     path('api/areas/', views.get_polluted_areas_json, name='areas_json'),
+    path('api/areas/list/', views.area_list_json, name='area_list_json'),
+    path('api/areas/nearby/', views.nearby_areas, name='nearby_areas'),
+    path('api/areas/containing/', views.areas_containing_points, name='areas_containing'),
+    path('api/areas/search/', views.search_areas, name='search_areas'),
+    path('api/areas/<int:pk>/', views.get_polluted_area_json, name='area_json'),
+    path('api/events/', views.area_events, name='area_events'),
+    path('api/export/', views.export_areas, name='export_areas'),
+    path('api/heatmap/', views.heatmap_raster, name='heatmap'),
+    path('api/heatmap/<int:z>/<int:x>/<int:y>.png', views.heatmap_tile, name='heatmap_tile'),
+    path('api/tiles/<int:z>/<int:x>/<int:y>.mvt', views.vector_tile, name='vector_tile'),
 ]
 
@@ -1,14 +1,27 @@
+import json
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.generic import ListView, DetailView
-from .models import PollutedArea, PollutionReport
+from core.decorators import async_login_required
+from core.pagination import CursorPaginationMixin, cursor_page_response
+from .models import PollutedArea, PollutionReport, severity_color
 from .forms import PollutedAreaForm, PollutionReportForm
+from .spatial import mercator_xy, parse_bbox, parse_zoom
+from . import clustering, containment, events, export, geojson, heatmap, images, nearby, search, sync, tiles
+from .cache import (
+    aget_cached_response, aget_data_version, areas_etag, aset_cached_response, get_area_reports_version, response_cache_key,
+)
 
-class MapView(LoginRequiredMixin, ListView):
+class MapView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = PollutedArea
     template_name = 'maps/map.html'
     context_object_name = 'polluted_areas'
@@ -19,6 +32,29 @@ class MapView(LoginRequiredMixin, ListView):
         return PollutedArea.objects.filter(is_active=True).select_related('created_by')
 
 
+def _area_list_row(area):
+    return {
+        'id': area['id'],
+        'name': area['name'],
+        'pollution_type': area['pollution_type'],
+        'severity': area['severity'],
+        'severity_color': severity_color(area['severity']),
+        'latitude': area['latitude'],
+        'longitude': area['longitude'],
+        'created_by': area['created_by__username'],
+        'created_at': area['created_at'].isoformat(),
+    }
+
+
+@login_required
+def area_list_json(request):
+    """The map's list of active areas, newest first, a page per ?cursor= (see core.pagination)"""
+    areas = PollutedArea.objects.filter(is_active=True).values(
+        'id', 'name', 'pollution_type', 'severity', 'latitude', 'longitude', 'created_by__username', 'created_at'
+    )
+    return cursor_page_response(request, areas, _area_list_row, MapView.paginate_by)
+
+
 @login_required
 def add_polluted_area(request):
     if request.method == 'POST':
@@ -31,11 +67,10 @@ def add_polluted_area(request):
             polygon_coords = request.POST.get('polygon_coordinates')
             if polygon_coords:
                 try:
-                    import json
                     coords = json.loads(polygon_coords)
                     polluted_area.set_polygon_coordinates(coords)
-                except (json.JSONDecodeError, TypeError):
-                    pass  # Ignore invalid polygon data
+                except (ValueError, TypeError):
+                    pass  # Ignore invalid polygon data (bad JSON or malformed pairs)
             
             polluted_area.save()
 
@@ -92,10 +127,26 @@ class PollutedAreaDetailView(DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['reports'] = self.object.reports.all()[:10]
+        # Only queried when the cached fragments showing them are rendered
+        context['reports'] = self.object.reports.select_related('reporter')[:10]
+        context['reports_version'] = get_area_reports_version(self.object.pk)
         return context
 
 
+def area_image(request, pk, size, extension):
+    """Redirect to a derivative of an area's photo, generating it first if needed"""
+    if size not in images.DERIVATIVE_SIZES or extension not in images.DERIVATIVE_FORMATS:
+        raise Http404('Unknown image size or format')
+    polluted_area = get_object_or_404(PollutedArea.objects.only('image'), pk=pk)
+    if not polluted_area.image:
+        raise Http404('Area has no image')
+    try:
+        name = images.ensure(polluted_area.image.name, size, extension)
+    except images.UNREADABLE_IMAGE_ERRORS:
+        raise Http404('Image could not be read')
+    return HttpResponseRedirect(default_storage.url(name))
+
+
 @login_required
 def add_report(request, area_pk):
     polluted_area = get_object_or_404(PollutedArea, pk=area_pk)
@@ -115,42 +166,364 @@ def add_report(request, area_pk):
     return render(request, 'maps/add_report.html', {'form': form, 'polluted_area': polluted_area})
 
 
-@login_required
-def get_polluted_areas_json(request):
-    """API endpoint to get polluted areas as GeoJSON"""
+@async_login_required
+async def get_polluted_areas_json(request):
+    """
+    API endpoint to get polluted areas as GeoJSON.
+
+    Accepts an optional `bbox=minLng,minLat,maxLng,maxLat` viewport and
+    `zoom`; when a bbox is given only areas intersecting it are returned.
+    At or below MAP_CLUSTER_MAX_ZOOM the response holds cluster features
+    instead of individual areas, unless `cluster=0` is passed.
+
+    `stream=1` streams the FeatureCollection instead of building it in
+    memory, and `format=geojsonseq` streams newline-delimited features.
+    Polygons are simplified to a level of detail matching `zoom`.
+
+    `since=<cursor>` returns only the changes after a cursor from an
+    earlier response, for clients keeping a local copy (see maps.sync):
+    the changed areas, the ids of deleted and deactivated ones in
+    `deleted`, the next `cursor` and `more` if `limit` cut the page short.
+    
+    Responses carry an ETag derived from the data version, so unchanged
+    data is answered with 304 Not Modified, and JSON bodies are cached per
+    data version and language.
+
+    The view is async: under ASGI the queries and streaming run on the
+    event loop through the async ORM instead of occupying a thread each.
+    """
+    version = await aget_data_version()
+    etag = areas_etag(request, version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = await _areas_response(request, version)
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+async def _areas_response(request, version):
     areas = PollutedArea.objects.filter(is_active=True)
     
-    features = []
-    for area in areas:
-        # Determine geometry type based on whether polygon exists
-        if area.has_polygon():
-            geometry = {
-                'type': 'Polygon',
-                'coordinates': [area.get_polygon_coordinates()]
-            }
-        else:
-            geometry = {
-                'type': 'Point',
-                'coordinates': [area.longitude, area.latitude]
-            }
-        
-        features.append({
-            'type': 'Feature',
-            'geometry': geometry,
-            'properties': {
-                'id': area.id,
-                'name': area.name,
-                'pollution_type': area.get_pollution_type_display(),
-                'severity': area.severity,
-                'severity_color': area.severity_color,
-                'description': area.description,
-                'created_at': area.created_at.isoformat(),
-                'created_by': area.created_by.username,
-                'has_polygon': area.has_polygon()
-            }
-        })
+    try:
+        zoom = parse_zoom(request.GET.get('zoom'))
+        bbox = parse_bbox(request.GET['bbox']) if request.GET.get('bbox') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    if request.GET.get('since') is not None:
+        return await _areas_changes_response(request, bbox, zoom)
+    
+    output_format = request.GET.get('format', 'geojson')
+    if output_format not in ('geojson', 'geojsonseq'):
+        return JsonResponse({'error': 'format must be geojson or geojsonseq'}, status=400)
+    stream = output_format == 'geojsonseq' or request.GET.get('stream') == '1'
+    
+    if not stream:
+        cache_key = response_cache_key(request, version)
+        content = await aget_cached_response(cache_key)
+        if content is None:
+            collection = await _areas_feature_collection(areas, bbox, zoom, request.GET.get('cluster') != '0')
+            content = JsonResponse(collection).content
+            await aset_cached_response(cache_key, content)
+        return HttpResponse(content, content_type='application/json')
+    
+    if bbox:
+        areas = areas.in_bbox(bbox, zoom)
+    
+    # Resolve translated labels now; streamed bodies are iterated after the view returns
+    labels = geojson.pollution_type_labels()
+    
+    # ASGI consumes async iterators natively; WSGI needs a sync one to stream
+    if isinstance(request, ASGIRequest):
+        rows = geojson.afeature_rows(areas, zoom)
+        iter_sequence, iter_collection = geojson.aiter_feature_sequence, geojson.aiter_feature_collection
+    else:
+        rows = geojson.feature_rows(areas, zoom)
+        iter_sequence, iter_collection = geojson.iter_feature_sequence, geojson.iter_feature_collection
+    
+    if output_format == 'geojsonseq':
+        return StreamingHttpResponse(iter_sequence(rows, labels), content_type='application/geo+json-seq')
+    return StreamingHttpResponse(iter_collection(rows, labels), content_type='application/geo+json')
+
+
+async def _areas_changes_response(request, bbox, zoom):
+    if bbox or request.GET.get('format', 'geojson') != 'geojson' or request.GET.get('stream') == '1':
+        return JsonResponse({'error': 'since cannot be combined with bbox, format or stream'}, status=400)
+    try:
+        since = sync.parse_cursor(request.GET['since'])
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    try:
+        limit = int(request.GET.get('limit') or sync.DEFAULT_CHANGES)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+    if not 1 <= limit <= sync.MAX_CHANGES:
+        return JsonResponse({'error': f'limit must be between 1 and {sync.MAX_CHANGES}'}, status=400)
+    try:
+        return JsonResponse(await sync_to_async(sync.changes)(since, zoom, limit))
+    except sync.CursorExpired as e:
+        return JsonResponse({'error': str(e)}, status=410)
+
+
+async def _areas_feature_collection(areas, bbox, zoom, cluster):
+    if cluster and zoom is not None and zoom <= clustering.cluster_max_zoom():
+        return {
+            'type': 'FeatureCollection',
+            'features': await sync_to_async(clustering.get_clusters)(bbox or (-180.0, -90.0, 180.0, 90.0), zoom)
+        }
+    
+    if bbox:
+        areas = areas.in_bbox(bbox, zoom)
+    
+    labels = geojson.pollution_type_labels()
+    return {
+        'type': 'FeatureCollection',
+        'features': [geojson.area_feature(row, labels) async for row in geojson.feature_values(areas, zoom)]
+    }
+
+
+@async_login_required
+async def area_events(request):
+    """
+    Server-Sent Events stream of area and report changes (see maps.events).
+
+    `bbox=minLng,minLat,maxLng,maxLat` limits it to the changes there. Idle
+    streams cost no thread, so they are only served under ASGI.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Live events are only available under ASGI'}, status=501)
+    try:
+        bbox = parse_bbox(request.GET['bbox']) if request.GET.get('bbox') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    response = StreamingHttpResponse(
+        events.stream(bbox, request.scope.get('disconnected')), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Don't let nginx buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@async_login_required
+async def get_polluted_area_json(request, pk):
+    """A single active area as a GeoJSON feature, with its report count and latest reports"""
+    try:
+        row = await geojson.feature_values(PollutedArea.objects.filter(is_active=True, pk=pk)).aget()
+    except PollutedArea.DoesNotExist:
+        return JsonResponse({'error': 'Area not found'}, status=404)
+    
+    feature = geojson.area_feature(row, geojson.pollution_type_labels())
+    reports = PollutionReport.objects.filter(polluted_area_id=pk)
+    feature['properties']['report_count'] = await reports.acount()
+    feature['properties']['reports'] = [
+        {
+            'id': report['id'],
+            'title': report['title'],
+            'status': report['status'],
+            'created_at': report['created_at'].isoformat(),
+            'reporter': report['reporter__username'],
+        }
+        async for report in reports.values('id', 'title', 'status', 'created_at', 'reporter__username')[:10]
+    ]
+    return JsonResponse(feature)
+
+
+@login_required
+def nearby_areas(request):
+    """
+    Active areas near `lat`/`lng`, closest first, as GeoJSON points.
+
+    `radius` (meters) limits the search distance and `k` the number of
+    results (default 10); without a radius the `k` nearest areas are
+    returned. `pollution_type` (comma separated) and `min_severity`
+    filter the candidates. Each feature has a `distance` in meters.
+    """
+    try:
+        lat = float(request.GET['lat'])
+        lng = float(request.GET['lng'])
+        radius = float(request.GET['radius']) if request.GET.get('radius') else None
+        k = int(request.GET.get('k') or 10)
+        min_severity = int(request.GET['min_severity']) if request.GET.get('min_severity') else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'lat and lng are required; lat, lng, radius, k and min_severity must be numbers'}, status=400)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return JsonResponse({'error': 'lat/lng out of range'}, status=400)
+    if radius is not None and not 0 < radius <= nearby.MAX_SEARCH_RADIUS:
+        return JsonResponse({'error': 'radius must be a positive distance in meters'}, status=400)
+    if not 1 <= k <= nearby.MAX_NEARBY_RESULTS:
+        return JsonResponse({'error': f'k must be between 1 and {nearby.MAX_NEARBY_RESULTS}'}, status=400)
+    
+    areas = PollutedArea.objects.filter(is_active=True)
+    if request.GET.get('pollution_type'):
+        types = request.GET['pollution_type'].split(',')
+        if not set(types) <= {value for value, _ in PollutedArea.POLLUTION_TYPES}:
+            return JsonResponse({'error': 'Unknown pollution_type'}, status=400)
+        areas = areas.filter(pollution_type__in=types)
+    if min_severity is not None:
+        areas = areas.filter(severity__gte=min_severity)
     
+    labels = geojson.pollution_type_labels()
     return JsonResponse({
         'type': 'FeatureCollection',
-        'features': features
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [row['longitude'], row['latitude']]},
+                'properties': {
+                    'id': row['id'],
+                    'name': row['name'],
+                    'pollution_type': labels.get(row['pollution_type'], row['pollution_type']),
+                    'severity': row['severity'],
+                    'severity_color': severity_color(row['severity']),
+                    'distance': round(distance, 1),
+                }
+            }
+            for distance, row in nearby.nearby(areas, lat, lng, radius, k)
+        ]
     })
+
+
+@login_required
+def search_areas(request):
+    """
+    Ranked full-text search over active areas and their reports.
+
+    `q` is the query (the last word may be partial), `type` limits results
+    to `area` or `report` matches and `limit` their number (default 20).
+    """
+    query = request.GET.get('q', '')
+    kinds = [request.GET['type']] if request.GET.get('type') else None
+    if kinds and kinds[0] not in search.KINDS:
+        return JsonResponse({'error': 'type must be area or report'}, status=400)
+    try:
+        limit = int(request.GET.get('limit') or 20)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+    if not 1 <= limit <= search.MAX_SEARCH_RESULTS:
+        return JsonResponse({'error': f'limit must be between 1 and {search.MAX_SEARCH_RESULTS}'}, status=400)
+    return JsonResponse({'query': query, 'results': search.search(query, kinds, limit)})
+
+
+@login_required
+def areas_containing_points(request):
+    """
+    Ids of the active areas containing each of a batch of points.
+
+    Takes `?lat=&lng=` for a single point, or a POSTed JSON body
+    `{"points": [[lat, lng], ...]}` of up to MAX_LOOKUP_POINTS points (with
+    the session's CSRF token in an X-CSRFToken header, like any session
+    POST), and returns `{"results": [[area ids], ...]}` in the order of
+    the points.
+    """
+    try:
+        if request.method == 'POST':
+            points = json.loads(request.body)['points']
+        else:
+            points = [[request.GET['lat'], request.GET['lng']]]
+        points = [(float(lat), float(lng)) for lat, lng in points]
+    except (KeyError, ValueError, TypeError):
+        return JsonResponse({'error': 'Expected lat and lng, or a JSON body {"points": [[lat, lng], ...]}'}, status=400)
+    if len(points) > containment.MAX_LOOKUP_POINTS:
+        return JsonResponse({'error': f'At most {containment.MAX_LOOKUP_POINTS} points per request'}, status=400)
+    if not all(-90 <= lat <= 90 and -180 <= lng <= 180 for lat, lng in points):
+        return JsonResponse({'error': 'lat/lng out of range'}, status=400)
+    return JsonResponse({'results': containment.areas_containing(points)})
+
+
+@login_required
+def vector_tile(request, z, x, y):
+    """Mapbox Vector Tile of active polluted areas"""
+    if z > tiles.tile_max_zoom() or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise Http404('Tile out of range')
+    return HttpResponse(tiles.get_tile(z, x, y), content_type='application/vnd.mapbox-vector-tile')
+
+
+@staff_member_required
+def export_areas(request):
+    """
+    Stream every matching area with its reports, for staff.
+
+    `format` is csv (default), geojsonseq or columnar; filters are `type`,
+    `min_severity`, `max_severity`, `since`, `until` and `include_inactive`
+    as in export.parse_filters().
+    """
+    output_format = request.GET.get('format', 'csv')
+    if output_format not in export.FORMATS:
+        return JsonResponse({'error': f"format must be one of {', '.join(export.FORMATS)}"}, status=400)
+    try:
+        filters = export.parse_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    areas = export.filter_areas(PollutedArea.objects.all(), **filters)
+    response = StreamingHttpResponse(export.export(areas, output_format), content_type=export.CONTENT_TYPES[output_format])
+    response['Content-Disposition'] = f'attachment; filename="polluted_areas.{export.EXTENSIONS[output_format]}"'
+    return response
+
+
+def _heatmap_types(request):
+    if not request.GET.get('pollution_type'):
+        return None
+    types = request.GET['pollution_type'].split(',')
+    if not set(types) <= {value for value, _ in PollutedArea.POLLUTION_TYPES}:
+        raise ValueError('Unknown pollution_type')
+    return types
+
+
+@login_required
+def heatmap_raster(request):
+    """
+    Severity-weighted density grid of the active areas over a bbox.
+
+    Takes `bbox`, `width` and `height` in pixels (default 256), the blur
+    `radius` in pixels and an optional comma separated `pollution_type`.
+    `format=bin` (default) returns height x width little-endian float32
+    values, rows north to south in Web Mercator; `format=png` a colored
+    RGBA image.
+    """
+    try:
+        bbox = parse_bbox(request.GET['bbox'])
+        width = int(request.GET.get('width') or 256)
+        height = int(request.GET.get('height') or 256)
+        radius = int(request.GET.get('radius') or heatmap.DEFAULT_BLUR_RADIUS)
+        types = _heatmap_types(request)
+    except KeyError:
+        return JsonResponse({'error': 'bbox is required'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not (0 < width <= heatmap.MAX_GRID_SIZE and 0 < height <= heatmap.MAX_GRID_SIZE):
+        return JsonResponse({'error': f'width and height must be between 1 and {heatmap.MAX_GRID_SIZE}'}, status=400)
+    if not 0 <= radius <= heatmap.MAX_BLUR_RADIUS:
+        return JsonResponse({'error': f'radius must be between 0 and {heatmap.MAX_BLUR_RADIUS}'}, status=400)
+    output_format = request.GET.get('format', 'bin')
+    if output_format not in ('bin', 'png'):
+        return JsonResponse({'error': 'format must be bin or png'}, status=400)
+    
+    min_lng, min_lat, max_lng, max_lat = bbox
+    bounds = (*mercator_xy(min_lng, max_lat), *mercator_xy(max_lng, min_lat))
+    if bounds[0] >= bounds[2] or bounds[1] >= bounds[3]:
+        return JsonResponse({'error': 'bbox must not be empty'}, status=400)
+    content = heatmap.render(bounds, width, height, radius, types, output_format)
+    if output_format == 'png':
+        return HttpResponse(content, content_type='image/png')
+    response = HttpResponse(content, content_type='application/octet-stream')
+    response['X-Grid-Width'] = width
+    response['X-Grid-Height'] = height
+    return response
+
+
+@login_required
+def heatmap_tile(request, z, x, y):
+    """256 px PNG heatmap tile, for use as a map tile layer"""
+    if z > tiles.tile_max_zoom() or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise Http404('Tile out of range')
+    try:
+        types = _heatmap_types(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    n = 2 ** z
+    content = heatmap.render((x / n, y / n, (x + 1) / n, (y + 1) / n), 256, 256, heatmap.DEFAULT_BLUR_RADIUS, types, 'png')
+    return HttpResponse(content, content_type='image/png')
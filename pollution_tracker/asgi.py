@@ -6,6 +6,9 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from core.asgi import DisconnectMiddleware
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pollution_tracker.settings')
 
-application = get_asgi_application()
+# Lets the endless live events streams end when their client disconnects
+application = DisconnectMiddleware(get_asgi_application())
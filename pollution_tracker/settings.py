@@ -33,10 +33,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.locale.LocaleMiddleware',
+    'core.middleware.SessionLocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -46,6 +47,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'pollution_tracker.urls'
 
+# Without explicit 'loaders', Django wraps the filesystem and app loaders in
+# the cached loader, so templates are parsed once per process
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -58,7 +61,6 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.i18n',
-                'core.context_processors.language_processor',
             ],
         },
     },
@@ -119,6 +121,18 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Caches
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tiles': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'tile_cache',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -134,3 +148,62 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # Map Configuration
 DEFAULT_MAP_CENTER = (40.7128, -74.0060)  # New York City
 DEFAULT_MAP_ZOOM = 10
+
+# Areas are returned as server-side clusters at or below this zoom level
+MAP_CLUSTER_MAX_ZOOM = 12
+
+# Vector tiles are served up to this zoom and cached in the 'tiles' cache
+MAP_TILE_MAX_ZOOM = 16
+MAP_TILE_CACHE = 'tiles'
+MAP_TILE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Areas API responses and heatmaps are cached per data version in this cache. The
+# version is kept in the database, so a per-process cache never serves stale data
+MAP_API_CACHE = 'default'
+MAP_API_CACHE_TIMEOUT = 60 * 60
+
+# Resized photo derivatives, generated by this many background threads
+MAP_IMAGE_QUALITY = 80
+MAP_IMAGE_WORKERS = 2
+
+# Point-in-polygon lookups match point-only areas within this many meters,
+# and pick up changes from other processes at least this often (seconds)
+MAP_CONTAINMENT_POINT_RADIUS = 50.0
+MAP_CONTAINMENT_REFRESH = 30
+
+# Heatmap density (severity units per pixel) shown at ~63% intensity
+MAP_HEATMAP_SCALE = 0.05
+
+# Full-text search: 'auto' uses SQLite FTS5 when available, 'inverted' the built-in index
+MAP_SEARCH_BACKEND = 'auto'
+
+# Live map events (maps.events): the broker fanning them out, in-process by
+# default, and the seconds between heartbeats on idle streams
+MAP_EVENT_BROKER = 'maps.events.LocalBroker'
+MAP_EVENTS_HEARTBEAT = 20
+
+# Request instrumentation (core.middleware): Server-Timing headers and a
+# `core.performance` log line per request, plus cProfile profiles of a
+# sample of the slow requests when PERFORMANCE_PROFILE_DIR is set
+PERFORMANCE_INSTRUMENTATION = config('PERFORMANCE_INSTRUMENTATION', default=False, cast=bool)
+PERFORMANCE_SLOW_REQUEST_MS = 500
+PERFORMANCE_DUPLICATE_THRESHOLD = 5
+PERFORMANCE_PROFILE_DIR = config('PERFORMANCE_PROFILE_DIR', default=None)
+PERFORMANCE_PROFILE_SAMPLE_RATE = config('PERFORMANCE_PROFILE_SAMPLE_RATE', default=0.05, cast=float)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.performance': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}